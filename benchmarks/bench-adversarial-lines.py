@@ -0,0 +1,142 @@
+#! /usr/bin/env python
+# # -*- coding: utf-8 -*
+
+"""
+bench-adversarial-lines
+
+This module times the keyword matchers used by the clean and smudge
+filters on long lines built to make backtracking regular expressions
+explode, such as a keyword name followed by thousands of spaces or |
+characters without a closing $.  The benchmark fails with a non-zero
+exit status if any line takes longer than the time budget.
+
+Usage: bench-adversarial-lines.py [line length] [budget seconds]
+"""
+
+import sys
+import os
+
+__author__ = "David Rotthoff"
+__email__ = "drotthoff@gmail.com"
+__project__ = "git-rcs-keywords"
+__version__ = "1.1.1-19"
+__date__ = "2021-02-07 10:51:24"
+__credits__ = []
+__status__ = "Production"
+
+# Conditionally map a time function for performance measurement
+# depending on the version of Python used
+if sys.version_info.major >= 3 and sys.version_info.minor >= 3:
+    from time import perf_counter as get_clock
+else:
+    from time import clock as get_clock
+
+PROGRAM_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROGRAM_PATH)
+
+import rcs_keywords  # noqa: E402
+
+# The matchers of both filters, see the filter programs
+MATCHERS = [
+    ('smudge author', rcs_keywords.KeywordMatcher(name='Author',
+                                                  form='run',
+                                                  value_class=r'.\w@<> ')),
+    ('clean author', rcs_keywords.KeywordMatcher(name='Author',
+                                                 form='any',
+                                                 collapsed=False)),
+    ('id', rcs_keywords.KeywordMatcher(name='Id',
+                                       form='id',
+                                       value_class=r'-:\d ')),
+    ('date', rcs_keywords.KeywordMatcher(name='Date',
+                                         form='run',
+                                         value_class=r'-:\d ')),
+    ('source', rcs_keywords.KeywordMatcher(name='Source', form='path')),
+    ('file', rcs_keywords.KeywordMatcher(name='File', form='path')),
+    ('revision', rcs_keywords.KeywordMatcher(name='Revision',
+                                             form='run',
+                                             value_class=r'-:\d+ ')),
+    ('rev', rcs_keywords.KeywordMatcher(name='Rev',
+                                        form='run',
+                                        value_class=r'-:\d+ ')),
+    ('hash', rcs_keywords.KeywordMatcher(name='Hash', form='word'))
+]
+
+# Repeated fragments of the adversarial lines, most of them look like the
+# start of an expanded keyword which is never closed
+FRAGMENTS = [
+    ('spaces', '$%s: ', ' '),
+    ('pipes', '$%s: a', ' | 0 | a'),
+    ('dots', '$%s: ', '.'),
+    ('words', '$%s: ', 'a b '),
+    ('repeated names', '', '$%s: a. | 1 | '),
+    ('minified json', '{"v":"$%s:', '{"k":"a b","n":[1, 2, 3]},'),
+    ('sql insert', 'INSERT INTO t VALUES ($%s: ', "(1, 'a | b', 2.5), "),
+    ('dollars', '$%s: ', ' $ ')
+]
+
+
+def build_line(name, prefix, fragment, length):
+    """Build an adversarial line for a keyword
+
+    Arguments:
+        name -- The keyword name
+        prefix -- The start of the line
+        fragment -- The text repeated up to the line length
+        length -- The approximate line length
+
+    Returns:
+        The line including the newline
+    """
+    prefix = prefix.replace('%s', name)
+    fragment = fragment.replace('%s', name)
+    count = max(1, (length - len(prefix)) // len(fragment))
+    return prefix + fragment * count + '\n'
+
+
+def benchmark():
+    """Main program.
+
+    Arguments:
+        argv: command line arguments
+
+    Returns:
+        Nothing
+    """
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 0.25
+
+    failures = 0
+    slowest = 0.0
+    for (matcher_name, matcher) in MATCHERS:
+        name = matcher.name
+        for (fragment_name, prefix, fragment) in FRAGMENTS:
+            line = build_line(name=name,
+                              prefix=prefix,
+                              fragment=fragment,
+                              length=length)
+            start_time = get_clock()
+            matcher.sub('$%s$' % name, line)
+            elapsed = get_clock() - start_time
+            slowest = max(slowest, elapsed)
+            status = 'ok'
+            if elapsed > budget:
+                status = 'OVER BUDGET'
+                failures += 1
+            print('%-14s %-15s chars=%-8d time=%8.4fs %s'
+                  % (matcher_name,
+                     fragment_name,
+                     len(line),
+                     elapsed,
+                     status))
+
+    print('slowest=%.4fs budget=%.4fs failures=%d'
+          % (slowest,
+             budget,
+             failures))
+    if failures:
+        sys.exit(1)
+
+
+# Execute the main function
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,159 @@
+#! /usr/bin/env python
+# # -*- coding: utf-8 -*
+
+"""
+bench-candidate-scan
+
+This module compares the line by line smudge of a buffer with the
+NumPy scan which only hands the lines that may hold keywords to the
+keyword matchers.  Both results are checked to be identical.  Without
+NumPy only the line by line smudge is timed.
+
+Usage: bench-candidate-scan.py [size in MB] [lines per keyword]
+"""
+
+import sys
+import os
+import io
+
+__author__ = "David Rotthoff"
+__email__ = "drotthoff@gmail.com"
+__project__ = "git-rcs-keywords"
+__version__ = "1.1.1-19"
+__date__ = "2021-02-07 10:51:24"
+__credits__ = []
+__status__ = "Production"
+
+# Conditionally map a time function for performance measurement
+# depending on the version of Python used
+if sys.version_info.major >= 3 and sys.version_info.minor >= 3:
+    from time import perf_counter as get_clock
+else:
+    from time import clock as get_clock
+
+PROGRAM_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROGRAM_PATH)
+
+import rcs_keywords  # noqa: E402
+
+CODEC = ('utf-8', 'strict')
+
+# Substitution values of every keyword so that git is never called
+REGEX_DICT = dict((key, '$%s: bench value $' % key)
+                  for key in rcs_keywords.KEYWORD_KEYS)
+
+LINES = [
+    'plain text line without any markers at all, just filler %d\n',
+    'price = "$%d" in a string with one dollar\n',
+    'shell: echo $HOME $PATH %d\n',
+    'utf-8 text éèê line %d\n'
+]
+KEYWORD_LINE = '# $Author$ $Hash$ line %d\n'
+
+
+def build_buffer(size, keyword_interval):
+    """Build the benchmark buffer
+
+    Arguments:
+        size -- The approximate buffer size in bytes
+        keyword_interval -- Number of lines between keyword lines
+
+    Returns:
+        The encoded buffer
+    """
+    lines = []
+    byte_count = 0
+    line_number = 0
+    while byte_count < size:
+        if line_number % keyword_interval == 0:
+            line = KEYWORD_LINE % line_number
+        else:
+            line = LINES[line_number % len(LINES)] % line_number
+        lines.append(line)
+        byte_count += len(line)
+        line_number += 1
+    return ''.join(lines).encode(CODEC[0])
+
+
+def smudge_lines(data, matchers):
+    """Smudge a buffer line by line the way the smudge filter does
+    without NumPy
+
+    Arguments:
+        data -- The buffer to smudge
+        matchers -- The keyword matchers
+
+    Returns:
+        A (output, spans) tuple
+    """
+    regex_dict = REGEX_DICT
+    output = []
+    spans = []
+    byte_count = 0
+    source = rcs_keywords.text_stream(io.BytesIO(data),
+                                      encoding=CODEC[0],
+                                      errors=CODEC[1])
+    for line in source:
+        (line, regex_dict, line_spans) = rcs_keywords.smudge_line(
+            line=line,
+            regex_dict=regex_dict,
+            matchers=matchers,
+            file_name='bench.txt')
+        encoded = line.encode(CODEC[0])
+        spans.extend(rcs_keywords.keyword_byte_spans(
+            line=line,
+            encoded=encoded,
+            spans=line_spans,
+            byte_count=byte_count,
+            encoding=CODEC[0]))
+        output.append(encoded)
+        byte_count += len(encoded)
+    return (b''.join(output), spans)
+
+
+def benchmark():
+    """Main program.
+
+    Arguments:
+        argv: command line arguments
+
+    Returns:
+        Nothing
+    """
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 \
+        else 32 * 1024 * 1024
+    keyword_interval = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    data = build_buffer(size=size, keyword_interval=keyword_interval)
+    matchers = rcs_keywords.smudge_matchers()
+
+    start_time = get_clock()
+    (line_output, line_spans) = smudge_lines(data=data, matchers=matchers)
+    line_time = get_clock() - start_time
+    print('size=%.1fMB keyword_every=%d lines' % (len(data) / 1048576.0,
+                                                  keyword_interval))
+    print('line by line  time=%8.3fs' % line_time)
+
+    if rcs_keywords.load_numpy() is None:
+        print('NumPy is not installed - candidate scan not available')
+        return
+
+    start_time = get_clock()
+    (scan_output, _, scan_spans, _) = rcs_keywords.smudge_buffer(
+        data=data,
+        regex_dict=REGEX_DICT,
+        matchers=matchers,
+        file_name='bench.txt',
+        codec=CODEC)
+    scan_time = get_clock() - start_time
+    print('numpy scan    time=%8.3fs speedup=%.1fx' % (scan_time,
+                                                       line_time / scan_time))
+
+    if scan_output != line_output or scan_spans != line_spans:
+        print('Results differ')
+        sys.exit(1)
+
+
+# Execute the main function
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+# # -*- coding: utf-8 -*
+
+"""
+bench-clean-cache
+
+This module compares the time the clean filter takes to scan a file
+with the time taken to look up and to store its result in the clean
+cache, for several file sizes and keyword densities.  The cache only
+pays off when the scan takes longer than the lookup, which sets
+CLEAN_CACHE_MIN_FILE.
+
+Usage: bench-clean-cache.py [repeat count]
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+
+__author__ = "David Rotthoff"
+__email__ = "drotthoff@gmail.com"
+__project__ = "git-rcs-keywords"
+__version__ = "1.1.1-19"
+__date__ = "2021-02-07 10:51:24"
+__credits__ = []
+__status__ = "Production"
+
+# Conditionally map a time function for performance measurement
+# depending on the version of Python used
+if sys.version_info.major >= 3 and sys.version_info.minor >= 3:
+    from time import perf_counter as get_clock
+else:
+    from time import clock as get_clock
+
+PROGRAM_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROGRAM_PATH)
+
+import rcs_keywords  # noqa: E402
+
+CODEC = ('utf-8', 'strict')
+
+SIZES = [4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024]
+KEYWORD_INTERVALS = [1, 20]
+
+KEYWORD_LINE = '# $Author:   Dev One <dev@example.com> $ ' \
+               '$Hash:     0123456789abcdef $ line %d\n'
+PLAIN_LINE = 'plain text line without any markers at all, just filler %d\n'
+
+
+def build_buffer(size, keyword_interval):
+    """Build the benchmark file contents
+
+    Arguments:
+        size -- The approximate size in bytes
+        keyword_interval -- Number of lines between keyword lines
+
+    Returns:
+        The encoded contents
+    """
+    lines = []
+    byte_count = 0
+    line_number = 0
+    while byte_count < size:
+        if line_number % keyword_interval == 0:
+            line = KEYWORD_LINE % line_number
+        else:
+            line = PLAIN_LINE % line_number
+        lines.append(line)
+        byte_count += len(line)
+        line_number += 1
+    return ''.join(lines).encode(CODEC[0])
+
+
+def best_time(function, repeat):
+    """Time a function, keeping the fastest run
+
+    Arguments:
+        function -- The function to call without arguments
+        repeat -- Number of runs
+
+    Returns:
+        The fastest run time in seconds
+    """
+    best = None
+    for _ in range(repeat):
+        start_time = get_clock()
+        function()
+        elapsed = get_clock() - start_time
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def benchmark():
+    """Main program.
+
+    Arguments:
+        argv: command line arguments
+
+    Returns:
+        Nothing
+    """
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    matchers = rcs_keywords.clean_matchers()
+
+    git_dir = tempfile.mkdtemp(prefix='bench-clean-cache-')
+    try:
+        file_name = os.path.join(git_dir, 'bench.txt')
+        print('%8s %6s %10s %10s %10s' % ('size', 'every', 'scan ms',
+                                          'store ms', 'hit ms'))
+        for size in SIZES:
+            for keyword_interval in KEYWORD_INTERVALS:
+                data = build_buffer(size=size,
+                                    keyword_interval=keyword_interval)
+                with open(file_name, 'wb') as bench_file:
+                    bench_file.write(data)
+                file_stat = os.stat(file_name)
+
+                def scan():
+                    return rcs_keywords.clean_data(data=data,
+                                                   matchers=matchers,
+                                                   input_codec=CODEC,
+                                                   output_codec=CODEC)[0]
+                output = scan()
+
+                def store():
+                    rcs_keywords.write_clean_cache(git_dir=git_dir,
+                                                   file_name='bench.txt',
+                                                   file_stat=file_stat,
+                                                   data=data,
+                                                   output=output)
+
+                def lookup():
+                    return rcs_keywords.read_clean_cache(
+                        git_dir=git_dir,
+                        file_name='bench.txt',
+                        file_stat=file_stat,
+                        data=data)
+
+                scan_time = best_time(scan, repeat)
+                store_time = best_time(store, repeat)
+                hit_time = best_time(lookup, repeat)
+                if lookup() != output:
+                    print('Cached result differs')
+                    sys.exit(1)
+                print('%8d %6d %10.2f %10.2f %10.2f' % (
+                    len(data), keyword_interval, scan_time * 1000,
+                    store_time * 1000, hit_time * 1000))
+    finally:
+        shutil.rmtree(git_dir)
+
+
+# Execute the main function
+if __name__ == '__main__':
+    benchmark()
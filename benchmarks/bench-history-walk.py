@@ -0,0 +1,253 @@
+#! /usr/bin/env python
+# # -*- coding: utf-8 -*
+
+"""
+bench-history-walk
+
+This module generates a long history with merges spread over many
+directories, half of which only change at its start, and looks up the
+commit information of every file, first with a single walk of the
+history and then with 2 to N git processes listing the changed files of
+ranges of the commits in parallel.  Every parallel result must match the
+single walk, and a sample of files is checked against git log.
+
+Usage: bench-history-walk.py [commits] [directories] [files per directory]
+       [max workers]
+"""
+
+import sys
+import os
+import random
+import shutil
+import tempfile
+import subprocess
+
+__author__ = "David Rotthoff"
+__email__ = "drotthoff@gmail.com"
+__project__ = "git-rcs-keywords"
+__version__ = "1.1.1-19"
+__date__ = "2021-02-07 10:51:24"
+__credits__ = []
+__status__ = "Production"
+
+# Conditionally map a time function for performance measurement
+# depending on the version of Python used
+if sys.version_info.major >= 3 and sys.version_info.minor >= 3:
+    from time import perf_counter as get_clock
+else:
+    from time import clock as get_clock
+
+PROGRAM_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROGRAM_PATH)
+
+import rcs_keywords  # noqa: E402
+
+# Commits between two merges of the side branch into the main branch
+MERGE_INTERVAL = 25
+FILES_PER_COMMIT = 4
+SAMPLE_FILES = 50
+
+
+def file_data(file_name, version):
+    """Build the content of a file version
+
+    Arguments:
+        file_name -- The path of the file
+        version -- The commit number which wrote the file
+
+    Returns:
+        The encoded content
+    """
+    return ('# $Id$\n# $Author$\n%s %d\n' % (file_name,
+                                             version)).encode('utf-8')
+
+
+def fast_import_commit(stream, branch, mark, date, parents, changes):
+    """Write a commit to the git fast-import stream
+
+    Arguments:
+        stream -- The fast-import standard input
+        branch -- The branch the commit is written to
+        mark -- The mark of the commit
+        date -- The commit time stamp
+        parents -- The marks of the parents
+        changes -- Dictionary of the new content of each changed file
+
+    Returns:
+        Nothing
+    """
+    stream.write(('commit refs/heads/%s\nmark :%d\n'
+                  'author Bench %d <bench%d@example.com> %d +0000\n'
+                  'committer Bench Mark <bench@example.com> %d +0000\n'
+                  'data 8\ncommit%02d\n'
+                  % (branch, mark, mark % 7, mark % 7, date, date,
+                     mark % 100)).encode('utf-8'))
+    for (number, parent) in enumerate(parents):
+        stream.write(('%s :%d\n' % ('from' if number == 0 else 'merge',
+                                    parent)).encode('utf-8'))
+    for (file_name, data) in sorted(changes.items()):
+        stream.write(('M 100644 inline %s\ndata %d\n'
+                      % (file_name, len(data))).encode('utf-8'))
+        stream.write(data + b'\n')
+    stream.write(b'\n')
+
+
+def build_repo(repo_dir, commit_count, directory_count, file_count):
+    """Create a repository whose main branch merges a side branch
+    regularly, both changing random files
+
+    Arguments:
+        repo_dir -- Directory to create the repository in
+        commit_count -- Number of commits
+        directory_count -- Number of directories
+        file_count -- Number of files per directory
+
+    Returns:
+        Nothing
+    """
+    os.makedirs(repo_dir)
+    subprocess.check_call(['git', 'init', '-q', repo_dir])
+    process = subprocess.Popen(['git', 'fast-import', '--quiet'],
+                               cwd=repo_dir,
+                               stdin=subprocess.PIPE)
+    generator = random.Random(commit_count)
+
+    # Nested directories of varying depth and a few top level files
+    directories = ['lib%02d/part%d' % (number // 3, number % 3)
+                   if number % 2 else 'dir%03d' % number
+                   for number in range(directory_count)]
+    files = ['%s/file%04d.txt' % (directory, number)
+             for directory in directories
+             for number in range(file_count)]
+    files += ['top%02d.txt' % number for number in range(10)]
+
+    # The files of half of the directories are only changed at the start
+    # of the history, so their walks have to go all the way back
+    hot_files = [file_name for file_name in files
+                 if file_name.startswith('lib')]
+
+    date = 1500000000
+    fast_import_commit(stream=process.stdin,
+                       branch='main',
+                       mark=1,
+                       date=date,
+                       parents=[],
+                       changes=dict((file_name, file_data(file_name, 1))
+                                    for file_name in files))
+    (main_mark, side_mark) = (1, 1)
+    side_changes = {}
+    for mark in range(2, commit_count + 1):
+        date += generator.randint(1, 600)
+        candidates = files if mark < commit_count // 10 else hot_files
+        changes = dict((file_name, file_data(file_name, mark))
+                       for file_name in generator.sample(candidates,
+                                                         FILES_PER_COMMIT))
+        if mark % MERGE_INTERVAL == 0:
+            # The merge takes the side branch version of its files
+            changes.update(side_changes)
+            fast_import_commit(stream=process.stdin,
+                               branch='main',
+                               mark=mark,
+                               date=date,
+                               parents=[main_mark, side_mark],
+                               changes=changes)
+            (main_mark, side_mark) = (mark, mark)
+            side_changes = {}
+        elif mark % 3 == 0:
+            fast_import_commit(stream=process.stdin,
+                               branch='side',
+                               mark=mark,
+                               date=date,
+                               parents=[side_mark],
+                               changes=changes)
+            side_mark = mark
+            side_changes.update(changes)
+        else:
+            fast_import_commit(stream=process.stdin,
+                               branch='main',
+                               mark=mark,
+                               date=date,
+                               parents=[main_mark],
+                               changes=changes)
+            main_mark = mark
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError('git fast-import failed')
+    subprocess.check_call(['git', 'symbolic-ref', 'HEAD', 'refs/heads/main'],
+                          cwd=repo_dir)
+
+
+def benchmark():
+    """Main program.
+
+    Arguments:
+        argv: command line arguments
+
+    Returns:
+        Nothing
+    """
+    commit_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    directory_count = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    file_count = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    max_workers = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+
+    work_dir = tempfile.mkdtemp(prefix='rcs-bench-')
+    current_dir = os.getcwd()
+    failures = 0
+    try:
+        repo_dir = os.path.join(work_dir, 'repo')
+        build_repo(repo_dir=repo_dir,
+                   commit_count=commit_count,
+                   directory_count=directory_count,
+                   file_count=file_count)
+        os.chdir(repo_dir)
+        files = subprocess.check_output(['git', 'ls-tree', '-r',
+                                         '--name-only', 'HEAD'])
+        files = files.decode('utf-8').splitlines()
+
+        start_time = get_clock()
+        serial_log = rcs_keywords.batch_git_log(file_names=files, workers=1)
+        serial_time = get_clock() - start_time
+
+        # A sample of files is looked up one by one with git log as the
+        # reference
+        rcs_keywords.OBJECT_READER = False
+        for file_name in random.Random(0).sample(files, SAMPLE_FILES):
+            git_log = rcs_keywords.git_log_attributes(
+                git_field_log=rcs_keywords.GIT_FIELD_LOG,
+                file_name=file_name,
+                git_field_name=rcs_keywords.GIT_FIELD_NAME)
+            if git_log[:1] != serial_log[file_name]:
+                print('Single walk differs from git log for %s' % file_name)
+                failures += 1
+        print('workers=1   commits=%d files=%d walk=%8.3fs'
+              % (commit_count, len(files), serial_time))
+
+        rcs_keywords.HISTORY_WALK_MIN_FILES = 0
+        for workers in range(2, max_workers + 1):
+            start_time = get_clock()
+            parallel_log = rcs_keywords.batch_git_log(file_names=files,
+                                                      workers=workers)
+            walk_time = get_clock() - start_time
+            state = 'ok'
+            if parallel_log != serial_log:
+                state = 'MISMATCH'
+                failures += 1
+            print('workers=%-3d commits=%d files=%d walk=%8.3fs '
+                  'speedup=%5.2fx %s' % (workers,
+                                         commit_count,
+                                         len(files),
+                                         walk_time,
+                                         serial_time / walk_time,
+                                         state))
+    finally:
+        os.chdir(current_dir)
+        shutil.rmtree(work_dir)
+
+    if failures:
+        sys.exit(1)
+
+
+# Execute the main function
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,230 @@
+#! /usr/bin/env python
+# # -*- coding: utf-8 -*
+
+"""
+bench-object-reader
+
+This module generates a history with merges, packs it with deltas and
+adds a few loose commits on top, then looks up the commit information of
+a sample of files three times: with one git log process per file, by
+reading the object database in process with a store opened for each file
+as the smudge filter does, and with a single store shared by all files as
+the hooks do.  The in process results must match git log, which is still
+run for the files last changed too far back in the history.
+
+Usage: bench-object-reader.py [commits] [files] [sample files]
+"""
+
+import sys
+import os
+import random
+import shutil
+import tempfile
+import subprocess
+
+__author__ = "David Rotthoff"
+__email__ = "drotthoff@gmail.com"
+__project__ = "git-rcs-keywords"
+__version__ = "1.1.1-19"
+__date__ = "2021-02-07 10:51:24"
+__credits__ = []
+__status__ = "Production"
+
+# Conditionally map a time function for performance measurement
+# depending on the version of Python used
+if sys.version_info.major >= 3 and sys.version_info.minor >= 3:
+    from time import perf_counter as get_clock
+else:
+    from time import clock as get_clock
+
+PROGRAM_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROGRAM_PATH)
+
+import rcs_keywords  # noqa: E402
+
+# Commits between two merges of the side branch into the main branch
+MERGE_INTERVAL = 20
+FILES_PER_COMMIT = 3
+LOOSE_COMMITS = 5
+
+
+def git(repo_dir, *args):
+    """Run a git command in the repository
+
+    Arguments:
+        repo_dir -- The repository directory
+        args -- The git arguments
+
+    Returns:
+        Nothing
+    """
+    subprocess.check_call(['git'] + list(args),
+                          cwd=repo_dir,
+                          stdout=subprocess.PIPE)
+
+
+def build_repo(repo_dir, commit_count, file_count):
+    """Create a repository whose main branch merges a side branch
+    regularly, pack it with deltas and commit a few loose objects
+
+    Arguments:
+        repo_dir -- Directory to create the repository in
+        commit_count -- Number of commits
+        file_count -- Number of files
+
+    Returns:
+        The list of the files
+    """
+    os.makedirs(repo_dir)
+    git(repo_dir, 'init', '-q')
+    files = ['dir%02d/file%04d.txt' % (number % 20, number)
+             for number in range(file_count)]
+    generator = random.Random(commit_count)
+    process = subprocess.Popen(['git', 'fast-import', '--quiet'],
+                               cwd=repo_dir,
+                               stdin=subprocess.PIPE)
+    (main_mark, side_mark) = (0, 0)
+    for mark in range(1, commit_count + 1):
+        if mark == 1:
+            changes = files
+        else:
+            changes = generator.sample(files, FILES_PER_COMMIT)
+        branch = 'side' if mark % 3 == 0 else 'main'
+        parents = [side_mark if branch == 'side' else main_mark]
+        if mark % MERGE_INTERVAL == 0:
+            (branch, parents) = ('main', [main_mark, side_mark])
+        process.stdin.write(('commit refs/heads/%s\nmark :%d\n'
+                             'author Bench %d <bench%d@example.com> '
+                             '%d +0100\n'
+                             'committer Bench Mark <bench@example.com> '
+                             '%d -0530\n'
+                             'data 8\ncommit%02d\n'
+                             % (branch, mark, mark % 5, mark % 5,
+                                1500000000 + mark * 60,
+                                1500000000 + mark * 60,
+                                mark % 100)).encode('utf-8'))
+        for (number, parent) in enumerate(parent for parent in parents
+                                          if parent):
+            process.stdin.write(('%s :%d\n' % ('from' if number == 0
+                                               else 'merge',
+                                               parent)).encode('utf-8'))
+        for file_name in sorted(changes):
+            data = ('# $Id$\n%s %d\n' % (file_name, mark)).encode('utf-8')
+            process.stdin.write(('M 100644 inline %s\ndata %d\n'
+                                 % (file_name, len(data))).encode('utf-8'))
+            process.stdin.write(data + b'\n')
+        process.stdin.write(b'\n')
+        if branch == 'side':
+            side_mark = mark
+        else:
+            main_mark = mark
+            if mark == 1:
+                side_mark = mark
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError('git fast-import failed')
+    git(repo_dir, 'symbolic-ref', 'HEAD', 'refs/heads/main')
+    git(repo_dir, 'repack', '-q', '-a', '-d', '-f', '--depth=50')
+    git(repo_dir, 'checkout', '-q', '-f', 'main')
+
+    # A few commits are left as loose objects
+    for number in range(LOOSE_COMMITS):
+        file_name = os.path.join(repo_dir, files[number])
+        with open(file_name, 'a') as loose_file:
+            loose_file.write('loose %d\n' % number)
+        git(repo_dir, '-c', 'user.name=Loose', '-c',
+            'user.email=loose@example.com', 'commit', '-q', '-a',
+            '-m', 'loose %d' % number)
+    return files
+
+
+def look_up(files, shared_store):
+    """Look up the commit information of files
+
+    Arguments:
+        files -- The paths of the files
+        shared_store -- False to open the object store for every file
+
+    Returns:
+        A (results, elapsed seconds) tuple
+    """
+    results = []
+    rcs_keywords.OBJECT_STORES.clear()
+    start_time = get_clock()
+    for file_name in files:
+        if not shared_store:
+            rcs_keywords.OBJECT_STORES.clear()
+        results.append(rcs_keywords.git_log_attributes(
+            git_field_log=rcs_keywords.GIT_FIELD_LOG,
+            file_name=file_name,
+            git_field_name=rcs_keywords.GIT_FIELD_NAME))
+    return (results, get_clock() - start_time)
+
+
+def benchmark():
+    """Main program.
+
+    Arguments:
+        argv: command line arguments
+
+    Returns:
+        Nothing
+    """
+    commit_count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    file_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    sample_count = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    work_dir = tempfile.mkdtemp(prefix='rcs-bench-')
+    current_dir = os.getcwd()
+    failures = 0
+    try:
+        repo_dir = os.path.join(work_dir, 'repo')
+        files = build_repo(repo_dir=repo_dir,
+                           commit_count=commit_count,
+                           file_count=file_count)
+        os.chdir(repo_dir)
+        sample = random.Random(0).sample(files, min(sample_count,
+                                                    len(files)))
+
+        rcs_keywords.OBJECT_READER = False
+        (expected, git_time) = look_up(files=sample, shared_store=True)
+        print('git log          files=%d %8.3fs' % (len(sample), git_time))
+
+        rcs_keywords.OBJECT_READER = True
+        object_git_log = rcs_keywords.object_git_log
+        for shared_store in (False, True):
+            fallbacks = [0]
+
+            def counted_git_log(**kwargs):
+                git_log = object_git_log(**kwargs)
+                fallbacks[0] += git_log is None
+                return git_log
+            rcs_keywords.object_git_log = counted_git_log
+            try:
+                (results, reader_time) = look_up(files=sample,
+                                                 shared_store=shared_store)
+            finally:
+                rcs_keywords.object_git_log = object_git_log
+            mismatches = sum(result != reference
+                             for (result, reference) in zip(results,
+                                                            expected))
+            failures += mismatches
+            print('%-16s files=%d %8.3fs speedup=%5.2fx git log=%d '
+                  'mismatches=%d' % ('shared store' if shared_store
+                                     else 'store per file',
+                                     len(sample),
+                                     reader_time,
+                                     git_time / reader_time,
+                                     fallbacks[0],
+                                     mismatches))
+    finally:
+        os.chdir(current_dir)
+        shutil.rmtree(work_dir)
+
+    if failures:
+        sys.exit(1)
+
+
+# Execute the main function
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,212 @@
+#! /usr/bin/env python
+# # -*- coding: utf-8 -*
+
+"""
+bench-parallel-checkout
+
+This module measures a branch checkout with 1 to N parallel checkout
+workers (checkout.workers) in a repository holding keyword files handled
+by the filters and plain files which are not.  Every checkout must produce
+the same working tree and leave git status clean.
+
+Usage: bench-parallel-checkout.py [max workers] [keyword files] [plain files]
+"""
+
+import sys
+import os
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+__author__ = "David Rotthoff"
+__email__ = "drotthoff@gmail.com"
+__project__ = "git-rcs-keywords"
+__version__ = "1.1.1-19"
+__date__ = "2021-02-07 10:51:24"
+__credits__ = []
+__status__ = "Production"
+
+# Conditionally map a time function for performance measurement
+# depending on the version of Python used
+if sys.version_info.major >= 3 and sys.version_info.minor >= 3:
+    from time import perf_counter as get_clock
+else:
+    from time import clock as get_clock
+
+PROGRAM_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+KEYWORD_TEMPLATE = '# $%s$\n# $%s$\n%s\n'
+PLAIN_SIZE = 64 * 1024
+
+
+def git(repo_dir, *args):
+    """Run a git command quietly in the benchmark repository
+
+    Arguments:
+        repo_dir -- The benchmark repository
+        args -- The git command arguments
+
+    Returns:
+        The command output
+    """
+    return subprocess.check_output(('git',) + args,
+                                   cwd=repo_dir,
+                                   stderr=subprocess.PIPE)
+
+
+def write_files(repo_dir, keyword_count, plain_count, version):
+    """Write the keyword and plain files of a branch
+
+    Arguments:
+        repo_dir -- The benchmark repository
+        keyword_count -- Number of files handled by the filters
+        plain_count -- Number of files not handled by the filters
+        version -- Text making the files differ between the branches
+
+    Returns:
+        Nothing
+    """
+    for file_number in range(keyword_count):
+        with open(os.path.join(repo_dir, 'file%05d.txt' % file_number),
+                  'w') as source:
+            source.write(KEYWORD_TEMPLATE % ('Author', 'Hash', version))
+    for file_number in range(plain_count):
+        seed = ('%s %d' % (version, file_number)).encode('utf-8')
+        block = hashlib.sha256(seed).hexdigest().encode('ascii') + b'\n'
+        with open(os.path.join(repo_dir, 'data%05d.dat' % file_number),
+                  'wb') as source:
+            source.write(block * (PLAIN_SIZE // len(block)))
+
+
+def build_repo(repo_dir, keyword_count, plain_count):
+    """Create a repository with two branches which differ in every file
+
+    Arguments:
+        repo_dir -- Directory to create the repository in
+        keyword_count -- Number of files handled by the filters
+        plain_count -- Number of files not handled by the filters
+
+    Returns:
+        Nothing
+    """
+    os.makedirs(repo_dir)
+    git(repo_dir, 'init', '-q')
+    git(repo_dir, 'config', 'user.name', 'Bench Mark')
+    git(repo_dir, 'config', 'user.email', 'bench@example.com')
+    subprocess.check_call([sys.executable,
+                           os.path.join(PROGRAM_PATH, 'install.py'),
+                           repo_dir],
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE)
+
+    write_files(repo_dir=repo_dir,
+                keyword_count=keyword_count,
+                plain_count=plain_count,
+                version='base')
+    git(repo_dir, 'add', '.')
+    git(repo_dir, 'commit', '-q', '-m', 'base')
+    git(repo_dir, 'branch', 'base')
+    git(repo_dir, 'checkout', '-q', '-b', 'work')
+
+    write_files(repo_dir=repo_dir,
+                keyword_count=keyword_count,
+                plain_count=plain_count,
+                version='work')
+    git(repo_dir, 'commit', '-q', '-a', '-m', 'change')
+    git(repo_dir, 'checkout', '-q', 'base')
+
+
+def tree_digest(repo_dir):
+    """Hash the contents of every working tree file
+
+    Arguments:
+        repo_dir -- The benchmark repository
+
+    Returns:
+        The hex digest
+    """
+    digest = hashlib.sha1()
+    for file_name in sorted(os.listdir(repo_dir)):
+        path_name = os.path.join(repo_dir, file_name)
+        if os.path.isfile(path_name):
+            digest.update(file_name.encode('utf-8') + b'\0')
+            with open(path_name, 'rb') as source:
+                digest.update(source.read())
+    return digest.hexdigest()
+
+
+def time_checkout(repo_dir, workers):
+    """Switch branches with a number of parallel checkout workers
+
+    Arguments:
+        repo_dir -- The benchmark repository
+        workers -- Number of checkout workers
+
+    Returns:
+        A (checkout seconds, tree digest, status output) tuple
+    """
+    git(repo_dir, 'config', 'checkout.workers', str(workers))
+    git(repo_dir, 'config', 'checkout.thresholdForParallelism', '1')
+
+    start_time = get_clock()
+    git(repo_dir, 'checkout', '-q', 'work')
+    checkout_time = get_clock() - start_time
+
+    digest = tree_digest(repo_dir=repo_dir)
+    status = git(repo_dir, 'status', '--porcelain')
+    git(repo_dir, 'checkout', '-q', 'base')
+    return (checkout_time, digest, status)
+
+
+def benchmark():
+    """Main program.
+
+    Arguments:
+        argv: command line arguments
+
+    Returns:
+        Nothing
+    """
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    keyword_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    plain_count = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+
+    work_dir = tempfile.mkdtemp(prefix='rcs-bench-')
+    failures = 0
+    try:
+        repo_dir = os.path.join(work_dir, 'repo')
+        build_repo(repo_dir=repo_dir,
+                   keyword_count=keyword_count,
+                   plain_count=plain_count)
+
+        serial_time = None
+        serial_digest = None
+        for workers in range(1, max_workers + 1):
+            (checkout_time, digest, status) = time_checkout(
+                repo_dir=repo_dir,
+                workers=workers)
+            if serial_time is None:
+                (serial_time, serial_digest) = (checkout_time, digest)
+            state = 'ok'
+            if digest != serial_digest or status:
+                state = 'MISMATCH'
+                failures += 1
+            print('workers=%-3d keyword_files=%d plain_files=%d '
+                  'checkout=%8.3fs speedup=%5.2fx %s' % (workers,
+                                                         keyword_count,
+                                                         plain_count,
+                                                         checkout_time,
+                                                         serial_time /
+                                                         checkout_time,
+                                                         state))
+    finally:
+        shutil.rmtree(work_dir)
+
+    if failures:
+        sys.exit(1)
+
+
+# Execute the main function
+if __name__ == '__main__':
+    benchmark()
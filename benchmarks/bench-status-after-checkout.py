@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+# # -*- coding: utf-8 -*
+
+"""
+bench-status-after-checkout
+
+This module measures the latency of git status immediately after a
+branch checkout that forces the post-checkout hook to re-expand a
+large number of files.  The measurement is taken with and without the
+batched index refresh performed by the hooks.
+
+Usage: bench-status-after-checkout.py [file count]
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import subprocess
+
+__author__ = "David Rotthoff"
+__email__ = "drotthoff@gmail.com"
+__project__ = "git-rcs-keywords"
+__version__ = "1.1.1-19"
+__date__ = "2021-02-07 10:51:24"
+__credits__ = []
+__status__ = "Production"
+
+# Conditionally map a time function for performance measurement
+# depending on the version of Python used
+if sys.version_info.major >= 3 and sys.version_info.minor >= 3:
+    from time import perf_counter as get_clock
+else:
+    from time import clock as get_clock
+
+PROGRAM_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FILE_TEMPLATE = '# $%s$\n# $%s$\n%s\n'
+
+
+def git(repo_dir, *args):
+    """Run a git command quietly in the benchmark repository
+
+    Arguments:
+        repo_dir -- The benchmark repository
+        args -- The git command arguments
+
+    Returns:
+        Nothing
+    """
+    subprocess.check_call(('git',) + args,
+                          cwd=repo_dir,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE)
+
+
+def build_repo(repo_dir, file_count, refresh_index):
+    """Create a repository with two branches which differ in the last
+    commit of every keyword file.
+
+    Arguments:
+        repo_dir -- Directory to create the repository in
+        file_count -- Number of keyword files to create
+        refresh_index -- Enable the hooks' batched index refresh
+
+    Returns:
+        Nothing
+    """
+    os.makedirs(repo_dir)
+    git(repo_dir, 'init', '-q')
+    git(repo_dir, 'config', 'user.name', 'Bench Mark')
+    git(repo_dir, 'config', 'user.email', 'bench@example.com')
+    subprocess.check_call([sys.executable,
+                           os.path.join(PROGRAM_PATH, 'install.py'),
+                           repo_dir],
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE)
+
+    # Toggle the batched index refresh in the installed module copy
+    if not refresh_index:
+        module_name = os.path.join(repo_dir, '.git', 'hooks',
+                                   'rcs_keywords.py')
+        with open(module_name, 'r') as module:
+            source = module.read()
+        with open(module_name, 'w') as module:
+            module.write(source.replace('REFRESH_INDEX = True',
+                                        'REFRESH_INDEX = False'))
+
+    for file_number in range(file_count):
+        with open(os.path.join(repo_dir, 'file%05d.txt' % file_number),
+                  'w') as source:
+            source.write(FILE_TEMPLATE % ('Author', 'Hash', 'base'))
+    git(repo_dir, 'add', '.')
+    git(repo_dir, 'commit', '-q', '-m', 'base')
+    git(repo_dir, 'branch', 'base')
+    git(repo_dir, 'checkout', '-q', '-b', 'work')
+
+    for file_number in range(file_count):
+        with open(os.path.join(repo_dir, 'file%05d.txt' % file_number),
+                  'a') as source:
+            source.write('change\n')
+    git(repo_dir, 'commit', '-q', '-a', '-m', 'change')
+
+    # Leave the working tree on the base branch with keywords expanded
+    git(repo_dir, 'checkout', '-q', 'base')
+
+
+def time_status(repo_dir):
+    """Switch branches and time the first git status afterwards
+
+    Arguments:
+        repo_dir -- The benchmark repository
+
+    Returns:
+        A (checkout seconds, status seconds) tuple
+    """
+    start_time = get_clock()
+    git(repo_dir, 'checkout', '-q', 'work')
+    checkout_time = get_clock() - start_time
+
+    start_time = get_clock()
+    git(repo_dir, 'status', '--porcelain')
+    status_time = get_clock() - start_time
+    return (checkout_time, status_time)
+
+
+def benchmark():
+    """Main program.
+
+    Arguments:
+        argv: command line arguments
+
+    Returns:
+        Nothing
+    """
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    work_dir = tempfile.mkdtemp(prefix='rcs-bench-')
+    try:
+        for refresh_index in (False, True):
+            repo_dir = os.path.join(work_dir, 'refresh-%s' % refresh_index)
+            build_repo(repo_dir=repo_dir,
+                       file_count=file_count,
+                       refresh_index=refresh_index)
+            (checkout_time, status_time) = time_status(repo_dir=repo_dir)
+            print('files=%d index_refresh=%-5s checkout=%8.3fs '
+                  'status=%8.3fs' % (file_count,
+                                     refresh_index,
+                                     checkout_time,
+                                     status_time))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+# Execute the main function
+if __name__ == '__main__':
+    benchmark()
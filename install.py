@@ -41,6 +41,9 @@ GIT_FILTERS = [{'filter_type': 'clean',
                {'filter_type': 'smudge',
                 'filter_name': 'rcs-filter-smudge.py'}]
 
+GIT_MODULES = ['rcs_filter.py', 'rcs_keywords.py', 'rcs_hooks.py',
+               'rcs-keywords-daemon.py', 'rcs-keywords-refresh.py']
+
 GIT_FILE_PATTERN = ['*.sql', '*.ora', '*.txt', '*.md', '*.yml',
                     '*.yaml', '*.hosts', '*.xml', '*.jsn',
                     '*.json', '*.pl', '*.py', '*.sh']
@@ -336,6 +339,11 @@ def install_git_keywords(repo_dir, git_dir='.git'):
                           hook_name=git_hook['hook_name'],
                           hook_code=git_hook['hook_code'])
 
+    # Copy the modules shared by the hooks and filters next to them
+    for module_name in GIT_MODULES:
+        copy_file(src_file=os.path.join(PROGRAM_PATH, module_name),
+                  dest_file=os.path.join(hooks_dir, module_name))
+
     # Set up the filter programs for use
     for filter_def in GIT_FILTERS:
         copy_file(src_file=os.path.join(PROGRAM_PATH,
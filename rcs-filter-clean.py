@@ -10,9 +10,12 @@ back to the repository.
 """
 
 import sys
-import re
+import os
+import io
 import logging
 
+import rcs_filter
+
 __author__ = "David Rotthoff"
 __email__ = "drotthoff@gmail.com"
 __project__ = "git-rcs-keywords"
@@ -27,8 +30,10 @@ __status__ = "Production"
 # LOGGING_CONSOLE_LEVEL = logging.WARNING
 LOGGING_CONSOLE_LEVEL = logging.ERROR
 # LOGGING_CONSOLE_LEVEL = logging.CRITICAL
+# The process id tells apart the records of filters run at the same time
 LOGGING_CONSOLE_MSG_FORMAT = \
-    '%(asctime)s:%(levelname)s:%(module)s:%(funcName)s:%(lineno)s: %(message)s'
+    '%(asctime)s:%(levelname)s:%(process)d:%(module)s:%(funcName)s:' \
+    '%(lineno)s: %(message)s'
 LOGGING_CONSOLE_DATE_FORMAT = '%Y-%m-%d %H.%M.%S'
 
 LOGGING_FILE_LEVEL = None
@@ -63,13 +68,15 @@ def configure_logging():
         )
         console.setFormatter(console_formatter)
 
-    # Create an file based logger if a LOGGING_FILE_LEVEL is defined
+    # Create an file based logger if a LOGGING_FILE_LEVEL is defined.  The
+    # log is shared with the other filters and hooks, so each record is
+    # appended with a single write.
     if LOGGING_FILE_LEVEL:
         logging.basicConfig(
             level=LOGGING_FILE_LEVEL,
             format=LOGGING_FILE_MSG_FORMAT,
             datefmt=LOGGING_FILE_DATE_FORMAT,
-            filename=LOGGING_FILE_NAME,
+            stream=rcs_filter.AppendLog(LOGGING_FILE_NAME),
         )
 
     # Basic logger configuration
@@ -80,6 +87,190 @@ def configure_logging():
             logger.addHandler(console)
 
 
+def read_clean_cache(file_name):
+    """Look up the clean result cache for the file being cleaned.
+
+    Arguments:
+        file_name -- The working tree file being cleaned
+
+    Returns:
+        A (source, cache_state) tuple.  The source is None if the cached
+        result was written to stdout, otherwise it holds the lines to be
+        cleaned.  The cache_state is needed to store the result and is
+        None if the file can not be cached.  Its stat result is None if
+        the file is too small to be worth caching.
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_name: %s', file_name)
+
+    git_dir = None
+    file_stat = None
+    if len(sys.argv) > 1:
+        git_dir = rcs_filter.find_git_dir()
+        try:
+            file_stat = os.stat(file_name)
+        except OSError:
+            logging.info('Unable to stat file %s', file_name)
+    if git_dir is None or file_stat is None or \
+            file_stat.st_size > rcs_filter.CLEAN_CACHE_MAX_FILE:
+        end_time = get_clock()
+        logging.info('File %s is not cached', file_name)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return (sys.stdin, None)
+
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    data = stdin.read()
+    output = None
+    if file_stat.st_size < rcs_filter.CLEAN_CACHE_MIN_FILE:
+        logging.info('File %s is too small to be cached', file_name)
+        file_stat = None
+    else:
+        try:
+            output = rcs_filter.read_clean_cache(git_dir=git_dir,
+                                                 file_name=file_name,
+                                                 file_stat=file_stat,
+                                                 data=data)
+        except (IOError, OSError):
+            logging.info('Unable to read the clean cache for file %s',
+                         file_name,
+                         exc_info=True)
+    if output is not None:
+        sys.stdout.flush()
+        getattr(sys.stdout, 'buffer', sys.stdout).write(output)
+        end_time = get_clock()
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return (None, None)
+
+    # Decode the contents the same way reading sys.stdin would have
+    source = rcs_filter.text_stream(io.BytesIO(data))
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return (source, (git_dir, file_stat, data))
+
+
+def clean_with_daemon(file_name, cache_state):
+    """Hand the contents to the keyword service when it is running.
+
+    Arguments:
+        file_name -- The working tree file being cleaned
+        cache_state -- The cache state returned by read_clean_cache
+
+    Returns:
+        A (output, keywords_found) tuple holding the encoded output, or
+        None if the caller must clean the contents
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_name: %s', file_name)
+
+    reply = rcs_filter.daemon_request(
+        command='clean',
+        header={'input_codec': [sys.stdin.encoding, sys.stdin.errors],
+                'output_codec': [sys.stdout.encoding, sys.stdout.errors]},
+        payload=cache_state[2])
+    if reply is None:
+        end_time = get_clock()
+        logging.info('File %s is not cleaned by the keyword service',
+                     file_name)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return None
+    (header, output) = reply
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return (output, header['keywords_found'])
+
+
+def write_clean_cache(file_name, cache_state, output):
+    """Save the clean result of the file in the clean result cache.
+
+    Arguments:
+        file_name -- The working tree file being cleaned
+        cache_state -- The cache state returned by read_clean_cache
+        output -- The encoded cleaned contents
+
+    Returns:
+        Nothing
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_name: %s', file_name)
+
+    (git_dir, file_stat, data) = cache_state
+    if file_stat is None:
+        end_time = get_clock()
+        logging.info('File %s is not cached', file_name)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return
+
+    # The cache is an optimization only so a failure to update it must
+    # never fail the clean itself
+    try:
+        rcs_filter.write_clean_cache(
+            git_dir=git_dir,
+            file_name=file_name,
+            file_stat=file_stat,
+            data=data,
+            output=output)
+    except (IOError, OSError):
+        logging.info('Unable to update the clean cache for file %s',
+                     file_name,
+                     exc_info=True)
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+def record_keyword_presence(file_name, present, cache_state):
+    """Record whether the cleaned file holds keywords.
+
+    Arguments:
+        file_name -- The working tree file being cleaned
+        present -- True if the file holds at least one keyword
+        cache_state -- The cache state returned by read_clean_cache
+
+    Returns:
+        Nothing
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_name: %s', file_name)
+    logging.debug('present: %s', present)
+
+    if len(sys.argv) < 2:
+        logging.debug('No file name supplied - presence not recorded')
+        return
+
+    # The presence record is an optimization only so a failure to update
+    # it must never fail the clean itself
+    try:
+        if cache_state:
+            git_dir = cache_state[0]
+        else:
+            git_dir = rcs_filter.find_git_dir()
+        if git_dir is not None:
+            rcs_filter.write_keyword_presence(git_dir=git_dir,
+                                              file_name=file_name,
+                                              present=present)
+    except (IOError, OSError):
+        logging.info('Unable to record keyword presence for file %s',
+                     file_name,
+                     exc_info=True)
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+
 def clean():
     """Main program.
 
@@ -103,49 +294,44 @@ def clean():
         file_name = '<Unknown file>'
     logging.info('Processing file: %s', file_name)
 
-    # Define the various substitution regular expressions
-    author_regex = re.compile(r"\$Author:.*\$",
-                              re.IGNORECASE)
-    id_regex = re.compile(r"\$Id: +.+ \| [-:\d ]+ \| .+ +\$|\$Id\$",
-                          re.IGNORECASE)
-    date_regex = re.compile(r"\$Date: +[-:\d ]+ +\$|\$Date\$",
-                            re.IGNORECASE)
-    source_regex = re.compile(r"\$Source: .+[.].+ \$|\$Source\$",
-                              re.IGNORECASE)
-    file_regex = re.compile(r"\$File: .+[.].+ \$|\$File\$",
-                            re.IGNORECASE)
-    revision_regex = re.compile(r"\$Revision: +[-:\d+ ]+ +\$|\$Revision\$",
-                                re.IGNORECASE)
-    rev_regex = re.compile(r"\$Rev: +[-:\d+ ]+ +\$|\$Rev\$",
-                           re.IGNORECASE)
-    hash_regex = re.compile(r"\$Hash: +\w+ +\$|\$Hash\$",
-                            re.IGNORECASE)
-
-    # Calculate empty strings based on the keyword
-    git_hash = '$%s$' % 'Hash'
-    git_author = '$%s$' % 'Author'
-    git_date = '$%s$' % 'Date'
-    git_rev = '$%s$' % 'Rev'
-    git_revision = '$%s$' % 'Revision'
-    git_file = '$%s$' % 'File'
-    git_source = '$%s$' % 'Source'
-    git_id = '$%s$' % 'Id'
+    # Build the keyword matchers, see rcs_filter.KeywordMatcher for the
+    # expressions they are equivalent to
+    matchers = rcs_filter.clean_matchers()
+
+    # Return the cached result when the file has not changed since it was
+    # last cleaned
+    (source, cache_state) = read_clean_cache(file_name=file_name)
+    if source is None:
+        end_time = get_clock()
+        logging.info('Returned cached result for file %s', file_name)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return
+    output = []
+    encoded = None
+    keywords_found = False
+
+    # Let the keyword service clean the contents when it is running
+    if cache_state:
+        cleaned = clean_with_daemon(file_name=file_name,
+                                    cache_state=cache_state)
+        if cleaned is not None:
+            (encoded, keywords_found) = cleaned
+            source = []
+            sys.stdout.flush()
+            getattr(sys.stdout, 'buffer', sys.stdout).write(encoded)
 
     # Process each of the rows found on stdin
     line_count = 0
     try:
-        for line in sys.stdin:
+        for line in source:
             line_count += 1
-            if line.count('$') > 1:
-                line = author_regex.sub(git_author, line)
-                line = id_regex.sub(git_id, line)
-                line = date_regex.sub(git_date, line)
-                line = source_regex.sub(git_source, line)
-                line = file_regex.sub(git_file, line)
-                line = revision_regex.sub(git_revision, line)
-                line = rev_regex.sub(git_rev, line)
-                line = hash_regex.sub(git_hash, line)
-            sys.stdout.write(line)
+            (line, found) = rcs_filter.clean_line(line=line,
+                                                  matchers=matchers)
+            keywords_found = keywords_found or found
+            if cache_state:
+                output.append(line)
+            else:
+                sys.stdout.write(line)
     except Exception as err:
         logging.info('Exception cleaning file %s',
                      file_name,
@@ -155,6 +341,21 @@ def clean():
                       file_name)
         exit(2)
 
+    if cache_state:
+        if encoded is None:
+            output = ''.join(output)
+            sys.stdout.write(output)
+            encoded = output.encode(sys.stdout.encoding, sys.stdout.errors)
+        write_clean_cache(file_name=file_name,
+                          cache_state=cache_state,
+                          output=encoded)
+
+    # Remember whether the staged contents hold keywords so that the hooks
+    # are able to skip the file
+    record_keyword_presence(file_name=file_name,
+                            present=keywords_found,
+                            cache_state=cache_state)
+
     end_time = get_clock()
     logging.debug('Line count: %d', line_count)
     logging.info('Elapsed time: %f', (end_time - start_time))
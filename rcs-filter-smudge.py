@@ -10,9 +10,11 @@ keyword substitutions.
 """
 
 import sys
-import re
-import subprocess
+import os
 import logging
+import hashlib
+
+import rcs_filter
 
 __author__ = "David Rotthoff"
 __email__ = "drotthoff@gmail.com"
@@ -28,8 +30,10 @@ __status__ = "Production"
 # LOGGING_CONSOLE_LEVEL = logging.WARNING
 LOGGING_CONSOLE_LEVEL = logging.ERROR
 # LOGGING_CONSOLE_LEVEL = logging.CRITICAL
+# The process id tells apart the records of filters run at the same time
 LOGGING_CONSOLE_MSG_FORMAT = \
-    '%(asctime)s:%(levelname)s:%(module)s:%(funcName)s:%(lineno)s: %(message)s'
+    '%(asctime)s:%(levelname)s:%(process)d:%(module)s:%(funcName)s:' \
+    '%(lineno)s: %(message)s'
 LOGGING_CONSOLE_DATE_FORMAT = '%Y-%m-%d %H.%M.%S'
 
 LOGGING_FILE_LEVEL = None
@@ -63,13 +67,15 @@ def configure_logging():
         )
         console.setFormatter(console_formatter)
 
-    # Create an file based logger if a LOGGING_FILE_LEVEL is defined
+    # Create an file based logger if a LOGGING_FILE_LEVEL is defined.  The
+    # log is shared with the other filters and hooks, so each record is
+    # appended with a single write.
     if LOGGING_FILE_LEVEL:
         logging.basicConfig(
             level=LOGGING_FILE_LEVEL,
             format=LOGGING_FILE_MSG_FORMAT,
             datefmt=LOGGING_FILE_DATE_FORMAT,
-            filename=LOGGING_FILE_NAME,
+            stream=rcs_filter.AppendLog(LOGGING_FILE_NAME),
         )
 
     # Basic logger configuration
@@ -80,201 +86,366 @@ def configure_logging():
             logger.addHandler(console)
 
 
-def git_log_attributes(git_field_log, file_name, git_field_name):
-    """Function to dump the git log associated with the provided
-    file name.
+def record_keyword_spans(file_name, keyword_spans, byte_count, digest,
+                         object_id):
+    """Save the keyword offsets of the smudged file in the offset index
+    and record whether the file holds keywords.
 
     Arguments:
-        git_field_log -- a list of git log fields to capture
-        file_name -- The full file name to be examined
-        git_field_name -- Name of the attributes fields for the dictionary
+        file_name -- The working tree file being smudged
+        keyword_spans -- List of (byte offset, byte length, keyword id)
+        byte_count -- Number of bytes written for the file
+        digest -- SHA-1 digest of the bytes written for the file
+        object_id -- The hexadecimal id of the blob smudged, None if it is
+                     not known
 
     Returns:
-        git_log -- List of defined attribute dictionaries
+        Nothing
     """
 
     # Display input parameters
     start_time = get_clock()
     logging.info('Entered function')
-    logging.debug('git_field_log %s', git_field_log)
     logging.debug('file_name: %s', file_name)
-    logging.debug('git_field_name: %s', git_field_name)
-
-    # Format the git log command
-    git_field_format = '%x1f'.join(git_field_log) + '%x1e'
-    cmd = ['git',
-           'log',
-           '--date=iso8601',
-           '--max-count=1',
-           '--format=%s' % git_field_format,
-           '--',
-           str(file_name)]
-    logging.debug('cmd: %s', cmd)
-
-    # Process the git log command
+    logging.debug('keyword_spans: %s', keyword_spans)
+
+    if len(sys.argv) < 2:
+        logging.debug('No file name supplied - offset index not updated')
+        return
+
+    # The index is an optimization only so a failure to update it must
+    # never fail the smudge itself
     try:
-        cmd_handle = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        (cmd_stdout, cmd_stderr) = cmd_handle.communicate()
-        if cmd_stderr:
-            for line in cmd_stderr.strip().decode("utf-8").splitlines():
-                logging.info("stderr.line: %s", line)
-    # If the command fails, notify the user and exit immediately
-    except subprocess.CalledProcessError as err:
-        end_time = get_clock()
-        logging.info("Program %s call failed! -- Exiting.",
-                     cmd,
+        git_dir = rcs_filter.find_git_dir()
+        if git_dir is None:
+            logging.info('No git directory found - offset index not updated')
+        elif keyword_spans and object_id is not None:
+            # The file has not been written by git yet so the modification
+            # time is left to be recorded by the first re-expansion, which
+            # compares the contents with the digest until then
+            rcs_filter.write_offset_index(git_dir=git_dir,
+                                          file_name=file_name,
+                                          spans=keyword_spans,
+                                          size=byte_count,
+                                          digest=digest,
+                                          object_id=object_id)
+        else:
+            rcs_filter.remove_offset_index(git_dir=git_dir,
+                                           file_name=file_name)
+        if git_dir is not None:
+            rcs_filter.write_keyword_presence(git_dir=git_dir,
+                                              file_name=file_name,
+                                              present=bool(keyword_spans))
+    except (IOError, OSError):
+        logging.info('Unable to update the offset index for file %s',
+                     file_name,
                      exc_info=True)
-        logging.error(
-            "Program %s call failed! -- Exiting.", cmd
-        )
-        logging.info('Elapsed time: %f', (end_time - start_time))
-        exit(err.returncode)
-    except OSError as err:
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+def smudge_with_daemon(file_name, data, input_codec, output_codec):
+    """Hand the blob to the keyword service when it is running.
+
+    Arguments:
+        file_name -- The working tree file being smudged
+        data -- The whole contents read from stdin
+        input_codec -- The (encoding, errors) used to decode stdin
+        output_codec -- The (encoding, errors) used to encode stdout
+
+    Returns:
+        True if the service smudged the blob, False if the caller must
+        smudge it
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_name: %s', file_name)
+
+    git_dir = None
+    if len(sys.argv) > 1 and \
+            len(data) <= rcs_filter.SMUDGE_CACHE_MAX_FILE:
+        git_dir = rcs_filter.find_git_dir()
+    reply = None
+    if git_dir is not None:
+        reply = rcs_filter.daemon_request(
+            command='smudge',
+            header={'file_name': file_name,
+                    'git_dir': os.path.abspath(git_dir),
+                    'input_codec': list(input_codec),
+                    'output_codec': list(output_codec)},
+            payload=data)
+    if reply is None:
         end_time = get_clock()
-        logging.info(
-            "Program %s caused on OS error! -- Exiting.",
-            cmd,
-            exc_info=True
-        )
-        logging.error(
-            "Program %s caused OS error %s! -- Exiting.",
-            cmd,
-            err.errno
-        )
+        logging.info('File %s is not smudged by the keyword service',
+                     file_name)
         logging.info('Elapsed time: %f', (end_time - start_time))
-        exit(err.errno)
+        return False
+
+    (header, output) = reply
+    sys.stdout.flush()
+    getattr(sys.stdout, 'buffer', sys.stdout).write(output)
+    sys.stdout.flush()
+    record_keyword_spans(file_name=file_name,
+                         keyword_spans=[tuple(span)
+                                        for span in header['spans']],
+                         byte_count=len(output),
+                         digest=hashlib.sha1(output).digest(),
+                         object_id=rcs_filter.blob_id(data))
+
+    end_time = get_clock()
+    logging.info('Line count: %d', header['line_count'])
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return True
 
-    # If an error occurred, display the command output and exit
-    # with the returned exit code
-    if cmd_handle.returncode != 0:
+
+def read_smudge_cache(file_name, data, stdin):
+    """Look up the smudge output cache for the blob being smudged.
+
+    Arguments:
+        file_name -- The working tree file being smudged
+        data -- The bytes already read from stdin
+        stdin -- The binary stdin stream holding the remaining bytes
+
+    Returns:
+        A (source, regex_dict, cache_state) tuple.  The source is None if
+        the cached result was written to stdout, otherwise it holds the
+        lines to be smudged.  The regex_dict holds the substitution values
+        of the keywords found in the blob when it was looked up.  The
+        cache_state is needed to store the result and is None if the blob
+        can not be cached.
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_name: %s', file_name)
+
+    source = rcs_filter.text_stream(
+        rcs_filter.PrefixedReader(data, stdin))
+
+    # Only files small enough to cache which hold a keyword are looked up,
+    # the others are passed through without calling git
+    git_dir = None
+    keywords = None
+    if len(sys.argv) > 1 and \
+            len(data) <= rcs_filter.SMUDGE_CACHE_MAX_FILE:
+        keywords = rcs_filter.find_keyword_names(data)
+    if keywords:
+        git_dir = rcs_filter.find_git_dir()
+    if git_dir is None:
         end_time = get_clock()
-        logging.info(
-            "Exiting -- git log return error code: %d", cmd_handle.returncode,
-            exc_info=True
-        )
-        logging.error(
-            "Exiting -- git log return error code: %d", cmd_handle.returncode
-        )
-        logging.info("Output text: %s", cmd_stdout.strip().decode("utf-8"))
+        logging.info('File %s is not cached', file_name)
         logging.info('Elapsed time: %f', (end_time - start_time))
-        exit(cmd_handle.returncode)
-
-    # Calculate replacement strings based on the git log results
-    if cmd_stdout:
-        # Convert returned values to a list of dictionaries
-        git_output = cmd_stdout.strip().decode("utf-8")
-        git_log = git_output.strip().split("\x1e")
-        git_log = [row.strip().split("\x1f") for row in git_log]
-        git_log = [dict(zip(git_field_name, row)) for row in git_log]
-    else:
-        git_log = []
-
-    if not git_log:
-        # end_time = get_clock()
-        logging.info('No git attributes returned for file %s', file_name)
-        # logging.info('Elapsed time: %f', (end_time - start_time))
-        # exit(4)
-
-    if len(git_log) > 1:
-        # end_time = get_clock()
-        logging.error(
-            'More than one row of git attributes returned for file %s',
-            file_name
-        )
-        # logging.info('Elapsed time: %f', (end_time - start_time))
-        # exit(3)
+        return (source, {}, None)
+
+    # Key the cache by the commit which last changed the file, which the
+    # commit information cache or the path index usually know without
+    # walking the history.  A file name holding a $ may bring in keywords
+    # of its own when it is expanded.
+    git_log = None
+    commit = ''
+    if '$' in file_name or \
+            any(rcs_filter.KEYWORD_FIELDS[key] for key in keywords):
+        git_log = rcs_filter.shared_git_log(
+            git_field_log=rcs_filter.GIT_FIELD_LOG,
+            file_name=file_name,
+            git_field_name=rcs_filter.GIT_FIELD_NAME)
+        if git_log:
+            commit = git_log[0].get('hash', '')
+    cache_key = rcs_filter.smudge_cache_key(data=data,
+                                            file_name=file_name,
+                                            commit=commit)
+    try:
+        cached = rcs_filter.read_smudge_cache(git_dir=git_dir,
+                                              cache_key=cache_key)
+    except (IOError, OSError):
+        logging.info('Unable to read the smudge cache for file %s',
+                     file_name,
+                     exc_info=True)
+        cached = None
+    if cached is not None:
+        (output, keyword_spans) = cached
+        sys.stdout.flush()
+        getattr(sys.stdout, 'buffer', sys.stdout).write(output)
+        sys.stdout.flush()
+        record_keyword_spans(file_name=file_name,
+                             keyword_spans=keyword_spans,
+                             byte_count=len(output),
+                             digest=hashlib.sha1(output).digest(),
+                             object_id=rcs_filter.blob_id(data))
+        end_time = get_clock()
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return (None, {}, None)
+
+    # Resolve exactly the keywords used by the file
+    regex_dict = rcs_filter.build_regex_dict(
+        git_field_log=rcs_filter.GIT_FIELD_LOG,
+        file_name=file_name,
+        git_field_name=rcs_filter.GIT_FIELD_NAME,
+        keywords=keywords,
+        git_log=git_log)
 
-    # Log the results of the git log operation
     end_time = get_clock()
-    logging.debug('git_log: %s', git_log)
     logging.info('Elapsed time: %f', (end_time - start_time))
+    return (source, regex_dict, (git_dir, cache_key))
+
+
+def write_smudge_cache(cache_state, output, keyword_spans):
+    """Save the smudge result of the blob in the smudge output cache.
+
+    Arguments:
+        cache_state -- The cache state returned by read_smudge_cache
+        output -- The smudged contents
+        keyword_spans -- List of (byte offset, byte length, keyword id)
+
+    Returns:
+        Nothing
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+
+    (git_dir, cache_key) = cache_state
+
+    # The cache is an optimization only so a failure to update it must
+    # never fail the smudge itself
+    try:
+        rcs_filter.write_smudge_cache(git_dir=git_dir,
+                                      cache_key=cache_key,
+                                      output=output,
+                                      spans=keyword_spans)
+    except (IOError, OSError):
+        logging.info('Unable to update the smudge cache', exc_info=True)
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+def lines_splittable(input_codec, output_codec):
+    """Check whether a file may be split at its newline bytes, which is
+    not the case on Windows or for encodings where a newline byte may be
+    part of another character.
+
+    Arguments:
+        input_codec -- The (encoding, errors) used to decode stdin
+        output_codec -- The (encoding, errors) used to encode stdout
+
+    Returns:
+        True if the line boundaries are safe to split
+    """
+    return os.name != 'nt' and \
+        '\n'.encode(input_codec[0]) == b'\n' and \
+        '\n'.encode(output_codec[0]) == b'\n'
 
-    # Return from the function
-    return git_log
 
+def smudge_large_file(file_name, data, stdin, input_codec, output_codec):
+    """Smudge a file of at least PARALLEL_SMUDGE_MIN_FILE bytes on all
+    processor cores.
 
-def build_regex_dict(git_field_log, file_name, git_field_name):
-    """Function to converts a 1 row list of git log attributes into
-    dictionary of regex expressions.
+    The input is spooled to a temporary file below the git directory which
+    the worker processes memory-map.  Smaller files and encodings where a
+    newline byte may be part of another character are left to the line by
+    line smudge.
 
     Arguments:
-        git_field_log -- a list of git log fields to capture
-        file_name -- The full file name to be examined
-        git_field_name -- Name of the attributes fields for the dictionary
+        file_name -- The working tree file being smudged
+        data -- The bytes already read from stdin
+        stdin -- The binary stdin stream holding the remaining bytes
+        input_codec -- The (encoding, errors) used to decode stdin
+        output_codec -- The (encoding, errors) used to encode stdout
 
     Returns:
-        regex_dict -- Array of defined attribute dictionaries
+        None if the file was smudged, otherwise the bytes read from stdin.
+        These are the whole contents unless the line boundaries are unsafe
+        to split.
     """
 
     # Display input parameters
     start_time = get_clock()
     logging.info('Entered function')
-    logging.debug('git_field_log %s', git_field_log)
     logging.debug('file_name: %s', file_name)
-    logging.debug('git_field_name: %s', git_field_name)
-
-    # Format the git log command
-    git_log = git_log_attributes(git_field_log=git_field_log,
-                                 file_name=file_name,
-                                 git_field_name=git_field_name)
-
-    logging.debug('git_log %s', git_log)
-
-    regex_dict = {}
-    if git_log:
-        logging.debug('Calculating regex dictionary')
-        # Calculate the replacement strings based on the git log results
-        # Deal with values in author name that have a Windows domain name
-        if '\\' in git_log[0]['author_name']:
-            git_log[0]['author_name'] = \
-                git_log[0]['author_name'].split('\\')[-1]
-
-        regex_dict['git_hash'] = \
-            '$Hash:     %s $' % str(git_log[0]['hash'])
-        regex_dict['git_short_hash'] = \
-            '$Short Hash:     %s $' % str(git_log[0]['short_hash'])
-        regex_dict['git_author'] =\
-            '$Author:   %s <%s> $' % (str(git_log[0]['author_name']),
-                                      str(git_log[0]['author_email']))
-        regex_dict['git_date'] = \
-            '$Date:     %s $' % str(git_log[0]['commit_date'])
-        regex_dict['git_rev'] = \
-            '$Rev:      %s $' % str(git_log[0]['commit_date'])
-        regex_dict['git_revision'] = \
-            '$Revision: %s $' % str(git_log[0]['commit_date'])
-        regex_dict['git_file'] = \
-            '$File:     %s $' % str(file_name)
-        regex_dict['git_source'] = \
-            '$Source:   %s $' % str(file_name)
-        regex_dict['git_id'] = \
-            '$Id:       %s | %s | %s $' % (str(file_name),
-                                           str(git_log[0]['commit_date']),
-                                           str(git_log[0]['author_name']))
 
-    else:
-        logging.debug('Building empty regex dictionary')
-
-        # Build a empty keyword list if no source data was found
-        # Note: the unusual means of building the list is to keep
-        #       the code from being modified while using keywords!
-        regex_dict['git_hash'] = '$%s$' % 'Hash'
-        regex_dict['git_author'] = '$%s$' % 'Author'
-        regex_dict['git_date'] = '$%s$' % 'Date'
-        regex_dict['git_rev'] = '$%s$' % 'Rev'
-        regex_dict['git_revision'] = '$%s$' % 'Revision'
-        regex_dict['git_file'] = '$%s$' % 'File'
-        regex_dict['git_source'] = '$%s$' % 'Source'
-        regex_dict['git_id'] = '$%s$' % 'Id'
-
-    # Log the results of the build regex dictionary operation
+    if not lines_splittable(input_codec=input_codec,
+                            output_codec=output_codec):
+        logging.info('Line boundaries unsafe to split for file %s',
+                     file_name)
+        return data
+
+    # The spooling and worker pool code is only loaded for large files
+    import rcs_keywords
+
+    spool_dir = None
+    git_dir = rcs_filter.find_git_dir()
+    if git_dir is not None:
+        spool_dir = rcs_filter.keyword_path(git_dir, 'tmp')
+        try:
+            os.makedirs(spool_dir)
+        except OSError:
+            if not os.path.isdir(spool_dir):
+                spool_dir = None
+
+    (data, spool_name) = rcs_keywords.spool_stream(
+        prefix=data,
+        stream=stdin,
+        min_size=rcs_keywords.PARALLEL_SMUDGE_MIN_FILE,
+        directory=spool_dir)
+    if spool_name is None:
+        end_time = get_clock()
+        logging.info('File %s is not smudged in parallel', file_name)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return data
+
+    try:
+        # Resolve every keyword up front so the workers never call git
+        regex_dict = rcs_filter.build_regex_dict(
+            git_field_log=rcs_filter.GIT_FIELD_LOG,
+            file_name=file_name,
+            git_field_name=rcs_filter.GIT_FIELD_NAME)
+        sys.stdout.flush()
+        (keyword_spans, byte_count, line_count, digest) = \
+            rcs_keywords.smudge_parallel(
+                spool_name=spool_name,
+                regex_dict=regex_dict,
+                file_name=file_name,
+                output=getattr(sys.stdout, 'buffer', sys.stdout),
+                input_codec=input_codec,
+                output_codec=output_codec,
+                workers=rcs_keywords.PARALLEL_SMUDGE_WORKERS)
+        object_id = rcs_keywords.file_blob_id(spool_name)
+    except UnicodeDecodeError as err:
+        logging.info('UnicodeDecodeError with file %s',
+                     file_name,
+                     exc_info=True)
+        logging.debug('Generic exception variables: %s', vars(err))
+        logging.error('Unicode error in file %s - Keywords not replaced',
+                      file_name)
+        exit(5)
+    except Exception as err:
+        logging.info('Generic exception smudging file %s',
+                     file_name,
+                     exc_info=True)
+        logging.debug('Generic exception variables: %s', vars(err))
+        logging.error('Exception smudging file %s - Keywords not replaced',
+                      file_name)
+        exit(2)
+    finally:
+        rcs_filter.remove_file(spool_name)
+
+    sys.stdout.flush()
+    record_keyword_spans(file_name=file_name,
+                         keyword_spans=keyword_spans,
+                         byte_count=byte_count,
+                         digest=digest,
+                         object_id=object_id)
+
     end_time = get_clock()
+    logging.info('Line count: %d', line_count)
     logging.info('Elapsed time: %f', (end_time - start_time))
-
-    return regex_dict
+    return None
 
 
 def smudge():
@@ -300,63 +471,110 @@ def smudge():
         file_name = '<Unknown file>'
     logging.debug('File name parameter %s', file_name)
 
-    # Define the fields to be extracted from the commit log
-    git_field_name = [
-        'hash',
-        'author_name',
-        'author_email',
-        'commit_date',
-        'short_hash'
-    ]
-    git_field_log = [
-        '%H',
-        '%an',
-        '%ae',
-        '%ci',
-        '%h'
-    ]
-
-    # Define the various substitution regular expressions
-    author_regex = re.compile(r"\$Author: +[.\w@<> ]+ +\$|\$Author\$",
-                              re.IGNORECASE)
-    id_regex = re.compile(r"\$Id: +.+ \| [-:\d ]+ \| .+ +\$|\$Id\$",
-                          re.IGNORECASE)
-    date_regex = re.compile(r"\$Date: +[-:\d ]+ +\$|\$Date\$",
-                            re.IGNORECASE)
-    source_regex = re.compile(r"\$Source: .+[.].+ \$|\$Source\$",
-                              re.IGNORECASE)
-    file_regex = re.compile(r"\$File: .+[.].+ \$|\$File\$",
-                            re.IGNORECASE)
-    revision_regex = re.compile(r"\$Revision: +[-:\d ]+ +\$|\$Revision\$",
-                                re.IGNORECASE)
-    rev_regex = re.compile(r"\$Rev: +[-:\d ]+ +\$|\$Rev\$",
-                           re.IGNORECASE)
-    hash_regex = re.compile(r"\$Hash: +\w+ +\$|\$Hash\$",
-                            re.IGNORECASE)
-
-    regex_dict = {}
-
-    # Process each of the rows found on stdin
+    # Build the keyword matchers, see rcs_filter.KeywordMatcher for the
+    # expressions they are equivalent to
+    matchers = rcs_filter.smudge_matchers()
+
+    input_codec = (sys.stdin.encoding, sys.stdin.errors)
+    output_codec = (rcs_filter.get_encoding(),
+                    getattr(sys.stdout, 'errors', None) or 'strict')
+
+    # Expand very large files on all processor cores
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    data = stdin.read(rcs_filter.SMUDGE_CACHE_MAX_FILE + 1)
+    if len(data) > rcs_filter.SMUDGE_CACHE_MAX_FILE:
+        data = smudge_large_file(file_name=file_name,
+                                 data=data,
+                                 stdin=stdin,
+                                 input_codec=input_codec,
+                                 output_codec=output_codec)
+        if data is None:
+            end_time = get_clock()
+            logging.info('Smudged file %s in parallel', file_name)
+            logging.info('Elapsed time: %f', (end_time - start_time))
+            return
+
+    # Let the keyword service smudge the blob when it is running
+    if smudge_with_daemon(file_name=file_name,
+                          data=data,
+                          input_codec=input_codec,
+                          output_codec=output_codec):
+        end_time = get_clock()
+        logging.info('Keyword service smudged file %s', file_name)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return
+
+    # Return the cached result when the same blob was smudged before with
+    # the same commit information
+    (source, regex_dict, cache_state) = read_smudge_cache(file_name=file_name,
+                                                          data=data,
+                                                          stdin=stdin)
+    if source is None:
+        end_time = get_clock()
+        logging.info('Returned cached result for file %s', file_name)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return
+    output = []
+    encoded = None
+
+    # The blob id recorded with the keyword offsets is only known when the
+    # whole blob was read, which a large file whose line boundaries are
+    # unsafe to split is not
+    object_id = None
+    if len(data) <= rcs_filter.SMUDGE_CACHE_MAX_FILE or \
+            lines_splittable(input_codec=input_codec,
+                             output_codec=output_codec):
+        object_id = rcs_filter.blob_id(data)
+
+    # Track the byte offsets of the expanded keywords for the offset index
+    encoding = rcs_filter.get_encoding()
+    byte_count = 0
+    keyword_spans = []
+    digest = hashlib.sha1()
+
+    # Scan whole buffers for the lines which may hold keywords when NumPy
+    # is available.  The data then holds the whole contents as the line
+    # boundaries are safe to split.
     line_count = 0
     try:
-        for line in sys.stdin:
+        if rcs_filter.vector_scan_usable(input_codec=input_codec,
+                                         output_codec=output_codec,
+                                         size=len(data)):
+            (encoded, regex_dict, keyword_spans, line_count) = \
+                rcs_filter.smudge_buffer(data=data,
+                                         regex_dict=regex_dict,
+                                         matchers=matchers,
+                                         file_name=file_name,
+                                         codec=output_codec)
+            source = []
+            byte_count = len(encoded)
+            digest.update(encoded)
+            sys.stdout.flush()
+            getattr(sys.stdout, 'buffer', sys.stdout).write(encoded)
+
+        # Process each of the rows found on stdin
+        for line in source:
             line_count += 1
-            if line.count('$') > 1:
-                if len(regex_dict) == 0:
-                    regex_dict = build_regex_dict(
-                        git_field_log=git_field_log,
-                        file_name=file_name,
-                        git_field_name=git_field_name)
-
-                line = author_regex.sub(regex_dict['git_author'], line)
-                line = id_regex.sub(regex_dict['git_id'], line)
-                line = date_regex.sub(regex_dict['git_date'], line)
-                line = source_regex.sub(regex_dict['git_source'], line)
-                line = file_regex.sub(regex_dict['git_file'], line)
-                line = revision_regex.sub(regex_dict['git_revision'], line)
-                line = rev_regex.sub(regex_dict['git_rev'], line)
-                line = hash_regex.sub(regex_dict['git_hash'], line)
-            sys.stdout.write(line)
+            (line, regex_dict, line_spans) = rcs_filter.smudge_line(
+                line=line,
+                regex_dict=regex_dict,
+                matchers=matchers,
+                file_name=file_name)
+            line_bytes = line.encode(encoding, output_codec[1])
+            if line_spans:
+                keyword_spans.extend(rcs_filter.keyword_byte_spans(
+                    line=line,
+                    encoded=line_bytes,
+                    spans=line_spans,
+                    byte_count=byte_count,
+                    encoding=encoding,
+                    errors=output_codec[1]))
+            if cache_state:
+                output.append(line)
+            else:
+                sys.stdout.write(line)
+            digest.update(line_bytes)
+            byte_count += len(line_bytes)
     except UnicodeDecodeError as err:
         logging.info('UnicodeDecodeError with file %s on line %d',
                      file_name,
@@ -378,6 +596,24 @@ def smudge():
                       line_count)
         exit(2)
 
+    if cache_state:
+        if encoded is None:
+            output = ''.join(output)
+            sys.stdout.write(output)
+            encoded = output.encode(encoding, output_codec[1])
+        write_smudge_cache(cache_state=cache_state,
+                           output=encoded,
+                           keyword_spans=keyword_spans)
+
+    # Record where the keywords landed so that the hooks are able to
+    # re-expand them without scanning the file again
+    sys.stdout.flush()
+    record_keyword_spans(file_name=file_name,
+                         keyword_spans=keyword_spans,
+                         byte_count=byte_count,
+                         digest=digest.digest(),
+                         object_id=object_id)
+
     end_time = get_clock()
     logging.info('Line count: %d', line_count)
     logging.info('Elapsed time: %f', (end_time - start_time))
@@ -0,0 +1,586 @@
+#! /usr/bin/env python
+# # -*- coding: utf-8 -*
+
+"""
+rcs-keywords-daemon
+
+This module provides an optional keyword service for the current user.
+It keeps the commit information of recently expanded files, the keyword
+matchers and a git process per repository in memory so that the filters
+and hooks only pass the file contents over a Unix socket.  The filters
+and hooks do the work themselves whenever the service is not running.
+
+Usage: rcs-keywords-daemon.py start|run|stop|status
+"""
+
+import sys
+import os
+import re
+import time
+import threading
+import collections
+import subprocess
+import logging
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+import rcs_keywords
+
+__author__ = "David Rotthoff"
+__email__ = "drotthoff@gmail.com"
+__project__ = "git-rcs-keywords"
+__version__ = "1.1.1-19"
+__date__ = "2021-02-07 10:51:24"
+__credits__ = []
+__status__ = "Production"
+
+# LOGGING_CONSOLE_LEVEL = None
+# LOGGING_CONSOLE_LEVEL = logging.DEBUG
+# LOGGING_CONSOLE_LEVEL = logging.INFO
+# LOGGING_CONSOLE_LEVEL = logging.WARNING
+LOGGING_CONSOLE_LEVEL = logging.ERROR
+# LOGGING_CONSOLE_LEVEL = logging.CRITICAL
+# The process id tells apart the records of filters run at the same time
+LOGGING_CONSOLE_MSG_FORMAT = \
+    '%(asctime)s:%(levelname)s:%(process)d:%(module)s:%(funcName)s:' \
+    '%(lineno)s: %(message)s'
+LOGGING_CONSOLE_DATE_FORMAT = '%Y-%m-%d %H.%M.%S'
+
+LOGGING_FILE_LEVEL = None
+# LOGGING_FILE_LEVEL = logging.DEBUG
+# LOGGING_FILE_LEVEL = logging.INFO
+# LOGGING_FILE_LEVEL = logging.WARNING
+# LOGGING_FILE_LEVEL = logging.ERROR
+# LOGGING_FILE_LEVEL = logging.CRITICAL
+LOGGING_FILE_MSG_FORMAT = LOGGING_CONSOLE_MSG_FORMAT
+LOGGING_FILE_DATE_FORMAT = LOGGING_CONSOLE_DATE_FORMAT
+# LOGGING_FILE_NAME = '.git-hook.daemon.log'
+LOGGING_FILE_NAME = os.path.join(os.path.expanduser('~'), '.git-hook.log')
+
+# Conditionally map a time function for performance measurement
+# depending on the version of Python used
+if sys.version_info.major >= 3 and sys.version_info.minor >= 3:
+    from time import perf_counter as get_clock
+else:
+    from time import clock as get_clock
+
+# Estimated memory used by a cache entry in addition to its text
+ENTRY_OVERHEAD = 512
+
+# Seconds to wait for a started service to answer
+START_TIMEOUT = 5
+
+# Bytes outside of ASCII, the keyword names are only located in bytes
+# when they are written in ASCII
+NON_ASCII_REGEX = re.compile(b'[\x80-\xff]')
+
+
+def configure_logging():
+    """Configure the logging service"""
+    # Configure the console logger
+    if LOGGING_CONSOLE_LEVEL:
+        console = logging.StreamHandler()
+        console.setLevel(LOGGING_CONSOLE_LEVEL)
+        console_formatter = logging.Formatter(
+            fmt=LOGGING_CONSOLE_MSG_FORMAT,
+            datefmt=LOGGING_CONSOLE_DATE_FORMAT,
+        )
+        console.setFormatter(console_formatter)
+
+    # Create an file based logger if a LOGGING_FILE_LEVEL is defined.  The
+    # log is shared with the other filters and hooks, so each record is
+    # appended with a single write.
+    if LOGGING_FILE_LEVEL:
+        logging.basicConfig(
+            level=LOGGING_FILE_LEVEL,
+            format=LOGGING_FILE_MSG_FORMAT,
+            datefmt=LOGGING_FILE_DATE_FORMAT,
+            stream=rcs_keywords.AppendLog(LOGGING_FILE_NAME),
+        )
+
+    # Basic logger configuration
+    if LOGGING_CONSOLE_LEVEL or LOGGING_FILE_LEVEL:
+        logger = logging.getLogger('')
+        if LOGGING_CONSOLE_LEVEL:
+            # Add the console logger to default logger
+            logger.addHandler(console)
+
+
+class RepositoryPartition(object):
+    """Commit information cache of one repository.  The entries are keyed
+    by the commit HEAD points at and the file name so that they never
+    have to be invalidated, a new commit simply stops using them."""
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self.values = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.process = None
+
+    def head(self):
+        """Resolve the commit HEAD points at with a persistent git cat-file
+        process.
+
+        Returns:
+            The commit id, 'HEAD' for an unborn branch or None if git
+            could not be run
+        """
+        with self.lock:
+            for _ in range(2):
+                if self.process is None:
+                    try:
+                        with open(os.devnull, 'wb') as devnull:
+                            self.process = subprocess.Popen(
+                                ['git',
+                                 '--git-dir=%s' % self.git_dir,
+                                 'cat-file',
+                                 '--batch-check'],
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=devnull)
+                    except OSError:
+                        logging.info('Unable to execute git cat-file',
+                                     exc_info=True)
+                        return None
+                try:
+                    self.process.stdin.write(b'HEAD\n')
+                    self.process.stdin.flush()
+                    line = self.process.stdout.readline()
+                except (IOError, OSError):
+                    line = b''
+                if line:
+                    return line.split()[0].decode('ascii')
+                self.stop_process()
+            return None
+
+    def stop_process(self):
+        """Stop the git cat-file process.  The caller holds the lock.
+
+        Returns:
+            Nothing
+        """
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+                self.process.wait()
+            except (IOError, OSError):
+                logging.info('Unable to stop git cat-file', exc_info=True)
+            self.process = None
+
+    def close(self):
+        """Release the git process of the partition
+
+        Returns:
+            Nothing
+        """
+        with self.lock:
+            self.stop_process()
+
+
+class KeywordRequestHandler(socketserver.StreamRequestHandler):
+    """Handle a single filter or hook request"""
+
+    def handle(self):
+        start_time = get_clock()
+        logging.info('Entered function')
+
+        try:
+            (header, payload) = rcs_keywords.receive_message(
+                stream=self.rfile)
+        except (EOFError, ValueError, KeyError):
+            logging.info('Invalid request', exc_info=True)
+            return
+        logging.debug('header: %s', header)
+
+        # Git failures end the filter functions with exit so they are
+        # reported back to the client which then does the work itself
+        try:
+            (reply, reply_payload) = self.server.dispatch(header=header,
+                                                          payload=payload)
+            reply = dict(reply, status='ok')
+        except (Exception, SystemExit) as err:
+            logging.info('Request %s failed',
+                         header.get('command'),
+                         exc_info=True)
+            reply = {'status': 'error', 'message': repr(err)}
+            reply_payload = b''
+
+        try:
+            rcs_keywords.send_message(connection=self.connection,
+                                      header=reply,
+                                      payload=reply_payload)
+        except (IOError, OSError):
+            logging.info('Unable to send the reply', exc_info=True)
+
+        end_time = get_clock()
+        logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+class KeywordService(socketserver.ThreadingMixIn,
+                     socketserver.UnixStreamServer):
+    """Keyword service holding the commit information cache partitions of
+    every repository it was asked about"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        socketserver.UnixStreamServer.__init__(self,
+                                               socket_path,
+                                               KeywordRequestHandler)
+        self.socket_path = socket_path
+        self.socket_stat = os.stat(socket_path)
+        self.partitions = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.smudge_matchers = rcs_keywords.smudge_matchers()
+        self.clean_matchers = rcs_keywords.clean_matchers()
+        self.running = True
+        self.last_request = time.time()
+        self.timeout = 1
+
+    def process_request(self, request, client_address):
+        self.last_request = time.time()
+        socketserver.ThreadingMixIn.process_request(self,
+                                                    request,
+                                                    client_address)
+
+    def handle_timeout(self):
+        idle_time = time.time() - self.last_request
+        if idle_time > rcs_keywords.DAEMON_IDLE_TIMEOUT:
+            logging.info('Stopping after %d idle seconds', idle_time)
+            self.running = False
+
+    def serve(self):
+        """Handle requests until the service is stopped or idle
+
+        Returns:
+            Nothing
+        """
+        try:
+            while self.running:
+                self.handle_request()
+        finally:
+            self.server_close()
+            with self.lock:
+                for partition in self.partitions.values():
+                    partition.close()
+                self.partitions.clear()
+            # Only remove the socket if it was not replaced by another
+            # instance of the service
+            try:
+                socket_stat = os.stat(self.socket_path)
+                if socket_stat.st_ino == self.socket_stat.st_ino:
+                    os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    def partition(self, git_dir):
+        """Find the cache partition of a repository, creating it when
+        needed.
+
+        Arguments:
+            git_dir -- The git directory of the repository
+
+        Returns:
+            The RepositoryPartition
+        """
+        git_dir = os.path.realpath(git_dir)
+        with self.lock:
+            partition = self.partitions.pop(git_dir, None)
+            if partition is None:
+                logging.info('New partition for %s', git_dir)
+                partition = RepositoryPartition(git_dir=git_dir)
+            self.partitions[git_dir] = partition
+        return partition
+
+    def store(self, partition, key, values):
+        """Add the values of a file to a partition and evict the least
+        recently used entries of all partitions while the cache is larger
+        than DAEMON_MEMORY_LIMIT.
+
+        Arguments:
+            partition -- The RepositoryPartition
+            key -- The (head, file name) cache key
+            values -- The substitution values of the file
+
+        Returns:
+            Nothing
+        """
+        size = ENTRY_OVERHEAD + len(key[1]) + \
+            sum(len(name) + len(value) for (name, value) in values.items())
+        with self.lock:
+            # The partition may have been evicted while git was running
+            if self.partitions.get(partition.git_dir) is not partition:
+                self.partitions[partition.git_dir] = partition
+            if key in partition.values:
+                return
+            partition.values[key] = (values, size)
+            partition.size += size
+            self.size += size
+
+            while self.size > rcs_keywords.DAEMON_MEMORY_LIMIT and \
+                    self.partitions:
+                oldest = next(iter(self.partitions.values()))
+                if not oldest.values:
+                    del self.partitions[oldest.git_dir]
+                    oldest.close()
+                    continue
+                (_, (_, entry_size)) = oldest.values.popitem(last=False)
+                oldest.size -= entry_size
+                self.size -= entry_size
+
+    def keyword_values(self, git_dir, cwd, file_name):
+        """Find the substitution values of every keyword of a file
+
+        Arguments:
+            git_dir -- The git directory of the repository
+            cwd -- The working tree top level
+            file_name -- The file name relative to cwd
+
+        Returns:
+            The substitution values
+        """
+        partition = self.partition(git_dir=git_dir)
+        head = partition.head()
+        key = (head, file_name)
+        if head is not None:
+            with self.lock:
+                entry = partition.values.pop(key, None)
+                if entry is not None:
+                    partition.values[key] = entry
+                    return entry[0]
+
+        values = rcs_keywords.build_regex_dict(
+            git_field_log=rcs_keywords.GIT_FIELD_LOG,
+            file_name=file_name,
+            git_field_name=rcs_keywords.GIT_FIELD_NAME,
+            cwd=cwd,
+            git_dir=partition.git_dir)
+        if head is not None:
+            self.store(partition=partition, key=key, values=values)
+        return values
+
+    def smudge(self, header, data):
+        """Expand the keywords of a blob
+
+        Arguments:
+            header -- The request header
+            data -- The blob contents
+
+        Returns:
+            A (reply, payload) tuple
+        """
+        file_name = header['file_name']
+
+        # Resolve the keywords found in the blob the same way as the smudge
+        # filter.  Names spelled with non-ASCII case variants are not found
+        # in the bytes and are left to the filter, which resolves them
+        # line by line.
+        keywords = rcs_keywords.find_keyword_names(data)
+        if b'$' in data and NON_ASCII_REGEX.search(data):
+            text = data.decode(header['input_codec'][0],
+                               header['input_codec'][1])
+            if not rcs_keywords.find_keyword_names(text).issubset(keywords):
+                raise ValueError('Keyword names outside of ASCII')
+        regex_dict = {}
+        if any(rcs_keywords.KEYWORD_FIELDS[key] for key in keywords):
+            regex_dict = self.keyword_values(git_dir=header['git_dir'],
+                                             cwd=header['cwd'],
+                                             file_name=file_name)
+        elif keywords:
+            regex_dict = rcs_keywords.build_regex_dict(
+                git_field_log=rcs_keywords.GIT_FIELD_LOG,
+                file_name=file_name,
+                git_field_name=rcs_keywords.GIT_FIELD_NAME,
+                keywords=keywords)
+
+        (output, _, spans, line_count) = rcs_keywords.smudge_data(
+            data=data,
+            regex_dict=regex_dict,
+            matchers=self.smudge_matchers,
+            file_name=file_name,
+            input_codec=tuple(header['input_codec']),
+            output_codec=tuple(header['output_codec']))
+        return ({'spans': spans, 'line_count': line_count}, output)
+
+    def dispatch(self, header, payload):
+        """Run a request
+
+        Arguments:
+            header -- The request header
+            payload -- The request payload
+
+        Returns:
+            A (reply, payload) tuple
+        """
+        command = header['command']
+        if command == 'smudge':
+            return self.smudge(header=header, data=payload)
+        if command == 'clean':
+            (output, keywords_found) = rcs_keywords.clean_data(
+                data=payload,
+                matchers=self.clean_matchers,
+                input_codec=tuple(header['input_codec']),
+                output_codec=tuple(header['output_codec']))
+            return ({'keywords_found': keywords_found}, output)
+        if command == 'values':
+            values = self.keyword_values(git_dir=header['git_dir'],
+                                         cwd=header['cwd'],
+                                         file_name=header['file_name'])
+            return ({'values': values}, b'')
+        if command == 'ping':
+            with self.lock:
+                return ({'pid': os.getpid(),
+                         'partitions': len(self.partitions),
+                         'cached_bytes': self.size}, b'')
+        if command == 'stop':
+            self.running = False
+            return ({}, b'')
+        raise ValueError('Unknown command %s' % command)
+
+
+def ping():
+    """Ask the running service for its state
+
+    Returns:
+        The reply header or None if the service is not running
+    """
+    reply = rcs_keywords.daemon_request(command='ping', header={})
+    if reply is None:
+        return None
+    return reply[0]
+
+
+def run_service():
+    """Run the service in the current process until it is stopped or
+    idle.
+
+    Returns:
+        Nothing
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+
+    socket_path = rcs_keywords.daemon_socket_path(create=True)
+    if socket_path is None:
+        logging.error('Unix sockets are not available -- Exiting.')
+        exit(1)
+
+    # A socket left behind by a service that did not stop cleanly is
+    # replaced
+    if os.path.exists(socket_path):
+        if ping() is not None:
+            logging.error('The keyword service is already running')
+            exit(1)
+        rcs_keywords.remove_file(socket_path)
+
+    # The service calls git for many repositories so the settings git
+    # passed to the process that started it must not leak into them
+    for name in list(os.environ):
+        if name.startswith('GIT_'):
+            del os.environ[name]
+
+    old_umask = os.umask(0o077)
+    try:
+        service = KeywordService(socket_path=socket_path)
+    finally:
+        os.umask(old_umask)
+    service.serve()
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+def start_service():
+    """Start the service in the background
+
+    Returns:
+        Nothing
+    """
+    state = ping()
+    if state is None:
+        if os.fork() == 0:
+            # Detach from the terminal and the caller's directory
+            os.setsid()
+            if os.fork() != 0:
+                os._exit(0)
+            os.chdir('/')
+            with open(os.devnull, 'r+b') as devnull:
+                for stream in (sys.stdin, sys.stdout, sys.stderr):
+                    os.dup2(devnull.fileno(), stream.fileno())
+            try:
+                run_service()
+            finally:
+                os._exit(0)
+        os.wait()
+
+        deadline = time.time() + START_TIMEOUT
+        while state is None and time.time() < deadline:
+            time.sleep(0.05)
+            state = ping()
+    if state is None:
+        sys.stderr.write('The keyword service did not start\n')
+        exit(1)
+    sys.stdout.write('Keyword service running with pid %d\n' % state['pid'])
+
+
+def daemon():
+    """Main program.
+
+    Arguments:
+        argv: command line arguments
+
+    Returns:
+        Nothing
+    """
+
+    # Display the parameters passed on the command line
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('sys.argv parameter count %d', len(sys.argv))
+    logging.debug('sys.argv parameters %s', sys.argv)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if command == 'start':
+        start_service()
+    elif command == 'run':
+        run_service()
+    elif command == 'stop':
+        if rcs_keywords.daemon_request(command='stop', header={}) is None:
+            sys.stdout.write('Keyword service is not running\n')
+    elif command == 'status':
+        state = ping()
+        if state is None:
+            sys.stdout.write('Keyword service is not running\n')
+            exit(1)
+        sys.stdout.write('Keyword service running with pid %d, '
+                         '%d repositories, %d cached bytes\n'
+                         % (state['pid'],
+                            state['partitions'],
+                            state['cached_bytes']))
+    else:
+        sys.stderr.write('Usage: %s start|run|stop|status\n'
+                         % os.path.basename(sys.argv[0]))
+        exit(2)
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+# Execute the main function
+if __name__ == '__main__':
+    configure_logging()
+
+    START_TIME = get_clock()
+    logging.debug('Entered module')
+
+    daemon()
+
+    END_TIME = get_clock()
+    logging.info('Elapsed time: %f', (END_TIME - START_TIME))
@@ -16,6 +16,16 @@ import errno
 import subprocess
 import logging
 
+import rcs_keywords
+
+# The concurrent hook pipeline needs the asynchronous generators of
+# Python 3.6, older versions run the git queries, including the keyword
+# search of a first run, one after the other
+if sys.version_info >= (3, 6):
+    import rcs_hooks
+else:
+    rcs_hooks = None
+
 __author__ = "David Rotthoff"
 __email__ = "drotthoff@gmail.com"
 __project__ = "git-rcs-keywords"
@@ -65,13 +75,15 @@ def configure_logging():
         )
         console.setFormatter(console_formatter)
 
-    # Create an file based logger if a LOGGING_FILE_LEVEL is defined
+    # Create an file based logger if a LOGGING_FILE_LEVEL is defined.  The
+    # log is shared with the other filters and hooks, so each record is
+    # appended with a single write.
     if LOGGING_FILE_LEVEL:
         logging.basicConfig(
             level=LOGGING_FILE_LEVEL,
             format=LOGGING_FILE_MSG_FORMAT,
             datefmt=LOGGING_FILE_DATE_FORMAT,
-            filename=LOGGING_FILE_NAME,
+            stream=rcs_keywords.AppendLog(LOGGING_FILE_NAME),
         )
 
     # Basic logger configuration
@@ -199,10 +211,14 @@ def git_ls_files():
     start_time = get_clock()
     logging.debug('Entered function')
 
-    cmd = ['git', 'ls-files']
+    # Read the tracked files from the index without starting git unless
+    # git would quote some of the names
+    cmd_stdout = rcs_keywords.list_index_files()
+    if cmd_stdout is None:
+        cmd = ['git', 'ls-files']
 
-    # Get a list of all files in the current repository branch
-    cmd_stdout = execute_cmd(cmd=cmd, cmd_source='git_ls_files')
+        # Get a list of all files in the current repository branch
+        cmd_stdout = execute_cmd(cmd=cmd, cmd_source='git_ls_files')
 
     end_time = get_clock()
     logging.info('Elapsed time: %f', (end_time - start_time))
@@ -211,6 +227,19 @@ def git_ls_files():
     return cmd_stdout
 
 
+def modified_files_cmd():
+    """Build the git command listing the files modified by the merge.
+
+    Arguments:
+        None
+
+    Returns:
+        The command as a list of strings
+    """
+    return ['git', 'diff-tree', 'ORIG_HEAD', 'HEAD', '--name-only', '-r',
+            '--diff-filter=ACMRT']
+
+
 def get_modified_files():
     """Find files that were modified by the merge.
 
@@ -225,8 +254,7 @@ def get_modified_files():
     logging.debug('Entered function')
 
     modified_file_list = []
-    cmd = ['git', 'diff-tree', 'ORIG_HEAD', 'HEAD', '--name-only', '-r',
-           '--diff-filter=ACMRT']
+    cmd = modified_files_cmd()
 
     # Fetch the list of files modified by the last commit
     cmd_stdout = execute_cmd(cmd=cmd, cmd_source='get_modified_files')
@@ -267,6 +295,17 @@ def remove_modified_files(files):
     logging.info('Entered function')
     logging.debug('files: %s', files)
 
+    # Compare the files with their index entries in process.  Git status
+    # only runs for the files the index leaves undecided, or for all of
+    # them when the index can not be read.
+    modified_files = rcs_keywords.find_modified_files(file_names=files)
+    if modified_files is not None:
+        files = [f for f in files if f not in modified_files]
+        end_time = get_clock()
+        logging.debug('Unmodified files: %s', files)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return files
+
     cmd = ['git', 'status', '-s']
 
     # Get the list of files that are modified but not checked in
@@ -359,6 +398,19 @@ def post_merge():
     start_time = get_clock()
     logging.info('Entered function')
 
+    # Bring the path index up to the new commit before any file is
+    # re-expanded
+    rcs_keywords.update_path_index(git_dir=rcs_keywords.find_git_dir())
+
+    # Run the git queries at the same time on Python 3.6 and later
+    if rcs_hooks is not None:
+        files_processed = rcs_hooks.refresh_files(
+            diff_cmds=[modified_files_cmd()])
+        end_time = get_clock()
+        logging.debug('Files processed: %s', files_processed)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return
+
     # Check if git is available.
     check_for_cmd(cmd=['git', '--version'])
 
@@ -366,19 +418,42 @@ def post_merge():
     files = get_modified_files()
     logging.debug('Modified file list: %s', files)
 
+    # Only files handled by the rcs-keywords filter need to be expanded
+    files = rcs_keywords.filter_managed_files(files=files)
+
+    # Skip the files known not to hold any keyword
+    files = rcs_keywords.filter_keyword_files(files=files)
+
     # Filter the list of modified files to exclude those modified since
     # the commit
     files = remove_modified_files(files=files)
 
     # Process the remaining file list
     files_processed = 0
+    files_rewritten = []
+    git_dir = rcs_keywords.find_git_dir()
     if files:
         files.sort()
-        for file_name in files:
-            check_out_file(file_name=file_name)
+        # Re-expand the keywords in place on a pool of threads when the
+        # offset index recorded by the smudge filter still matches the
+        # file and its blob in the index.  The results are given in the
+        # order of the files.
+        for (file_name, refreshed) in \
+                rcs_keywords.refresh_keywords_parallel(
+                    file_names=files,
+                    git_dir=git_dir,
+                    workers=rcs_keywords.HOOK_WORKERS):
+            if refreshed:
+                files_rewritten.append(file_name)
+            else:
+                check_out_file(file_name=file_name)
             files_processed += 1
             sys.stderr.write('Smudged file %s\n' % file_name)
             logging.info('Checked out file %s', file_name)
+
+    # Bring the index stat data of the files rewritten in place up to date
+    # so that the next git status does not clean each of them again
+    rcs_keywords.refresh_index_stat(file_names=files_rewritten)
     logging.debug('Files processed: %s', files_processed)
 
     end_time = get_clock()
@@ -0,0 +1,2041 @@
+#! /usr/bin/env python
+# # -*- coding: utf-8 -*
+
+"""
+rcs-filter
+
+This module holds the code run by the git RCS keyword filters for every
+file: the keyword matchers, the clean and smudge caches, the keyword
+offset index and the lookup of the commit information in the caches and
+the path index.  Git starts a filter process for each file it checks out
+or stages, so the module only imports what those processes always need.
+The history walk, the object database reader and the code of the event
+hooks are kept in rcs_keywords, which the filters only import when a
+lookup misses, and the modules used to talk to the keyword service are
+only imported while it runs.
+"""
+
+import sys
+import os
+import errno
+import stat
+import io
+import re
+import struct
+import hashlib
+import codecs
+import threading
+import logging
+
+__author__ = "David Rotthoff"
+__email__ = "drotthoff@gmail.com"
+__project__ = "git-rcs-keywords"
+__version__ = "1.1.1-19"
+__date__ = "2021-02-07 10:51:24"
+__credits__ = []
+__status__ = "Production"
+
+# Conditionally map a time function for performance measurement
+# depending on the version of Python used
+if sys.version_info.major >= 3 and sys.version_info.minor >= 3:
+    from time import perf_counter as get_clock
+else:
+    from time import clock as get_clock
+
+# NumPy is optional, it is used to locate the lines of a buffer which may
+# hold keywords.  It is only imported once a buffer is large enough to use
+# it, see load_numpy.
+numpy = None
+NUMPY_IMPORTED = False
+
+# Name of the folder within the git directory holding the keyword data
+KEYWORD_DIR = 'rcs-keywords'
+
+# Error handler used to round trip path names which are not valid UTF-8
+PATH_ERRORS = 'surrogateescape' if sys.version_info.major >= 3 else 'strict'
+
+# Define the fields to be extracted from the commit log
+GIT_FIELD_NAME = [
+    'hash',
+    'author_name',
+    'author_email',
+    'commit_date',
+    'short_hash'
+]
+GIT_FIELD_LOG = [
+    '%H',
+    '%an',
+    '%ae',
+    '%ci',
+    '%h'
+]
+
+# Keyword expansion names in the order the filters substitute them.  The
+# position of a name in the list is the keyword id stored in the offset
+# index so the order must only ever be appended to.
+KEYWORD_KEYS = [
+    'git_author',
+    'git_id',
+    'git_date',
+    'git_source',
+    'git_file',
+    'git_revision',
+    'git_rev',
+    'git_hash'
+]
+
+# Map the keyword names found in a file to their expansion names and
+# list the commit log fields each expansion depends on
+KEYWORD_NAMES = [
+    ('Author', 'git_author'),
+    ('Id', 'git_id'),
+    ('Date', 'git_date'),
+    ('Source', 'git_source'),
+    ('File', 'git_file'),
+    ('Revision', 'git_revision'),
+    ('Rev', 'git_rev'),
+    ('Hash', 'git_hash')
+]
+KEYWORD_FIELDS = {
+    'git_author': ['author_name', 'author_email'],
+    'git_id': ['commit_date', 'author_name'],
+    'git_date': ['commit_date'],
+    'git_source': [],
+    'git_file': [],
+    'git_revision': ['commit_date'],
+    'git_rev': ['commit_date'],
+    'git_hash': ['hash', 'short_hash']
+}
+
+# Find the keyword names which could be matched by the filter expressions.
+# Each name is captured by a group named after its expansion, as case
+# insensitive matching accepts more spellings than lowercasing would map.
+# Revision is listed before Rev so that the longer name is found.
+KEYWORD_NAME_PATTERN = r'\$(?:%s)(?=[:$])' % '|'.join(
+    '(?P<%s>%s)' % (key, name) for (name, key) in KEYWORD_NAMES)
+KEYWORD_NAME_REGEX = re.compile(KEYWORD_NAME_PATTERN, re.IGNORECASE)
+KEYWORD_NAME_BYTES_REGEX = re.compile(KEYWORD_NAME_PATTERN.encode('ascii'),
+                                      re.IGNORECASE)
+
+# Find the collapsed keywords left after the clean filter
+COLLAPSED_KEYWORD_REGEX = re.compile(
+    r"\$(?:Author|Id|Date|Source|File|Revision|Rev|Hash)\$",
+    re.IGNORECASE)
+
+# Find the collapsed keywords by expansion name, so that a line holding
+# nothing else is expanded in a single pass
+COLLAPSED_KEYWORD_NAME_REGEX = re.compile(r'\$(?:%s)\$' % '|'.join(
+    '(?P<%s>%s)' % (key, name) for (name, key) in KEYWORD_NAMES),
+    re.IGNORECASE)
+KEYWORD_IDS = dict((key, keyword_id)
+                   for (keyword_id, key) in enumerate(KEYWORD_KEYS))
+
+# Limits of the clean filter result cache.  Files larger than the maximum
+# are never cached so the cache size is bounded by the entry count.  Files
+# smaller than the minimum are scanned within a millisecond or two, which
+# the cache does not save measurably, see benchmarks/bench-clean-cache.py.
+CLEAN_CACHE_ENTRIES = 4096
+CLEAN_CACHE_MIN_FILE = 64 * 1024
+CLEAN_CACHE_MAX_FILE = 1024 * 1024
+
+# Limits of the smudge filter output cache
+SMUDGE_CACHE_ENTRIES = 4096
+SMUDGE_CACHE_MAX_FILE = 1024 * 1024
+
+# The caches count their entries on one write in CACHE_EVICTION_SAMPLE, at
+# random, rather than listing the cache folder on every write
+CACHE_EVICTION_SAMPLE = 64
+
+# Limit of the commit information cache shared by the filter and hook
+# processes.  Its entries are keyed by the commit HEAD points at and the
+# file name so that they are never stale.
+METADATA_CACHE_ENTRIES = 16384
+
+# Layout of a cache entry header holding the SHA-1 of the payload and of
+# the clean filter entry header holding the stat data and input SHA-1
+CACHE_MAGIC = b'RKC1'
+CACHE_HEADER = struct.Struct('<4s20s')
+CLEAN_HEADER = struct.Struct('<Qqq20s')
+SMUDGE_HEADER = struct.Struct('<I')
+
+# Optional per user keyword service, see rcs-keywords-daemon.py.  The
+# filters and hooks hand their work to it while its socket exists and
+# fall back to doing the work themselves.  Files too large for the clean
+# and smudge caches are always handled by the filters.  The service keeps
+# the commit information of up to DAEMON_MEMORY_LIMIT bytes for all
+# repositories and stops after DAEMON_IDLE_TIMEOUT seconds without work.
+# Requests taking longer than DAEMON_TIMEOUT seconds are abandoned.
+DAEMON_SOCKET_NAME = 'rcs-keywords-%s'
+DAEMON_HEADER_LIMIT = 1024 * 1024
+DAEMON_MEMORY_LIMIT = 64 * 1024 * 1024
+DAEMON_IDLE_TIMEOUT = 15 * 60
+DAEMON_TIMEOUT = 60
+
+# Buffers of at least VECTOR_SCAN_MIN_SIZE bytes are scanned with NumPy,
+# when it is installed, for the lines which may hold keywords so that only
+# those lines are decoded and matched.  The scan is limited to encodings in
+# which a $ or newline byte is always that character.
+VECTOR_SCAN = True
+VECTOR_SCAN_MIN_SIZE = 64 * 1024
+VECTOR_SCAN_ENCODINGS = ['utf-8', 'ascii', 'iso8859-1', 'iso8859-15',
+                         'cp1252']
+
+# First two bytes of the keyword names after the $, lowercased by setting
+# bit 0x20.  Case insensitive matching also accepts the dotted and dotless
+# i and the long s, whose UTF-8 encodings start with 0xc4 and 0xc5, so a
+# name starting with either byte is always a candidate.
+KEYWORD_PAIRS = [b'au', b'id', b'da', b'so', b'fi', b're', b'ha', b'f\xe4']
+KEYWORD_WIDE_INITIALS = b'\xe4\xe5'
+
+# Layout of a keyword offset index record.  The header holds the size,
+# modification time (nanoseconds, -1 when unknown) and SHA-1 digest of the
+# working tree file, the hexadecimal id of the blob it was expanded from
+# followed by the span count.  Each span holds the byte offset, byte length
+# and keyword id of an expanded keyword.
+OFFSET_MAGIC = b'RKO3'
+OFFSET_HEADER = struct.Struct('<4sQq20s40sI')
+OFFSET_SPAN = struct.Struct('<QIB')
+
+
+def get_encoding():
+    """Return the text encoding used when the filters write a file
+
+    Returns:
+        Name of the encoding
+    """
+    encoding = getattr(sys.stdout, 'encoding', None)
+    if not encoding:
+        import locale
+        encoding = locale.getpreferredencoding(False) or 'utf-8'
+    return encoding
+
+
+class AppendLog(object):
+    """Log file stream for logging.basicConfig which appends every record
+    with a single write to a file opened in append mode.  The records of
+    filter and hook processes logging at the same time then never
+    interleave, however long they are."""
+
+    def __init__(self, file_name):
+        self.fd = os.open(file_name,
+                          os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                          0o666)
+
+    def write(self, text):
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8', 'replace')
+        os.write(self.fd, text)
+
+    def flush(self):
+        pass
+
+
+class PrefixedReader(io.RawIOBase):
+    """Raw binary stream returning bytes already read from a stream
+    followed by the remainder of that stream"""
+
+    def __init__(self, prefix, stream):
+        io.RawIOBase.__init__(self)
+        self.prefix = memoryview(prefix)
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.prefix:
+            count = min(len(buffer), len(self.prefix))
+            buffer[:count] = self.prefix[:count]
+            self.prefix = self.prefix[count:]
+            return count
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def text_stream(raw_stream, encoding=None, errors=None):
+    """Wrap a binary stream to decode it the same way as sys.stdin
+
+    Arguments:
+        raw_stream -- The binary stream to wrap
+        encoding -- The text encoding, default of None uses sys.stdin's
+        errors -- The decoding error handler, default of None uses
+                  sys.stdin's
+
+    Returns:
+        A text stream
+    """
+    # sys.stdin only translates line endings on Windows
+    if os.name == 'nt':
+        newline = None
+    else:
+        newline = '\n'
+    if not isinstance(raw_stream, io.BufferedIOBase):
+        raw_stream = io.BufferedReader(raw_stream)
+    return io.TextIOWrapper(raw_stream,
+                            encoding=encoding or sys.stdin.encoding,
+                            errors=errors or sys.stdin.errors,
+                            newline=newline)
+
+
+def blob_id(data):
+    """Calculate the git object id of a blob
+
+    Arguments:
+        data -- The contents of the blob
+
+    Returns:
+        The hexadecimal object id
+    """
+    header = ('blob %d' % len(data)).encode('ascii') + b'\0'
+    return hashlib.sha1(header + data).hexdigest()
+
+
+def find_git_dir():
+    """Locate the git directory of the repository being processed
+    without starting a git process where possible.
+
+    Git runs both the filters and the hooks from the top of the
+    working tree so the .git entry in the current directory is used
+    unless git supplied the location in the environment.
+
+    Returns:
+        The git directory path or None if it could not be found
+    """
+    git_dir = os.environ.get('GIT_DIR')
+    if git_dir:
+        return git_dir
+
+    if os.path.isdir('.git'):
+        return '.git'
+
+    # Submodules and linked worktrees use a .git file pointing at the
+    # real git directory
+    if os.path.isfile('.git'):
+        with open('.git', 'r') as git_file:
+            for line in git_file:
+                if line.startswith('gitdir:'):
+                    return line.split(':', 1)[1].strip()
+
+    # Git is only asked when the filter does not run at the top level
+    import subprocess
+    try:
+        cmd_handle = subprocess.Popen(['git', 'rev-parse', '--git-dir'],
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE)
+        (cmd_stdout, _) = cmd_handle.communicate()
+    except OSError:
+        logging.info('Unable to execute git rev-parse', exc_info=True)
+        return None
+    if cmd_handle.returncode != 0:
+        return None
+    return cmd_stdout.strip().decode('utf-8')
+
+
+def keyword_path(git_dir, *names):
+    """Build a path below the rcs-keywords folder of the git directory
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        names -- Path components below the rcs-keywords folder
+
+    Returns:
+        The joined path name
+    """
+    return os.path.join(git_dir, KEYWORD_DIR, *names)
+
+
+def write_atomic(file_name, data):
+    """Replace the contents of a file so that concurrent readers see
+    either the old or the new contents but never a partial write.
+
+    Arguments:
+        file_name -- The file to be written
+        data -- The bytes to write
+
+    Returns:
+        Nothing
+    """
+    dir_name = os.path.dirname(file_name)
+    try:
+        os.makedirs(dir_name)
+    except OSError as err:
+        if err.errno != errno.EEXIST:
+            raise
+    # The thread id keeps apart the writers of the same process
+    temp_name = '%s.%d.%d.tmp' % (file_name,
+                                  os.getpid(),
+                                  threading.current_thread().ident)
+    with open(temp_name, 'wb') as temp_file:
+        temp_file.write(data)
+    os.rename(temp_name, file_name)
+
+
+def remove_file(file_name):
+    """Remove a file, ignoring a file that does not exist
+
+    Arguments:
+        file_name -- The file to be removed
+
+    Returns:
+        Nothing
+    """
+    try:
+        os.remove(file_name)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+
+
+def encode_path(file_name):
+    """Encode a path name given to or read from git.  Names which are not
+    valid UTF-8 keep their original bytes, see decode_path.
+
+    Arguments:
+        file_name -- The path name
+
+    Returns:
+        The path name bytes
+    """
+    return file_name.encode('utf-8', PATH_ERRORS)
+
+
+def decode_path(data):
+    """Decode a path name written by git.  Bytes which are not valid UTF-8
+    are mapped to surrogates, as Python does for the command line and the
+    os functions, so that the name still opens the file.
+
+    Arguments:
+        data -- The path name bytes
+
+    Returns:
+        The path name
+    """
+    return data.decode('utf-8', PATH_ERRORS)
+
+
+def cache_entry_path(git_dir, cache_name, key):
+    """Calculate the file name of a cache entry
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        cache_name -- Name of the cache holding the entry
+        key -- The entry key
+
+    Returns:
+        Path name of the cache entry
+    """
+    digest = hashlib.sha1(encode_path(key)).hexdigest()
+    return keyword_path(git_dir, cache_name, digest)
+
+
+def read_cache_entry(git_dir, cache_name, key):
+    """Fetch the payload of a cache entry and mark it as recently used
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        cache_name -- Name of the cache holding the entry
+        key -- The entry key
+
+    Returns:
+        The payload bytes or None if the entry is missing or damaged
+    """
+    entry_name = cache_entry_path(git_dir, cache_name, key)
+    try:
+        with open(entry_name, 'rb') as entry:
+            data = entry.read()
+    except (IOError, OSError):
+        return None
+
+    if len(data) < CACHE_HEADER.size:
+        return None
+    (magic, digest) = CACHE_HEADER.unpack_from(data)
+    payload = data[CACHE_HEADER.size:]
+    if magic != CACHE_MAGIC or hashlib.sha1(payload).digest() != digest:
+        logging.info('Discarding damaged cache entry %s', entry_name)
+        remove_file(entry_name)
+        return None
+
+    # The modification time of the entry records its last use
+    try:
+        os.utime(entry_name, None)
+    except OSError:
+        pass
+    return payload
+
+
+def write_cache_entry(git_dir, cache_name, key, payload, max_entries):
+    """Store the payload of a cache entry, evicting the least recently
+    used entries once the cache holds more than the maximum.
+
+    Listing the cache takes time in proportion to its size, so the entry
+    count is only checked on a random sample of one write in
+    CACHE_EVICTION_SAMPLE.  The cache may then go over the maximum by
+    about that many entries before they are evicted.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        cache_name -- Name of the cache holding the entry
+        key -- The entry key
+        payload -- The bytes to store
+        max_entries -- Maximum number of entries kept in the cache
+
+    Returns:
+        Nothing
+    """
+    write_atomic(cache_entry_path(git_dir, cache_name, key),
+                 CACHE_HEADER.pack(CACHE_MAGIC,
+                                   hashlib.sha1(payload).digest()) + payload)
+
+    import random
+    if random.randrange(min(CACHE_EVICTION_SAMPLE, max_entries)):
+        return
+    cache_dir = keyword_path(git_dir, cache_name)
+    entry_names = os.listdir(cache_dir)
+    if len(entry_names) <= max_entries:
+        return
+
+    # Evict down to 90% of the limit so that eviction is not repeated on
+    # every following write
+    entries = []
+    for entry_name in entry_names:
+        entry_name = os.path.join(cache_dir, entry_name)
+        try:
+            entries.append((os.stat(entry_name).st_mtime, entry_name))
+        except OSError:
+            continue
+    entries.sort()
+    evict_count = len(entries) - max_entries * 9 // 10
+    logging.info('Evicting %d entries from cache %s', evict_count, cache_name)
+    for (_, entry_name) in entries[:evict_count]:
+        remove_file(entry_name)
+
+
+def read_clean_cache(git_dir, file_name, file_stat, data):
+    """Fetch the cached clean filter output of a working tree file
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        file_name -- The working tree path relative to the top level
+        file_stat -- Stat result of the working tree file
+        data -- The contents supplied by git to the clean filter
+
+    Returns:
+        The cleaned contents or None if no valid entry is cached
+    """
+    payload = read_cache_entry(git_dir=git_dir,
+                               cache_name='clean',
+                               key=file_name)
+    if payload is None or len(payload) < CLEAN_HEADER.size:
+        return None
+
+    (size, mtime_ns, inode, input_digest) = CLEAN_HEADER.unpack_from(payload)
+    if (size, mtime_ns, inode) != (file_stat.st_size,
+                                   get_mtime_ns(file_stat),
+                                   file_stat.st_ino):
+        logging.debug('Clean cache stat mismatch for %s', file_name)
+        return None
+
+    # Git may clean contents which differ from the working tree file so the
+    # input must match as well as the stat data
+    if hashlib.sha1(data).digest() != input_digest:
+        logging.debug('Clean cache content mismatch for %s', file_name)
+        return None
+    return payload[CLEAN_HEADER.size:]
+
+
+def write_clean_cache(git_dir, file_name, file_stat, data, output):
+    """Cache the clean filter output of a working tree file
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        file_name -- The working tree path relative to the top level
+        file_stat -- Stat result of the working tree file
+        data -- The contents supplied by git to the clean filter
+        output -- The cleaned contents
+
+    Returns:
+        Nothing
+    """
+    header = CLEAN_HEADER.pack(file_stat.st_size,
+                               get_mtime_ns(file_stat),
+                               file_stat.st_ino,
+                               hashlib.sha1(data).digest())
+    write_cache_entry(git_dir=git_dir,
+                      cache_name='clean',
+                      key=file_name,
+                      payload=header + output,
+                      max_entries=CLEAN_CACHE_ENTRIES)
+
+
+def smudge_cache_key(data, file_name, commit):
+    """Calculate the smudge cache key of a blob.
+
+    The expansions only depend on the path of the file and on the commit
+    which last changed it, so the key combines the blob id with both.
+    Looking the key up then needs no expansion values.
+
+    Arguments:
+        data -- The contents supplied by git to the smudge filter
+        file_name -- The working tree path relative to the top level
+        commit -- The id of the commit which last changed the file, empty
+                  if the keywords of the blob need no commit information
+
+    Returns:
+        The cache key
+    """
+    return '%s\0%s\0%s' % (blob_id(data), file_name, commit)
+
+
+def read_smudge_cache(git_dir, cache_key):
+    """Fetch the cached smudge filter output of a blob
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        cache_key -- The key returned by smudge_cache_key
+
+    Returns:
+        An (output, spans) tuple or None if the blob is not cached.  The
+        spans hold the (byte offset, byte length, keyword id) of the
+        expanded keywords within the output.
+    """
+    payload = read_cache_entry(git_dir=git_dir,
+                               cache_name='smudge',
+                               key=cache_key)
+    if payload is None or len(payload) < SMUDGE_HEADER.size:
+        return None
+    (count,) = SMUDGE_HEADER.unpack_from(payload)
+    output_start = SMUDGE_HEADER.size + count * OFFSET_SPAN.size
+    if len(payload) < output_start:
+        return None
+    spans = [OFFSET_SPAN.unpack_from(payload, SMUDGE_HEADER.size +
+                                     position * OFFSET_SPAN.size)
+             for position in range(count)]
+    return (payload[output_start:], spans)
+
+
+def write_smudge_cache(git_dir, cache_key, output, spans):
+    """Cache the smudge filter output of a blob
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        cache_key -- The key returned by smudge_cache_key
+        output -- The smudged contents
+        spans -- List of (byte offset, byte length, keyword id) tuples
+
+    Returns:
+        Nothing
+    """
+    payload = [SMUDGE_HEADER.pack(len(spans))]
+    payload.extend(OFFSET_SPAN.pack(*span) for span in spans)
+    payload.append(output)
+    write_cache_entry(git_dir=git_dir,
+                      cache_name='smudge',
+                      key=cache_key,
+                      payload=b''.join(payload),
+                      max_entries=SMUDGE_CACHE_ENTRIES)
+
+
+def read_head_commit(git_dir):
+    """Read the commit HEAD points at without starting a git process
+
+    Arguments:
+        git_dir -- The git directory of the repository
+
+    Returns:
+        The commit id or None if HEAD is unborn or could not be read
+    """
+    try:
+        with open(os.path.join(git_dir, 'HEAD'), 'rb') as head_file:
+            head = head_file.read().decode('utf-8').strip()
+    except (IOError, OSError, UnicodeDecodeError):
+        return None
+
+    if head.startswith('ref: '):
+        ref_name = head[5:].strip()
+
+        # Linked worktrees keep their branches in the common git directory
+        common_dir = git_dir
+        try:
+            with open(os.path.join(git_dir, 'commondir'), 'r') as common:
+                common_dir = os.path.join(git_dir, common.read().strip())
+        except (IOError, OSError):
+            pass
+
+        head = None
+        try:
+            with open(os.path.join(common_dir, ref_name), 'rb') as ref_file:
+                head = ref_file.read().decode('utf-8').strip()
+        except (IOError, OSError, UnicodeDecodeError):
+            try:
+                with open(os.path.join(common_dir, 'packed-refs'),
+                          'rb') as packed:
+                    for line in packed:
+                        fields = line.decode('utf-8').split()
+                        if len(fields) == 2 and fields[1] == ref_name:
+                            head = fields[0]
+                            break
+            except (IOError, OSError, UnicodeDecodeError):
+                return None
+
+    if head is None or len(head) not in (40, 64) or \
+            head.strip('0123456789abcdef'):
+        return None
+    return head
+
+
+def shared_git_log(git_field_log, file_name, git_field_name):
+    """Function to dump the git log associated with the provided file name
+    through the commit information cache shared by every filter and hook
+    process, so that each file is only looked up once per commit.  A file
+    of a commit without a path index is looked up by the history walk
+    shared with the other filter processes, see share_history_walk.
+
+    Arguments:
+        git_field_log -- a list of git log fields to capture
+        file_name -- The full file name to be examined
+        git_field_name -- Name of the attributes fields for the dictionary
+
+    Returns:
+        git_log -- List of defined attribute dictionaries
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_name: %s', file_name)
+
+    git_dir = find_git_dir()
+    head = None
+    if git_dir is not None:
+        head = read_head_commit(git_dir=git_dir)
+    if head is None:
+        import rcs_keywords
+        end_time = get_clock()
+        logging.info('Commit information of %s is not shared', file_name)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return rcs_keywords.git_log_attributes(git_field_log=git_field_log,
+                                               file_name=file_name,
+                                               git_field_name=git_field_name)
+
+    key = '%s\0%s' % (head, file_name)
+    try:
+        payload = read_cache_entry(git_dir=git_dir,
+                                   cache_name='metadata',
+                                   key=key)
+    except (IOError, OSError):
+        payload = None
+    if payload is not None:
+        git_log = [dict(zip(GIT_FIELD_NAME, row.split('\x1f')))
+                   for row in payload.decode('utf-8').split('\x1e') if row]
+        end_time = get_clock()
+        logging.debug('git_log: %s', git_log)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return git_log
+
+    # Every field is fetched so that later requests for other keywords
+    # are answered from the same entry.  The path index answers without
+    # git once it has been built, the history code of rcs_keywords is only
+    # loaded when it does not.
+    git_log = lookup_path_index(git_dir=git_dir,
+                                head=head,
+                                file_name=file_name)
+    if git_log is None:
+        import rcs_keywords
+        if rcs_keywords.share_history_walk(git_dir=git_dir, head=head):
+            git_log = lookup_path_index(git_dir=git_dir,
+                                        head=head,
+                                        file_name=file_name)
+        if git_log is None:
+            git_log = rcs_keywords.git_log_attributes(
+                git_field_log=GIT_FIELD_LOG,
+                file_name=file_name,
+                git_field_name=GIT_FIELD_NAME)
+    payload = '\x1e'.join('\x1f'.join(row.get(field_name, '')
+                                      for field_name in GIT_FIELD_NAME)
+                          for row in git_log[:1])
+    try:
+        write_cache_entry(git_dir=git_dir,
+                          cache_name='metadata',
+                          key=key,
+                          payload=payload.encode('utf-8'),
+                          max_entries=METADATA_CACHE_ENTRIES)
+    except (IOError, OSError):
+        logging.info('Unable to update the commit information cache',
+                     exc_info=True)
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return git_log
+
+
+def escape_index_field(data):
+    """Escape the bytes of a path index field so that it holds no tab
+    or line feed
+
+    Arguments:
+        data -- The field as bytes
+
+    Returns:
+        The escaped bytes
+    """
+    return data.replace(b'\\', b'\\\\').replace(b'\t', b'\\t') \
+        .replace(b'\n', b'\\n')
+
+
+def unescape_index_field(data):
+    """Restore the bytes of an escaped path index field
+
+    Arguments:
+        data -- The escaped bytes
+
+    Returns:
+        The field as bytes
+    """
+    return re.sub(br'\\(.)',
+                  lambda match: {b't': b'\t',
+                                 b'n': b'\n'}.get(match.group(1),
+                                                  match.group(1)),
+                  data)
+
+
+def decode_index_record(record):
+    """Turn the escaped record of a path index line into a git log row
+
+    Arguments:
+        record -- The escaped record as bytes
+
+    Returns:
+        The git_log_attributes row, or None when it is unknown
+    """
+    if not record:
+        return None
+    return dict(zip(GIT_FIELD_NAME,
+                    unescape_index_field(record).decode('utf-8')
+                    .split('\x1f')))
+
+
+def read_path_journal(git_dir, journal_name=None):
+    """Read the complete blocks of the path index journal.  Each block
+    moves the index from one commit to the next and lists the files whose
+    commit information changed.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        journal_name -- The journal file, default of None uses the journal
+                        of the repository
+
+    Returns:
+        A list of (commit before, commit after, changes) tuples, the
+        changes mapping each escaped path to its escaped record
+    """
+    journal_name = journal_name or \
+        keyword_path(git_dir, 'path-index', 'journal')
+    try:
+        with open(journal_name, 'rb') as journal:
+            data = journal.read()
+    except (IOError, OSError):
+        return []
+
+    # A block written partially by an interrupted hook has no end line
+    blocks = []
+    block = None
+    for line in data.split(b'\n'):
+        if line.startswith(b'B '):
+            fields = line.split(b' ')
+            block = None
+            if len(fields) == 3:
+                block = (fields[1].decode('ascii'),
+                         fields[2].decode('ascii'),
+                         {})
+        elif line.startswith(b'E ') and block is not None:
+            if line[2:].decode('ascii') == block[1]:
+                blocks.append(block)
+            block = None
+        elif block is not None and b'\t' in line:
+            (path, record) = line.split(b'\t', 1)
+            block[2][path] = record
+    return blocks
+
+
+def index_node_path(git_dir, node_hash):
+    """Build the path of a path index node
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        node_hash -- The hex SHA-1 of the node contents
+
+    Returns:
+        The file name of the node
+    """
+    return keyword_path(git_dir, 'path-index', 'nodes',
+                        node_hash[:2], node_hash[2:])
+
+
+def read_index_node(git_dir, node_hash):
+    """Read the entries of a path index node.  A node holds the entries of
+    one directory: the escaped record of each file, prefixed with F, and
+    the node of each subdirectory, prefixed with D.  Each record is stored
+    once at the start of the node, the files refer to it by its position.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        node_hash -- The hex SHA-1 of the node contents, None for an empty
+                     directory
+
+    Returns:
+        A dictionary of the value of each escaped name
+    """
+    entries = {}
+    if not node_hash:
+        return entries
+    records = []
+    with open(index_node_path(git_dir, node_hash), 'rb') as node:
+        for line in node.read().split(b'\n'):
+            (name, _, value) = line.partition(b'\t')
+            if not name:
+                records.append(value)
+            elif value[:1] == b'F':
+                entries[name] = b'F' + records[int(value[1:])]
+            elif value:
+                entries[name] = value
+    return entries
+
+
+def read_index_root(git_dir, commit):
+    """Find the path index node of the top level directory at a commit
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        commit -- The commit id
+
+    Returns:
+        The hex SHA-1 of the node, an empty string when the index of the
+        commit is empty, or None when the commit has no index
+    """
+    try:
+        with open(keyword_path(git_dir, 'path-index', 'roots', commit),
+                  'rb') as root:
+            return root.read().decode('ascii').strip()
+    except (IOError, OSError, UnicodeDecodeError):
+        return None
+
+
+def resolve_path_index(git_dir, commit, blocks):
+    """Find how the path index of a commit is made up: the commit with an
+    index node reached by following the journal blocks back, and the
+    changes of those blocks
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        commit -- The commit id
+        blocks -- The blocks of the journal
+
+    Returns:
+        A (node hash, changes) tuple with the changes of the newest block
+        first, or None when the commit has no index
+    """
+    block_after = dict((block[1], block) for block in blocks)
+    changes = []
+    while len(changes) <= len(blocks):
+        node_hash = read_index_root(git_dir=git_dir, commit=commit)
+        if node_hash is not None:
+            return (node_hash, changes)
+        if commit not in block_after:
+            return None
+        (commit, _, block_changes) = block_after[commit]
+        changes.append(block_changes)
+    return None
+
+
+def lookup_path_index(git_dir, head, file_name):
+    """Look up the commit information of a file in the path index
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        head -- The commit HEAD points at
+        file_name -- The path relative to the top level
+
+    Returns:
+        The git_log_attributes result, or None if the path index does not
+        know the file at this commit
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_name: %s', file_name)
+
+    if not os.path.isdir(keyword_path(git_dir, 'path-index', 'roots')):
+        return None
+    index = resolve_path_index(git_dir=git_dir,
+                               commit=head,
+                               blocks=read_path_journal(git_dir=git_dir))
+    if index is None:
+        return None
+
+    key = escape_index_field(encode_path(file_name))
+    record = None
+    for block_changes in index[1]:
+        if key in block_changes:
+            record = block_changes[key]
+            break
+    if record is None:
+        # Descend the nodes of the directories of the file
+        value = b'D' + index[0].encode('ascii')
+        try:
+            for name in key.split(b'/'):
+                if value[:1] != b'D' or len(value) == 1:
+                    value = b''
+                    break
+                value = read_index_node(git_dir=git_dir,
+                                        node_hash=value[1:].decode('ascii'))
+                value = value.get(name, b'')
+        except (IOError, OSError):
+            logging.info('Unable to read the path index', exc_info=True)
+            return None
+        record = value[1:] if value[:1] == b'F' else b''
+    row = decode_index_record(record)
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return None if row is None else [row]
+
+
+def build_regex_dict(git_field_log, file_name, git_field_name,
+                     keywords=None, cwd=None, git_dir=None, git_log=None):
+    """Function to converts a 1 row list of git log attributes into
+    dictionary of regex expressions.
+
+    Arguments:
+        git_field_log -- a list of git log fields to capture
+        file_name -- The full file name to be examined
+        git_field_name -- Name of the attributes fields for the dictionary
+        keywords -- The keyword names (see KEYWORD_KEYS) to resolve.
+                    Default of None resolves every keyword.
+        cwd -- The working tree top level, default of None uses the
+               current directory
+        git_dir -- The git directory, default of None lets git find it
+        git_log -- The commit information of the file when it has already
+                   been looked up, see batch_git_log
+
+    Returns:
+        regex_dict -- Array of defined attribute dictionaries
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('git_field_log %s', git_field_log)
+    logging.debug('file_name: %s', file_name)
+    logging.debug('git_field_name: %s', git_field_name)
+    logging.debug('keywords: %s', keywords)
+
+    if keywords is None:
+        keywords = KEYWORD_KEYS
+
+    # Only ask git for the fields needed by the requested keywords and do
+    # not call git at all if the keywords only need the file name
+    field_names = set()
+    for key in keywords:
+        field_names.update(KEYWORD_FIELDS.get(key, []))
+    git_fields = [(field_log, field_name)
+                  for (field_log, field_name) in zip(git_field_log,
+                                                     git_field_name)
+                  if field_name in field_names]
+    if git_log is not None:
+        logging.debug('Commit information supplied by the caller')
+    elif git_fields and cwd is None and git_dir is None:
+        git_log = shared_git_log(
+            git_field_log=[field_log for (field_log, _) in git_fields],
+            file_name=file_name,
+            git_field_name=[field_name for (_, field_name) in git_fields])
+    elif git_fields:
+        import rcs_keywords
+        git_log = rcs_keywords.git_log_attributes(
+            git_field_log=[field_log for (field_log, _) in git_fields],
+            file_name=file_name,
+            git_field_name=[field_name for (_, field_name) in git_fields],
+            cwd=cwd,
+            git_dir=git_dir)
+    else:
+        logging.debug('No commit information required')
+        git_log = None
+
+    logging.debug('git_log %s', git_log)
+
+    regex_dict = {}
+    if git_log or git_log is None:
+        logging.debug('Calculating regex dictionary')
+        # Calculate the replacement strings based on the git log results
+        git_row = dict(git_log[0]) if git_log else {}
+        # Deal with values in author name that have a Windows domain name
+        if '\\' in git_row.get('author_name', ''):
+            git_row['author_name'] = \
+                git_row['author_name'].split('\\')[-1]
+
+        regex_dict['git_hash'] = \
+            '$Hash:     %s $' % str(git_row.get('hash'))
+        regex_dict['git_short_hash'] = \
+            '$Short Hash:     %s $' % str(git_row.get('short_hash'))
+        regex_dict['git_author'] =\
+            '$Author:   %s <%s> $' % (str(git_row.get('author_name')),
+                                      str(git_row.get('author_email')))
+        regex_dict['git_date'] = \
+            '$Date:     %s $' % str(git_row.get('commit_date'))
+        regex_dict['git_rev'] = \
+            '$Rev:      %s $' % str(git_row.get('commit_date'))
+        regex_dict['git_revision'] = \
+            '$Revision: %s $' % str(git_row.get('commit_date'))
+        regex_dict['git_file'] = \
+            '$File:     %s $' % str(file_name)
+        regex_dict['git_source'] = \
+            '$Source:   %s $' % str(file_name)
+        regex_dict['git_id'] = \
+            '$Id:       %s | %s | %s $' % (str(file_name),
+                                           str(git_row.get('commit_date')),
+                                           str(git_row.get('author_name')))
+
+    else:
+        logging.debug('Building empty regex dictionary')
+
+        # Build a empty keyword list if no source data was found
+        # Note: the unusual means of building the list is to keep
+        #       the code from being modified while using keywords!
+        regex_dict['git_hash'] = '$%s$' % 'Hash'
+        regex_dict['git_author'] = '$%s$' % 'Author'
+        regex_dict['git_date'] = '$%s$' % 'Date'
+        regex_dict['git_rev'] = '$%s$' % 'Rev'
+        regex_dict['git_revision'] = '$%s$' % 'Revision'
+        regex_dict['git_file'] = '$%s$' % 'File'
+        regex_dict['git_source'] = '$%s$' % 'Source'
+        regex_dict['git_id'] = '$%s$' % 'Id'
+
+    # Drop the values of the keywords that were not requested as their
+    # commit fields may not have been fetched
+    if 'git_hash' in keywords and 'git_short_hash' in regex_dict:
+        keywords = list(keywords) + ['git_short_hash']
+    regex_dict = dict((key, value) for (key, value) in regex_dict.items()
+                      if key in keywords)
+
+    # Log the results of the build regex dictionary operation
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+    return regex_dict
+
+
+def resolve_keywords(regex_dict, keywords, file_name):
+    """Extend the substitution values of a file with keywords that have
+    not been resolved yet.
+
+    Keywords which only need the file name are resolved without calling
+    git.  Once commit information is needed every keyword is resolved so
+    that git is called at most once per file.
+
+    Arguments:
+        regex_dict -- The substitution values resolved so far
+        keywords -- The keyword names (see KEYWORD_KEYS) required
+        file_name -- The full file name to be examined
+
+    Returns:
+        The substitution values covering the required keywords
+    """
+    if keywords.issubset(regex_dict):
+        return regex_dict
+    if any(KEYWORD_FIELDS[key] for key in keywords):
+        requested = None
+    else:
+        requested = keywords.union(regex_dict)
+    return build_regex_dict(git_field_log=GIT_FIELD_LOG,
+                            file_name=file_name,
+                            git_field_name=GIT_FIELD_NAME,
+                            keywords=requested)
+
+
+class KeywordMatcher(object):
+    r"""Linear time replacement for the regular expressions matching one
+    expanded or collapsed keyword.
+
+    The expressions used by the filters backtrack heavily on long lines
+    holding many spaces or | characters without a closing $.  The run and
+    word forms are matched with equivalent expressions which take the value
+    atomically: a lookahead captures the longest run of the value class
+    and a back reference consumes it, as the closing $ is never part of
+    the class.  The path and id forms always end at the last ' $' of the
+    line, so on a line holding an expanded keyword of these forms the
+    closing and the furthest start of a value are located once with
+    str.rfind and a single expression.  The matches and replacements are
+    the same as those of the expressions, apart from the replacement being
+    used literally.  The value forms are:
+
+        run  -- r'\$Name: +[class]+ +\$', the class holding a space
+        word -- r'\$Name: +\w+ +\$'
+        path -- r'\$Name: .+[.].+ \$'
+        id   -- r'\$Name: +.+ \| [class]+ \| .+ +\$'
+        any  -- r'\$Name:.*\$'
+
+    each followed by the collapsed r'|\$Name\$' alternative unless
+    collapsed is False.
+    """
+
+    def __init__(self, name, form, value_class=None, collapsed=True):
+        self.name = name
+        self.form = form
+        self.collapsed = collapsed
+        self.name_regex = re.compile(r'\$%s([:$])' % name, re.IGNORECASE)
+        self.prefix_regex = re.compile(r'\$%s:' % name, re.IGNORECASE)
+        self.collapsed_regex = None
+        if collapsed:
+            self.collapsed_regex = re.compile(r'\$%s\$' % name,
+                                              re.IGNORECASE)
+
+        # The value of the run form holds at least three characters of the
+        # class, starting and ending with a space, up to the closing $
+        if form == 'run':
+            value = r'(?= [%s][%s])(?=([%s]*))\1(?<= )\$' % (
+                (value_class,) * 3)
+        elif form == 'word':
+            value = r'(?=( +))\1(?=(\w+))\2(?=( +))\3\$'
+        elif form == 'any':
+            value = r'.*\$'
+        else:
+            value = None
+        self.regex = None
+        if value is not None:
+            pattern = r'\$%s:%s' % (name, value)
+            if collapsed:
+                pattern = r'\$%s(?:\$|:%s)' % (name, value)
+            self.regex = re.compile(pattern, re.IGNORECASE)
+
+        # The rightmost separator pair of an id value, the class run after
+        # the first separator stopping at the second one
+        if form == 'id':
+            self.separator_regex = re.compile(
+                r'.*(?= \| (?=[%s][%s])(?=([%s]*))\1(?<= )\| )' % (
+                    (value_class,) * 3),
+                re.IGNORECASE)
+
+    def closing_end(self, text):
+        """Calculate where a path or id value ending the furthest into a
+        line without newline would end.
+
+        Arguments:
+            text -- The line without newline
+
+        Returns:
+            A (closing position, limit) tuple.  A value starting at or
+            before limit ends at the closing position, otherwise there is
+            no match.
+        """
+        # Both forms end with the last ' $' of the line
+        closing = text.rfind(' $')
+        if closing < 0:
+            return (-1, -1)
+        if self.form == 'path':
+            # The value needs a '.' with a character on either side
+            dot = text.rfind('.', 0, max(closing - 1, 0))
+            return (closing + 2, dot - 2)
+
+        # The id value needs ' | ' [class]+ ' | ' and a character before
+        # the closing
+        match = self.separator_regex.match(text, 0, max(closing - 1, 0))
+        if match is None:
+            return (closing + 2, -1)
+        return (closing + 2, match.end() - 2)
+
+    def closing_matches(self, text, offset):
+        """Locate the path or id matches of a line without newline
+
+        Arguments:
+            text -- The line without newline
+            offset -- Offset of the text within the whole line
+
+        Returns:
+            A list of (start, end) offsets of the matches
+        """
+        matches = []
+        closing = None
+        match = self.name_regex.search(text)
+        while match is not None:
+            if match.group(1) == '$':
+                end = match.end() if self.collapsed else None
+            else:
+                if closing is None:
+                    closing = self.closing_end(text)
+                end = None
+                if text.startswith(' ', match.end()) and \
+                        closing[1] >= match.end():
+                    end = closing[0]
+            if end is None:
+                match = self.name_regex.search(text, match.start() + 1)
+                continue
+            matches.append((offset + match.start(), offset + end))
+            match = self.name_regex.search(text, end)
+        return matches
+
+    def matches(self, line):
+        """Locate every match in a line
+
+        Arguments:
+            line -- The line to process
+
+        Returns:
+            A list of (start, end) offsets of the matches in order
+        """
+        regex = self.regex
+        if regex is None and self.prefix_regex.search(line) is None:
+            regex = self.collapsed_regex
+        if regex is not None:
+            return [match.span() for match in regex.finditer(line)]
+
+        # No match can span a newline so each part is handled separately
+        matches = []
+        offset = 0
+        for text in line.split('\n'):
+            matches.extend(self.closing_matches(text, offset))
+            offset += len(text) + 1
+        return matches
+
+    def replace(self, repl, line):
+        """Replace every match in a line and report where they were
+
+        Arguments:
+            repl -- The replacement text, used literally
+            line -- The line to process
+
+        Returns:
+            A (line, matches) tuple holding the line after the replacements
+            and the (start, end) offsets of the matches in the line before
+            the replacements
+        """
+        matches = self.matches(line)
+        if len(matches) < 2:
+            if matches:
+                (start, end) = matches[0]
+                line = line[:start] + repl + line[end:]
+            return (line, matches)
+        parts = []
+        last = 0
+        for (start, end) in matches:
+            parts.append(line[last:start])
+            parts.append(repl)
+            last = end
+        parts.append(line[last:])
+        return (''.join(parts), matches)
+
+    def sub(self, repl, line):
+        """Replace every match in a line
+
+        Arguments:
+            repl -- The replacement text, used literally
+            line -- The line to process
+
+        Returns:
+            The line after the replacements
+        """
+        regex = self.regex
+        if regex is None and self.prefix_regex.search(line) is None:
+            regex = self.collapsed_regex
+            if regex is None:
+                return line
+        if regex is not None:
+            return regex.sub(repl.replace('\\', '\\\\'), line)
+        return self.replace(repl, line)[0]
+
+
+def smudge_matchers():
+    """Build the keyword matchers used to expand keywords
+
+    Returns:
+        Dictionary of KeywordMatcher by keyword name (see KEYWORD_KEYS)
+    """
+    return {
+        'git_author': KeywordMatcher(name='Author',
+                                     form='run',
+                                     value_class=r'.\w@<> '),
+        'git_id': KeywordMatcher(name='Id',
+                                 form='id',
+                                 value_class=r'-:\d '),
+        'git_date': KeywordMatcher(name='Date',
+                                   form='run',
+                                   value_class=r'-:\d '),
+        'git_source': KeywordMatcher(name='Source', form='path'),
+        'git_file': KeywordMatcher(name='File', form='path'),
+        'git_revision': KeywordMatcher(name='Revision',
+                                       form='run',
+                                       value_class=r'-:\d '),
+        'git_rev': KeywordMatcher(name='Rev',
+                                  form='run',
+                                  value_class=r'-:\d '),
+        'git_hash': KeywordMatcher(name='Hash', form='word')
+    }
+
+
+def clean_matchers():
+    """Build the keyword matchers used to collapse keywords
+
+    Returns:
+        List of (KeywordMatcher, collapsed keyword) tuples in the order
+        they are applied
+    """
+    # Note: the unusual means of building the collapsed keywords is to
+    #       keep the code from being modified while using keywords!
+    return [
+        (KeywordMatcher(name='Author', form='any', collapsed=False),
+         '$%s$' % 'Author'),
+        (KeywordMatcher(name='Id', form='id', value_class=r'-:\d '),
+         '$%s$' % 'Id'),
+        (KeywordMatcher(name='Date', form='run', value_class=r'-:\d '),
+         '$%s$' % 'Date'),
+        (KeywordMatcher(name='Source', form='path'),
+         '$%s$' % 'Source'),
+        (KeywordMatcher(name='File', form='path'),
+         '$%s$' % 'File'),
+        (KeywordMatcher(name='Revision', form='run', value_class=r'-:\d+ '),
+         '$%s$' % 'Revision'),
+        (KeywordMatcher(name='Rev', form='run', value_class=r'-:\d+ '),
+         '$%s$' % 'Rev'),
+        (KeywordMatcher(name='Hash', form='word'),
+         '$%s$' % 'Hash')
+    ]
+
+
+def clean_line(line, matchers):
+    """Collapse the keywords of a line
+
+    Arguments:
+        line -- The line to clean
+        matchers -- The keyword matchers built by clean_matchers
+
+    Returns:
+        A (line, keywords_found) tuple holding the cleaned line and whether
+        it holds a collapsed keyword
+    """
+    if line.count('$') < 2:
+        return (line, False)
+    for (matcher, collapsed) in matchers:
+        line = matcher.sub(collapsed, line)
+    return (line, COLLAPSED_KEYWORD_REGEX.search(line) is not None)
+
+
+def clean_data(data, matchers, input_codec, output_codec):
+    """Collapse the keywords of contents held in memory the same way as the
+    clean filter.
+
+    Arguments:
+        data -- The contents to clean
+        matchers -- The keyword matchers built by clean_matchers
+        input_codec -- The (encoding, errors) used to decode the input
+        output_codec -- The (encoding, errors) used to encode the output
+
+    Returns:
+        A (output, keywords_found) tuple holding the encoded output and
+        whether it holds a collapsed keyword
+    """
+    source = text_stream(io.BytesIO(data),
+                         encoding=input_codec[0],
+                         errors=input_codec[1])
+    output = []
+    keywords_found = False
+    for line in source:
+        (line, found) = clean_line(line=line, matchers=matchers)
+        keywords_found = keywords_found or found
+        output.append(line)
+    output = ''.join(output).encode(output_codec[0], output_codec[1])
+    return (output, keywords_found)
+
+
+def shift_keyword_spans(spans, matches, length):
+    """Move the expansions already made in a line past the replacements
+    of the next keyword.
+
+    Arguments:
+        spans -- List of (character offset, character length, keyword id)
+                 tuples of the earlier expansions, sorted by offset
+        matches -- The (start, end) offsets replaced in the line
+        length -- The length of the replacement
+
+    Returns:
+        The spans in the line after the replacements.  An expansion taken
+        in whole by a replacement is dropped and one partly overwritten is
+        left empty, which splice_keywords refuses.
+    """
+    shifted = []
+    delta = 0
+    position = 0
+    for (offset, span_length, keyword_id) in spans:
+        while position < len(matches) and matches[position][1] <= offset:
+            (start, end) = matches[position]
+            delta += length - (end - start)
+            position += 1
+        if position < len(matches) and \
+                matches[position][0] < offset + max(span_length, 1):
+            (start, end) = matches[position]
+            if span_length and start <= offset and \
+                    offset + span_length <= end:
+                continue
+            span_length = 0
+        shifted.append((offset + delta, span_length, keyword_id))
+    return shifted
+
+
+def smudge_line(line, regex_dict, matchers, file_name):
+    """Expand the keywords of a line, resolving their values as needed
+
+    Arguments:
+        line -- The line to expand
+        regex_dict -- The substitution values resolved so far
+        matchers -- The keyword matchers built by smudge_matchers
+        file_name -- The full file name being smudged
+
+    Returns:
+        A (line, regex_dict, spans) tuple holding the expanded line, the
+        substitution values covering its keywords and the (character
+        offset, character length, keyword id) spans of the expansions made
+        in the line, sorted by offset
+    """
+    dollars = line.count('$')
+    if dollars < 2:
+        return (line, regex_dict, [])
+
+    # A line whose $ signs all belong to distinct collapsed keywords is
+    # expanded in one pass when no value holds another keyword, as the
+    # expressions applied in turn then never match within the values
+    # already written
+    collapsed = list(COLLAPSED_KEYWORD_NAME_REGEX.finditer(line))
+    if collapsed and len(collapsed) * 2 == dollars:
+        parts = []
+        spans = []
+        position = 0
+        delta = 0
+        for match in collapsed:
+            key = match.lastgroup
+            if key not in regex_dict:
+                regex_dict = resolve_keywords(
+                    regex_dict=regex_dict,
+                    keywords=set(other.lastgroup for other in collapsed),
+                    file_name=file_name)
+            value = regex_dict[key]
+            if value.count('$') != 2:
+                break
+            (start, end) = match.span()
+            parts.append(line[position:start])
+            parts.append(value)
+            spans.append((start + delta, len(value), KEYWORD_IDS[key]))
+            delta += len(value) - (end - start)
+            position = end
+        else:
+            parts.append(line[position:])
+            return (''.join(parts), regex_dict, spans)
+
+    keywords = find_keyword_names(line)
+    if not keywords:
+        return (line, regex_dict, [])
+    regex_dict = resolve_keywords(regex_dict=regex_dict,
+                                  keywords=keywords,
+                                  file_name=file_name)
+
+    spans = []
+    for (keyword_id, key) in enumerate(KEYWORD_KEYS):
+        if key not in keywords:
+            continue
+        value = regex_dict[key]
+        (line, matches) = matchers[key].replace(value, line)
+        if not matches:
+            continue
+        if spans:
+            spans = shift_keyword_spans(spans=spans,
+                                        matches=matches,
+                                        length=len(value))
+        delta = 0
+        for (start, end) in matches:
+            spans.append((start + delta, len(value), keyword_id))
+            delta += len(value) - (end - start)
+        spans.sort()
+
+        # The keywords which follow in the order of substitution are also
+        # matched within the values just written.  A value holds another
+        # keyword only if it holds more than its own two $ signs.
+        added = None
+        if value.count('$') > 2:
+            added = find_keyword_names(value).difference(keywords)
+        if added:
+            keywords = keywords.union(added)
+            regex_dict = resolve_keywords(regex_dict=regex_dict,
+                                          keywords=keywords,
+                                          file_name=file_name)
+    return (line, regex_dict, spans)
+
+
+def keyword_byte_spans(line, encoded, spans, byte_count, encoding,
+                       errors='strict'):
+    """Convert the expansion spans of a smudged line to output bytes
+
+    Arguments:
+        line -- The line after the keyword substitutions were applied
+        encoded -- The line encoded for the output
+        spans -- The (character offset, character length, keyword id)
+                 spans returned by smudge_line
+        byte_count -- Byte offset of the line in the output
+        encoding -- The output text encoding
+        errors -- The output encoding error handler
+
+    Returns:
+        A list of (byte offset, byte length, keyword id) tuples
+    """
+    # Every character takes one byte when the lengths are the same
+    if len(encoded) == len(line):
+        return [(byte_count + offset, length, keyword_id)
+                for (offset, length, keyword_id) in spans]
+    return [(byte_count + len(line[:offset].encode(encoding, errors)),
+             len(line[offset:offset + length].encode(encoding, errors)),
+             keyword_id)
+            for (offset, length, keyword_id) in spans]
+
+
+def load_numpy():
+    """Import NumPy the first time it is needed
+
+    Returns:
+        The numpy module or None if it is not installed
+    """
+    global numpy, NUMPY_IMPORTED
+    if not NUMPY_IMPORTED:
+        NUMPY_IMPORTED = True
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+
+def vector_scan_usable(input_codec, output_codec, size):
+    """Check whether a buffer can be smudged with smudge_buffer
+
+    Arguments:
+        input_codec -- The (encoding, errors) used to decode the input
+        output_codec -- The (encoding, errors) used to encode the output
+        size -- The buffer size
+
+    Returns:
+        True if NumPy is available and the lines without keywords can be
+        copied to the output without decoding them
+    """
+    if not VECTOR_SCAN or os.name == 'nt' or size < VECTOR_SCAN_MIN_SIZE:
+        return False
+    if load_numpy() is None:
+        return False
+    try:
+        input_encoding = codecs.lookup(input_codec[0]).name
+        output_encoding = codecs.lookup(output_codec[0]).name
+    except (LookupError, TypeError):
+        return False
+    return input_encoding == output_encoding and \
+        input_encoding in VECTOR_SCAN_ENCODINGS and \
+        input_codec[1] == output_codec[1] and \
+        input_codec[1] in ('strict', 'surrogateescape')
+
+
+def candidate_line_spans(data):
+    """Locate the lines of a buffer which may hold a keyword using NumPy.
+    A keyword needs a $ followed by the start of a keyword name and
+    another $ at least three bytes later on the same line.
+
+    Arguments:
+        data -- The buffer to scan
+
+    Returns:
+        A list of (start, end) byte offsets of the lines, including their
+        newline
+    """
+    buffer = numpy.frombuffer(data, dtype=numpy.uint8)
+    dollars = numpy.flatnonzero(buffer == ord('$'))
+    if len(dollars) < 2:
+        return []
+    newlines = numpy.flatnonzero(buffer == ord('\n'))
+
+    # Find the $ which may open a keyword
+    last = len(buffer) - 1
+    first = buffer[numpy.minimum(dollars + 1, last)] | 0x20
+    second = buffer[numpy.minimum(dollars + 2, last)] | 0x20
+    pairs = first.astype(numpy.uint16) * 256 + second
+    known_pairs = [bytearray(pair)[0] * 256 + bytearray(pair)[1]
+                   for pair in KEYWORD_PAIRS]
+    wide_initials = numpy.frombuffer(KEYWORD_WIDE_INITIALS,
+                                     dtype=numpy.uint8)
+    openings = numpy.where(numpy.isin(pairs, known_pairs) |
+                           numpy.isin(first, wide_initials),
+                           dollars,
+                           len(buffer))
+
+    # Group the $ by line and compare the first opening $ of each line with
+    # its last $
+    lines = numpy.searchsorted(newlines, dollars)
+    breaks = numpy.flatnonzero(numpy.diff(lines)) + 1
+    firsts = numpy.concatenate(([0], breaks))
+    lasts = numpy.concatenate((breaks - 1, [len(dollars) - 1]))
+    first_openings = numpy.minimum.reduceat(openings, firsts)
+    candidates = lines[firsts[dollars[lasts] - first_openings >= 3]]
+
+    starts = numpy.concatenate(([0], newlines + 1))[candidates]
+    ends = numpy.concatenate((newlines + 1, [len(data)]))[candidates]
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def smudge_buffer(data, regex_dict, matchers, file_name, codec):
+    """Expand the keywords of a whole buffer.  Only the lines located by
+    candidate_line_spans are decoded and matched, the other lines are
+    copied as they are.  See vector_scan_usable for when this is possible.
+
+    Arguments:
+        data -- The contents to smudge
+        regex_dict -- The substitution values resolved so far
+        matchers -- The keyword matchers built by smudge_matchers
+        file_name -- The full file name being smudged
+        codec -- The (encoding, errors) of both the input and the output
+
+    Returns:
+        A (output, regex_dict, spans, line_count) tuple holding the encoded
+        output, the substitution values, the (byte offset, byte length,
+        keyword id) spans and the number of lines
+    """
+    (encoding, errors) = codec
+
+    # Decoding the whole buffer raises the same error as the line by line
+    # smudge would for an invalid byte
+    if errors == 'strict':
+        data.decode(encoding, errors)
+
+    output = []
+    spans = []
+    byte_count = 0
+    position = 0
+    for (start, end) in candidate_line_spans(data):
+        if start > position:
+            output.append(data[position:start])
+            byte_count += start - position
+        line = data[start:end].decode(encoding, errors)
+        (line, regex_dict, line_spans) = smudge_line(line=line,
+                                                     regex_dict=regex_dict,
+                                                     matchers=matchers,
+                                                     file_name=file_name)
+        encoded = line.encode(encoding, errors)
+        if line_spans:
+            spans.extend(keyword_byte_spans(line=line,
+                                            encoded=encoded,
+                                            spans=line_spans,
+                                            byte_count=byte_count,
+                                            encoding=encoding,
+                                            errors=errors))
+        output.append(encoded)
+        byte_count += len(encoded)
+        position = end
+    output.append(data[position:])
+
+    line_count = data.count(b'\n')
+    if data and not data.endswith(b'\n'):
+        line_count += 1
+    return (b''.join(output), regex_dict, spans, line_count)
+
+
+def find_keyword_names(line):
+    """Find the keywords used in a line of text or bytes.
+
+    Arguments:
+        line -- The text or bytes to examine
+
+    Returns:
+        The set of keyword names (see KEYWORD_KEYS) found in the line
+    """
+    if isinstance(line, bytes):
+        matches = KEYWORD_NAME_BYTES_REGEX.finditer(line)
+    else:
+        matches = KEYWORD_NAME_REGEX.finditer(line)
+    return set(match.lastgroup for match in matches)
+
+
+def path_record_path(git_dir, store_name, file_name):
+    """Calculate the name of a per-path record for a working tree file
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        store_name -- Name of the folder holding the records
+        file_name -- The working tree path relative to the top level
+
+    Returns:
+        Path name of the record
+    """
+    digest = hashlib.sha1(encode_path(file_name)).hexdigest()
+    return keyword_path(git_dir, store_name, digest[:2], digest[2:])
+
+
+def offset_index_path(git_dir, file_name):
+    """Calculate the offset index record name for a working tree file
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        file_name -- The working tree path relative to the top level
+
+    Returns:
+        Path name of the offset index record
+    """
+    return path_record_path(git_dir, 'offsets', file_name)
+
+
+def write_keyword_presence(git_dir, file_name, present):
+    """Record whether a file holds keywords.  The record is appended to
+    the presence journal with a single write, so that filters running at
+    the same time keep each other's records.  The journal is folded into
+    the presence set by rcs_keywords.compact_keyword_presence.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        file_name -- The working tree path relative to the top level
+        present -- True if the file holds at least one keyword
+
+    Returns:
+        Nothing
+    """
+    record = (b'1' if present else b'0') + encode_path(file_name) + b'\0'
+    journal_name = keyword_path(git_dir, 'presence-journal')
+    try:
+        descriptor = os.open(journal_name,
+                             os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        try:
+            os.makedirs(os.path.dirname(journal_name))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        descriptor = os.open(journal_name,
+                             os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+    try:
+        os.write(descriptor, record)
+    finally:
+        os.close(descriptor)
+
+
+def write_offset_index(git_dir, file_name, spans, size, digest, object_id,
+                       mtime_ns=-1):
+    """Record the keyword spans of a working tree file
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        file_name -- The working tree path relative to the top level
+        spans -- List of (byte offset, byte length, keyword id) tuples
+        size -- Size of the file holding the spans
+        digest -- SHA-1 digest of the contents of the file
+        object_id -- The hexadecimal id of the blob the file was expanded
+                     from
+        mtime_ns -- Modification time of the file, -1 when not yet known
+
+    Returns:
+        Nothing
+    """
+    record = [OFFSET_HEADER.pack(OFFSET_MAGIC, size, mtime_ns, digest,
+                                 object_id.encode('ascii'), len(spans))]
+    record.extend(OFFSET_SPAN.pack(*span) for span in spans)
+    write_atomic(offset_index_path(git_dir, file_name), b''.join(record))
+
+
+def read_offset_index(git_dir, file_name):
+    """Read the keyword spans recorded for a working tree file
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        file_name -- The working tree path relative to the top level
+
+    Returns:
+        A (size, mtime_ns, digest, object_id, spans) tuple or None if
+        nothing usable is recorded
+    """
+    try:
+        with open(offset_index_path(git_dir, file_name), 'rb') as record:
+            data = record.read()
+    except (IOError, OSError):
+        return None
+
+    if len(data) < OFFSET_HEADER.size:
+        return None
+    (magic, size, mtime_ns, digest, object_id, count) = \
+        OFFSET_HEADER.unpack_from(data)
+    if magic != OFFSET_MAGIC or \
+            len(data) != OFFSET_HEADER.size + count * OFFSET_SPAN.size:
+        return None
+    spans = [OFFSET_SPAN.unpack_from(data, OFFSET_HEADER.size +
+                                     position * OFFSET_SPAN.size)
+             for position in range(count)]
+    return (size, mtime_ns, digest, object_id.decode('ascii', 'replace'),
+            spans)
+
+
+def remove_offset_index(git_dir, file_name):
+    """Discard the keyword spans recorded for a working tree file
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        file_name -- The working tree path relative to the top level
+
+    Returns:
+        Nothing
+    """
+    remove_file(offset_index_path(git_dir, file_name))
+
+
+def get_mtime_ns(file_stat):
+    """Return the modification time of a stat result in nanoseconds"""
+    mtime_ns = getattr(file_stat, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(file_stat.st_mtime * 1000000000)
+    return mtime_ns
+
+
+def daemon_socket_path(create=False):
+    """Calculate the socket path of the keyword service of the current
+    user.  The socket is placed in XDG_RUNTIME_DIR or in a private folder
+    of the temporary directory.
+
+    Arguments:
+        create -- Create the private folder if it does not exist
+
+    Returns:
+        The socket path or None if the platform has no Unix sockets or the
+        folder is not private to the user
+    """
+
+    # The platforms without user ids are those without Unix sockets, which
+    # saves the filters loading the socket module while the service is
+    # not running
+    if not hasattr(os, 'getuid'):
+        return None
+    uid = os.getuid()
+    socket_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if not socket_dir:
+        # Look up the temporary directory the way tempfile does on Unix
+        # without importing it, the filters call this for every file
+        temp_dir = os.environ.get('TMPDIR') or os.environ.get('TEMP') or \
+            os.environ.get('TMP') or '/tmp'
+        socket_dir = os.path.join(temp_dir, DAEMON_SOCKET_NAME % uid)
+        if create:
+            try:
+                os.mkdir(socket_dir, 0o700)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    return None
+
+    # Never talk to a socket another user is able to replace
+    try:
+        dir_stat = os.lstat(socket_dir)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(dir_stat.st_mode) or dir_stat.st_uid != uid or \
+            dir_stat.st_mode & 0o022:
+        return None
+    return os.path.join(socket_dir, (DAEMON_SOCKET_NAME % uid) + '.sock')
+
+
+def send_message(connection, header, payload=b''):
+    """Send a message to or from the keyword service.  A message is a line
+    holding a JSON header followed by the payload whose size is held in
+    the header.
+
+    Arguments:
+        connection -- The connected socket
+        header -- Dictionary of JSON serializable values
+        payload -- The payload bytes
+
+    Returns:
+        Nothing
+    """
+    import json
+    header = dict(header, size=len(payload))
+    connection.sendall(json.dumps(header).encode('utf-8') + b'\n')
+    if payload:
+        connection.sendall(payload)
+
+
+def receive_message(stream):
+    """Receive a message sent by send_message
+
+    Arguments:
+        stream -- Binary file object reading the socket
+
+    Returns:
+        A (header, payload) tuple
+    """
+    import json
+    line = stream.readline(DAEMON_HEADER_LIMIT)
+    if not line.endswith(b'\n'):
+        raise EOFError('Incomplete message header')
+    header = json.loads(line.decode('utf-8'))
+    payload = stream.read(header['size'])
+    if len(payload) != header['size']:
+        raise EOFError('Incomplete message payload')
+    return (header, payload)
+
+
+def daemon_request(command, header, payload=b''):
+    """Send a request to the keyword service of the current user.
+
+    Arguments:
+        command -- The request command, see rcs-keywords-daemon.py
+        header -- Dictionary of the request values
+        payload -- The request payload bytes
+
+    Returns:
+        A (header, payload) reply tuple or None if the service is not
+        running or did not handle the request, in which case the caller
+        does the work itself
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('command: %s', command)
+
+    socket_path = daemon_socket_path()
+    if socket_path is None or not os.path.exists(socket_path):
+        logging.debug('Keyword service is not running')
+        return None
+
+    # Relative paths are resolved by the service from the caller's working
+    # tree top level
+    import socket
+    header = dict(header, command=command, cwd=os.getcwd())
+    try:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.settimeout(DAEMON_TIMEOUT)
+            connection.connect(socket_path)
+            send_message(connection=connection,
+                         header=header,
+                         payload=payload)
+            stream = connection.makefile('rb')
+            try:
+                (reply, reply_payload) = receive_message(stream=stream)
+            finally:
+                stream.close()
+        finally:
+            connection.close()
+    except (socket.error, EOFError, ValueError, KeyError):
+        end_time = get_clock()
+        logging.info('Keyword service request %s failed',
+                     command,
+                     exc_info=True)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return None
+
+    if reply.get('status') != 'ok':
+        end_time = get_clock()
+        logging.info('Keyword service refused request %s: %s',
+                     command,
+                     reply.get('message'))
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return None
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return (reply, reply_payload)
@@ -0,0 +1,619 @@
+#! /usr/bin/env python
+# # -*- coding: utf-8 -*
+
+"""
+rcs-hooks
+
+This module holds the pipeline shared by the post-checkout, post-commit,
+post-merge and post-rewrite event hooks.  The git queries of a hook are
+independent of each other so they are started at the same time with
+asyncio.  The stages of the pipeline are asynchronous generators passing
+on the NUL terminated path names written by git as bytes, so that any file
+name is handled and no stage waits for the whole list.  The changed files
+are passed to git check-attr while diff-tree is still listing them, and
+each file is re-expanded as soon as it is known to be handled by the
+filters, to hold keywords and to be unmodified.  Whether a file is
+unmodified is read from the index in process, and git status only runs
+for the files the index leaves undecided.  The files are re-expanded
+in place on a pool of threads, and those which can not be are fed to a
+single git checkout.  The tree wide keyword search of a first run is done
+on a worker thread as well.  The module needs the asynchronous generators of
+Python 3.6, on older versions the hooks run the queries one after the
+other.
+"""
+
+import sys
+import os
+import errno
+import collections
+import multiprocessing
+import concurrent.futures
+import asyncio
+import logging
+
+import rcs_keywords
+
+__author__ = "David Rotthoff"
+__email__ = "drotthoff@gmail.com"
+__project__ = "git-rcs-keywords"
+__version__ = "1.1.1-19"
+__date__ = "2021-02-07 10:51:24"
+__credits__ = []
+__status__ = "Production"
+
+# Conditionally map a time function for performance measurement
+# depending on the version of Python used
+if sys.version_info.major >= 3 and sys.version_info.minor >= 3:
+    from time import perf_counter as get_clock
+else:
+    from time import clock as get_clock
+
+# Command checking out the files read from its stdin, see check_out_file
+CHECKOUT_CMD = ['git',
+                '--literal-pathspecs',
+                'checkout',
+                '-f',
+                '--pathspec-from-file=-',
+                '--pathspec-file-nul']
+
+
+async def start_cmd(cmd, cmd_input=False):
+    """Start a program whose output is read while it runs.
+
+    Arguments:
+        cmd -- list of the command and its arguments
+        cmd_input -- True to open a pipe to the program's stdin
+
+    Returns:
+        The asyncio process
+    """
+    logging.debug('cmd: %s', cmd)
+    try:
+        return await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if cmd_input else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+    except OSError as err:
+        logging.info(
+            "Program %s caused on OS error! -- Exiting.",
+            cmd,
+            exc_info=True
+        )
+        logging.error(
+            "Program %s caused OS error %s! -- Exiting.",
+            cmd,
+            err.errno
+        )
+        raise
+
+
+async def log_stderr(process):
+    """Log the stderr output of a program once it has finished.
+
+    Arguments:
+        process -- The asyncio process
+
+    Returns:
+        Nothing
+    """
+    cmd_stderr = await process.stderr.read()
+    if cmd_stderr:
+        for line in cmd_stderr.strip().decode("utf-8", "replace").splitlines():
+            logging.info("stderr line: %s", line)
+
+
+async def run_cmd(cmd):
+    """Execute the supplied program and wait for its output.
+
+    Arguments:
+        cmd -- list of strings of the command and its arguments
+
+    Returns:
+        A (return code, stdout bytes) tuple
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+
+    process = await start_cmd(cmd=cmd)
+    (cmd_stdout, _) = await asyncio.gather(process.stdout.read(),
+                                           log_stderr(process=process))
+    returncode = await process.wait()
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return (returncode, cmd_stdout)
+
+
+async def read_fields(stream):
+    """Read the NUL terminated fields written by a program as they arrive.
+
+    Arguments:
+        stream -- The asyncio stream of the program output
+
+    Returns:
+        An asynchronous generator of the fields without the NUL
+    """
+    while True:
+        try:
+            field = await stream.readuntil(b'\0')
+        except asyncio.IncompleteReadError as err:
+            if err.partial:
+                yield err.partial
+            return
+        yield field[:-1]
+
+
+async def find_modified_files():
+    """Find the files modified since the last commit.
+
+    Arguments:
+        None
+
+    Returns:
+        A set of file names as bytes
+    """
+    cmd = ['git', 'status', '--porcelain', '-z']
+    (_, cmd_stdout) = await run_cmd(cmd=cmd)
+    return rcs_keywords.parse_status_files(cmd_stdout=cmd_stdout)
+
+
+class HookPipeline(object):
+    """Re-expand the keywords of the files listed by diff-tree commands"""
+
+    def __init__(self, diff_cmds, exclude_modified):
+        """Prepare the pipeline
+
+        Arguments:
+            diff_cmds -- The git diff-tree commands listing the files,
+                         the -z option is added to them
+            exclude_modified -- True to skip the files modified since the
+                                last commit
+
+        Returns:
+            Nothing
+        """
+        self.diff_cmds = diff_cmds
+        self.exclude_modified = exclude_modified
+        self.git_dir = rcs_keywords.find_git_dir()
+        self.presence_task = None
+        self.bootstrap_task = None
+        self.checkout = None
+        self.checkout_stderr = None
+        self.checkout_files = []
+        self.index = None
+        self.head_tree = None
+        self.modified_task = None
+        self.files_processed = 0
+        self.files_rewritten = []
+
+    async def list_files(self):
+        """List the regular files changed according to the diff-tree
+        commands as they are read.  The commands are started together and
+        read in order.
+
+        Arguments:
+            None
+
+        Returns:
+            An asynchronous generator of file names as bytes
+        """
+
+        # Display input parameters
+        start_time = get_clock()
+        logging.info('Entered function')
+
+        processes = []
+        for cmd in self.diff_cmds:
+            processes.append(await start_cmd(cmd=cmd + ['-z']))
+
+        # Only the files of several commands need to be remembered to
+        # pass each of them on once
+        seen = set() if len(processes) > 1 else None
+        file_count = 0
+        stopped = False
+        for process in processes:
+            stderr_task = asyncio.ensure_future(log_stderr(process=process))
+            first_field = True
+            async for file_name in read_fields(stream=process.stdout):
+                # Deal with unmodified repositories
+                if first_field and file_name == b'clean':
+                    logging.info('No modified files found')
+                    stopped = True
+                    break
+                first_field = False
+
+                # Only pass on regular files
+                if seen is not None:
+                    if file_name in seen:
+                        continue
+                    seen.add(file_name)
+                if not os.path.isfile(file_name):
+                    continue
+                file_count += 1
+                yield file_name
+            await process.stdout.read()
+            await stderr_task
+            await process.wait()
+            if stopped:
+                break
+
+        for process in processes:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+        end_time = get_clock()
+        logging.info('Listed files: %d', file_count)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+
+    async def filter_managed_files(self, files):
+        """Pass on the files handled by the rcs-keywords filter using a
+        single git check-attr process which is fed while the files are
+        being listed.
+
+        Arguments:
+            files -- Asynchronous generator of file names as bytes
+
+        Returns:
+            An asynchronous generator of the managed file names
+        """
+
+        # Display input parameters
+        start_time = get_clock()
+        logging.info('Entered function')
+
+        cmd = ['git', 'check-attr', '--stdin', '-z', 'filter']
+        process = await start_cmd(cmd=cmd, cmd_input=True)
+        stderr_task = asyncio.ensure_future(log_stderr(process=process))
+        pending = collections.deque()
+
+        async def feed_files():
+            """Write the listed files to git check-attr"""
+            feeding = True
+            async for file_name in files:
+                pending.append(file_name)
+                if not feeding:
+                    continue
+                try:
+                    process.stdin.write(file_name + b'\0')
+                    await process.stdin.drain()
+                except (IOError, OSError):
+                    feeding = False
+            if feeding:
+                process.stdin.close()
+
+        feed_task = asyncio.ensure_future(feed_files())
+
+        # The output is a sequence of path, attribute and value fields
+        # given in the order the paths were written
+        managed_count = 0
+        field_count = 0
+        async for field in read_fields(stream=process.stdout):
+            field_count += 1
+            if field_count % 3:
+                continue
+            file_name = pending.popleft()
+            if field == b'rcs-keywords':
+                managed_count += 1
+                yield file_name
+
+        await feed_task
+        await stderr_task
+        if await process.wait() != 0:
+            logging.error('git check-attr failed - keeping all files')
+            while pending:
+                yield pending.popleft()
+
+        end_time = get_clock()
+        logging.info('Filter managed files: %d', managed_count)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+
+    def load_bootstrap(self):
+        """Read the result of the tree wide keyword search, running the
+        search when no result has been saved yet.
+
+        Arguments:
+            None
+
+        Returns:
+            A set of the paths holding keywords, or None if the search
+            failed
+        """
+        bootstrap = rcs_keywords.read_bootstrap_presence(git_dir=self.git_dir)
+        if bootstrap is None:
+            bootstrap = rcs_keywords.bootstrap_keyword_presence(
+                git_dir=self.git_dir)
+        return bootstrap
+
+    async def holds_keywords(self, file_name):
+        """Report whether a file may hold keywords.  Files without a
+        presence record are checked against the tree wide keyword search
+        which is only run once it is needed.  The presence records and the
+        search, whose git grep takes a while on a large repository, are
+        read on a worker thread so that the other stages go on meanwhile.
+
+        Arguments:
+            file_name -- The working tree path relative to the top level
+
+        Returns:
+            False if the file is known not to hold any keyword
+        """
+        if self.git_dir is None:
+            return True
+        loop = asyncio.get_event_loop()
+        if self.presence_task is None:
+            self.presence_task = loop.run_in_executor(
+                None,
+                rcs_keywords.read_keyword_presence,
+                self.git_dir)
+        presence = await self.presence_task
+        present = presence.get(rcs_keywords.encode_path(file_name))
+        if present is None:
+            if self.bootstrap_task is None:
+                self.bootstrap_task = loop.run_in_executor(
+                    None,
+                    self.load_bootstrap)
+            bootstrap = await self.bootstrap_task
+            if bootstrap is not None:
+                present = file_name in bootstrap
+        return present is not False
+
+    async def filter_keyword_files(self, files):
+        """Drop the files which are known not to hold any keyword.
+
+        Arguments:
+            files -- Asynchronous generator of file names as bytes
+
+        Returns:
+            An asynchronous generator of the file names, decoded
+        """
+        async for file_name in files:
+            file_name = rcs_keywords.decode_path(file_name)
+            if await self.holds_keywords(file_name=file_name):
+                yield file_name
+
+    async def remove_modified_files(self, files):
+        """Drop the files modified since the last commit.  Each file is
+        compared with its index entry, and the entry with the tree of HEAD,
+        in process.  Git status only runs once a file is met which they
+        leave undecided, or from the start when the index can not be read.
+        The working tree is only changed once they are known.
+
+        Arguments:
+            files -- Asynchronous generator of file names
+
+        Returns:
+            An asynchronous generator of the unmodified file names
+        """
+        modified_files = None
+        async for file_name in files:
+            unmodified = None
+            if self.index is not None:
+                unmodified = self.index.is_unmodified(file_name=file_name)
+
+            # A change added to the index but not committed is reported
+            # by git status as well
+            if unmodified:
+                staged = self.index.is_staged(file_name=file_name,
+                                              head_tree=self.head_tree)
+                unmodified = None if staged is None else not staged
+            if unmodified is None:
+                if self.modified_task is None:
+                    self.modified_task = asyncio.ensure_future(
+                        find_modified_files())
+                if modified_files is None:
+                    modified_files = await self.modified_task
+                unmodified = rcs_keywords.encode_path(file_name) \
+                    not in modified_files
+            if unmodified:
+                yield file_name
+
+    async def check_out_file(self, file_name):
+        """Pass a file to the git checkout run at the end of the pipeline
+        so that it is smudged again.
+
+        Arguments:
+            file_name -- the file name to be checked out for smudging
+
+        Returns:
+            Nothing.
+        """
+
+        # Display input parameters
+        logging.debug('file_name: %s', file_name)
+
+        # Remove the file if it currently exists, git does not write files
+        # whose stat data matches the index
+        try:
+            os.remove(file_name)
+        except OSError as err:
+            # Ignore a file not found error, it was being removed anyway
+            if err.errno != errno.ENOENT:
+                logging.info(
+                    "File removal of %s caused on OS error %d! -- Exiting.",
+                    file_name,
+                    err.errno,
+                    exc_info=True
+                )
+                logging.error(
+                    "File removal %s caused OS error %d! -- Exiting.",
+                    file_name,
+                    err.errno
+                )
+                exit(err.errno)
+
+        if self.checkout is None:
+            self.checkout = await start_cmd(cmd=CHECKOUT_CMD, cmd_input=True)
+            self.checkout_stderr = asyncio.ensure_future(
+                log_stderr(process=self.checkout))
+        self.checkout_files.append(file_name)
+        try:
+            self.checkout.stdin.write(rcs_keywords.encode_path(file_name) +
+                                      b'\0')
+            await self.checkout.stdin.drain()
+        except (IOError, OSError):
+            logging.info('git checkout stopped reading file names')
+
+    async def finish_check_out(self):
+        """Wait for the git checkout of the files passed to it.  Git
+        releases before 2.25 do not support reading the pathspec from stdin
+        so each file is checked out on its own instead.
+
+        Arguments:
+            None
+
+        Returns:
+            Nothing
+        """
+
+        # Display input parameters
+        start_time = get_clock()
+        logging.info('Entered function')
+
+        if self.checkout is None:
+            return
+        try:
+            self.checkout.stdin.close()
+        except (IOError, OSError):
+            pass
+        await self.checkout_stderr
+        returncode = await self.checkout.wait()
+        if returncode == 129:
+            logging.info('Falling back to a checkout per file')
+            for file_name in self.checkout_files:
+                await run_cmd(cmd=['git', 'checkout', '-f', '%s' % file_name])
+        elif returncode != 0:
+            logging.error('git checkout failed with return code %d',
+                          returncode)
+
+        end_time = get_clock()
+        logging.info('Checked out files: %d', len(self.checkout_files))
+        logging.info('Elapsed time: %f', (end_time - start_time))
+
+    async def finish_file(self, file_name, refreshed):
+        """Check out a file again unless it was re-expanded in place.
+
+        Arguments:
+            file_name -- The working tree path relative to the top level
+            refreshed -- Future giving the result of refresh_file_keywords
+
+        Returns:
+            Nothing
+        """
+        if await refreshed:
+            self.files_rewritten.append(file_name)
+        else:
+            await self.check_out_file(file_name=file_name)
+        self.files_processed += 1
+        sys.stderr.write('Smudged file %s\n' % file_name)
+        logging.info('Checked out file %s', file_name)
+
+    async def run(self):
+        """Start the git queries and run the stages of the pipeline
+
+        Arguments:
+            None
+
+        Returns:
+            Nothing
+        """
+
+        # Display input parameters
+        start_time = get_clock()
+        logging.info('Entered function')
+
+        # Check if git is available at the same time
+        version_task = asyncio.ensure_future(
+            run_cmd(cmd=['git', '--version']))
+        self.index = rcs_keywords.read_git_index(git_dir=self.git_dir)
+        if self.exclude_modified:
+            if self.index is not None and self.git_dir is not None:
+                self.head_tree = rcs_keywords.read_head_tree(
+                    git_dir=self.git_dir)
+            if self.index is None:
+                self.modified_task = asyncio.ensure_future(
+                    find_modified_files())
+
+        files = self.list_files()
+        files = self.filter_managed_files(files=files)
+        files = self.filter_keyword_files(files=files)
+        if self.exclude_modified:
+            files = self.remove_modified_files(files=files)
+
+        # Re-expand the keywords in place on a pool of threads when the
+        # offset index recorded by the smudge filter still matches the
+        # file and its blob in the index.  The results are handled in the
+        # order of the files.
+        workers = rcs_keywords.HOOK_WORKERS or multiprocessing.cpu_count()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        loop = asyncio.get_event_loop()
+        pending = collections.deque()
+        try:
+            async for file_name in files:
+                object_id = None
+                if self.index is not None:
+                    object_id = self.index.object_id(file_name=file_name)
+                pending.append((file_name, loop.run_in_executor(
+                    executor,
+                    rcs_keywords.refresh_file_keywords,
+                    file_name,
+                    self.git_dir,
+                    object_id)))
+                if len(pending) >= 2 * workers:
+                    await self.finish_file(*pending.popleft())
+            while pending:
+                await self.finish_file(*pending.popleft())
+        finally:
+            executor.shutdown(wait=True)
+            if self.index is not None:
+                self.index.close()
+        await self.finish_check_out()
+
+        if self.modified_task is not None:
+            await self.modified_task
+        (_, version) = await version_task
+        logging.debug('git version: %s', version)
+
+        end_time = get_clock()
+        logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+def refresh_files(diff_cmds, exclude_modified=True):
+    """Re-expand the keywords of the files changed by an event.
+
+    Arguments:
+        diff_cmds -- The git diff-tree commands listing the changed files,
+                     the -z option is added to them
+        exclude_modified -- True to skip the files modified since the
+                            last commit
+
+    Returns:
+        The number of files processed
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('diff_cmds: %s', diff_cmds)
+
+    pipeline = HookPipeline(diff_cmds=diff_cmds,
+                            exclude_modified=exclude_modified)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(pipeline.run())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    # Bring the index stat data of the files rewritten in place up to date
+    # so that the next git status does not clean each of them again
+    rcs_keywords.refresh_index_stat(file_names=pipeline.files_rewritten)
+
+    end_time = get_clock()
+    logging.debug('Files processed: %s', pipeline.files_processed)
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return pipeline.files_processed
@@ -0,0 +1,3780 @@
+#! /usr/bin/env python
+# # -*- coding: utf-8 -*
+
+"""
+rcs-keywords
+
+This module holds the code shared by the git RCS keyword filters
+and event hooks.  It is installed next to the hook programs so that
+both the filters and the hooks are able to import it.  It provides
+the commit information lookup used to build the keyword expansions
+and the per-file keyword offset index kept under .git/rcs-keywords.
+The code the filters run for every file is kept in rcs_filter so that
+a filter process does not load this module unless a lookup misses.
+"""
+
+import sys
+import os
+import errno
+import stat
+import io
+import re
+import struct
+import binascii
+import hashlib
+import heapq
+import zlib
+import datetime
+import time
+import mmap
+import shutil
+import tempfile
+import collections
+import array
+import bisect
+import multiprocessing
+import multiprocessing.pool
+import threading
+import subprocess
+import logging
+
+# The code the filters run for every file lives in rcs_filter, whose names
+# are available here as well for the hooks and the keyword service
+from rcs_filter import (
+    KEYWORD_DIR, PATH_ERRORS, GIT_FIELD_NAME, GIT_FIELD_LOG, KEYWORD_KEYS,
+    KEYWORD_NAMES, KEYWORD_FIELDS, KEYWORD_NAME_PATTERN, KEYWORD_NAME_REGEX,
+    KEYWORD_NAME_BYTES_REGEX, COLLAPSED_KEYWORD_REGEX,
+    COLLAPSED_KEYWORD_NAME_REGEX, KEYWORD_IDS, CLEAN_CACHE_ENTRIES,
+    CLEAN_CACHE_MIN_FILE, CLEAN_CACHE_MAX_FILE, SMUDGE_CACHE_ENTRIES,
+    SMUDGE_CACHE_MAX_FILE, CACHE_EVICTION_SAMPLE, METADATA_CACHE_ENTRIES,
+    CACHE_MAGIC, CACHE_HEADER, CLEAN_HEADER, SMUDGE_HEADER, DAEMON_SOCKET_NAME,
+    DAEMON_HEADER_LIMIT, DAEMON_MEMORY_LIMIT, DAEMON_IDLE_TIMEOUT,
+    DAEMON_TIMEOUT, VECTOR_SCAN, VECTOR_SCAN_MIN_SIZE, VECTOR_SCAN_ENCODINGS,
+    KEYWORD_PAIRS, KEYWORD_WIDE_INITIALS, OFFSET_MAGIC, OFFSET_HEADER,
+    OFFSET_SPAN, get_encoding, AppendLog, PrefixedReader, text_stream, blob_id,
+    find_git_dir, keyword_path, write_atomic, remove_file, encode_path,
+    decode_path, cache_entry_path, read_cache_entry, write_cache_entry,
+    read_clean_cache, write_clean_cache, smudge_cache_key, read_smudge_cache,
+    write_smudge_cache, read_head_commit, shared_git_log, escape_index_field,
+    unescape_index_field, decode_index_record, read_path_journal,
+    index_node_path, read_index_node, read_index_root, resolve_path_index,
+    lookup_path_index, build_regex_dict, resolve_keywords, KeywordMatcher,
+    smudge_matchers, clean_matchers, clean_line, clean_data,
+    shift_keyword_spans, smudge_line, keyword_byte_spans, load_numpy,
+    vector_scan_usable, candidate_line_spans, smudge_buffer,
+    find_keyword_names, path_record_path, offset_index_path,
+    write_keyword_presence, write_offset_index, read_offset_index,
+    remove_offset_index, get_mtime_ns, daemon_socket_path, send_message,
+    receive_message, daemon_request)
+
+__author__ = "David Rotthoff"
+__email__ = "drotthoff@gmail.com"
+__project__ = "git-rcs-keywords"
+__version__ = "1.1.1-19"
+__date__ = "2021-02-07 10:51:24"
+__credits__ = []
+__status__ = "Production"
+
+# Conditionally map a time function for performance measurement
+# depending on the version of Python used
+if sys.version_info.major >= 3 and sys.version_info.minor >= 3:
+    from time import perf_counter as get_clock
+else:
+    from time import clock as get_clock
+
+# Refresh the index stat data of the files the hooks rewrite in place so
+# that git does not run the clean filter on each of them afterwards
+REFRESH_INDEX = True
+
+# The filter processes git starts while HEAD has no path index share a
+# single history walk which builds it.  Processes of git commands run at the
+# same time wait for the walk while its lock file is younger than
+# SHARED_WALK_TIMEOUT seconds, checking every SHARED_WALK_POLL seconds.
+SHARED_WALK_TIMEOUT = 120
+SHARED_WALK_POLL = 0.05
+
+# The path index holds the commit information of the files at several
+# commits.  Each commit has a tree of nodes, one per directory, stored
+# under the hash of their contents so that the commits share the nodes of
+# the directories which are the same.  The hooks append the files changed
+# by new commits to a journal, which is folded into nodes once it holds
+# PATH_INDEX_JOURNAL_LIMIT entries.  The hooks look for an indexed commit
+# among the last PATH_INDEX_SEARCH_DEPTH first parents of HEAD.
+PATH_INDEX_JOURNAL_LIMIT = 4096
+PATH_INDEX_SEARCH_DEPTH = 1000
+
+# The path index of the commits a rebase or an amend left behind is
+# removed once they make up PATH_INDEX_GC_RATIO of the indexed commits.
+# The post-rewrite hook spends at most PATH_INDEX_GC_BUDGET seconds on it,
+# and nodes younger than PATH_INDEX_GC_GRACE seconds are always kept.
+PATH_INDEX_GC_RATIO = 0.25
+PATH_INDEX_GC_BUDGET = 2.0
+PATH_INDEX_GC_GRACE = 60
+
+# The filters append whether each file holds keywords to a journal, which
+# is folded into a single presence set sorted by path once it is longer
+# than PRESENCE_JOURNAL_LIMIT bytes, dropping the paths no longer in the
+# index.  A fold interrupted for PRESENCE_LOCK_STALE seconds is given up.
+PRESENCE_MAGIC = b'RKP1\0'
+PRESENCE_JOURNAL_LIMIT = 256 * 1024
+PRESENCE_LOCK_STALE = 60
+
+# Extended regular expression used by git grep to find the files of a tree
+# which hold a collapsed or expanded keyword
+KEYWORD_GREP_PATTERN = \
+    r'\$(Author|Id|Date|Source|File|Revision|Rev|Hash)(:[^$]*)?\$'
+
+# Files at least this large are smudged in segments split at line
+# boundaries on all processor cores.  The segments are expanded in a pool
+# of PARALLEL_SMUDGE_WORKERS processes (None for one per core) which
+# memory-map the spooled input.
+PARALLEL_SMUDGE_MIN_FILE = 64 * 1024 * 1024
+PARALLEL_SMUDGE_SEGMENT = 8 * 1024 * 1024
+PARALLEL_SMUDGE_WORKERS = None
+
+# The event hooks re-expand files in place on a pool of HOOK_WORKERS
+# threads (None for one per core).  The files are reported and, when they
+# can not be re-expanded in place, checked out in their original order.
+HOOK_WORKERS = None
+
+# The history is walked for at least HISTORY_WALK_MIN_FILES files by
+# HISTORY_WALK_WORKERS git processes (None for one per core), each listing
+# the changed files of HISTORY_WALK_CHUNK commits.  Fewer files are looked
+# up with a single git log.
+HISTORY_WALK_MIN_FILES = 1000
+HISTORY_WALK_CHUNK = 4096
+HISTORY_WALK_WORKERS = None
+
+# The commit information of a file is read from the object database in
+# process, without starting git log, unless OBJECT_READER is False or the
+# repository uses a format the reader does not know.  Once the walk of the
+# history has visited OBJECT_WALK_LIMIT commits, or read more commits not
+# yet in memory than OBJECT_WALK_READS and than the store already holds,
+# without finding the commit which last changed the file, git log is run
+# instead.  A store used once gives up early while a shared store reaches
+# further back with each file.  Up to OBJECT_CACHE_ENTRIES commits, trees
+# and delta bases are kept in memory.
+OBJECT_READER = True
+OBJECT_WALK_LIMIT = 1000
+OBJECT_WALK_READS = 50
+OBJECT_CACHE_ENTRIES = 4096
+
+# Entry of a git tree object: mode, name and binary object id
+TREE_ENTRY_REGEX = re.compile(b'([0-7]+) ([^\\0]*)\\0(.{20})', re.DOTALL)
+
+# Layout of the git index file header, of the fixed part of an index entry
+# (ctime and mtime seconds and nanoseconds, device, inode, mode, user and
+# group ids, size, object id and flags) and of an extension header.  The
+# hooks decide whether a file was modified from its index entry; a file
+# whose stat data no longer match is cleaned and hashed if it holds at
+# most GIT_INDEX_CONTENT_MAX_FILE bytes.  The files still undecided are
+# passed to git status, on its command line when there are at most
+# GIT_INDEX_STATUS_PATHS of them.
+GIT_INDEX_HEADER = struct.Struct('>4sII')
+GIT_INDEX_ENTRY = struct.Struct('>10I20sH')
+GIT_INDEX_EXTENSION = struct.Struct('>4sI')
+GIT_INDEX_CONTENT_MAX_FILE = 1024 * 1024
+GIT_INDEX_STATUS_PATHS = 256
+
+
+def replace_file(file_name, data, source_stat=None):
+    """Replace the contents of a working tree file.  The new contents are
+    written to a temporary file in the same folder, with the permissions
+    of the file, which is then renamed over it so that an interrupted
+    write never leaves a truncated file behind.
+
+    Arguments:
+        file_name -- The file to be written
+        data -- The bytes to write
+        source_stat -- The stat data of the file when its contents were
+                       read, None to replace it whatever it holds
+
+    Returns:
+        True if the file was replaced, False if it was changed since
+        source_stat was taken
+    """
+    file_stat = os.stat(file_name)
+    (temp_handle, temp_name) = tempfile.mkstemp(
+        dir=os.path.dirname(file_name) or '.',
+        prefix='.%s.' % os.path.basename(file_name),
+        suffix='.tmp')
+    try:
+        os.fchmod(temp_handle, stat.S_IMODE(file_stat.st_mode))
+        with os.fdopen(temp_handle, 'wb') as temp_file:
+            temp_file.write(data)
+
+        # Leave alone a file written by someone else in the meantime
+        if source_stat is not None:
+            file_stat = os.stat(file_name)
+            if file_stat.st_size != source_stat.st_size or \
+                    get_mtime_ns(file_stat) != get_mtime_ns(source_stat):
+                remove_file(temp_name)
+                return False
+        getattr(os, 'replace', os.rename)(temp_name, file_name)
+    except BaseException:
+        remove_file(temp_name)
+        raise
+    return True
+
+
+def run_cmd(cmd, cmd_input=None):
+    """Execute the supplied program, optionally feeding it input.
+
+    Arguments:
+        cmd -- list of strings of the command and its arguments
+        cmd_input -- bytes to write to the program's stdin
+
+    Returns:
+        A (return code, stdout bytes) tuple
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('cmd: %s', cmd)
+
+    # Execute the command
+    try:
+        cmd_handle = subprocess.Popen(cmd,
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE)
+        (cmd_stdout, cmd_stderr) = cmd_handle.communicate(cmd_input)
+    except OSError as err:
+        end_time = get_clock()
+        logging.info(
+            "Program %s caused on OS error! -- Exiting.",
+            cmd,
+            exc_info=True
+        )
+        logging.error(
+            "Program %s caused OS error %s! -- Exiting.",
+            cmd,
+            err.errno
+        )
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        raise
+    if cmd_stderr:
+        for line in cmd_stderr.strip().decode("utf-8").splitlines():
+            logging.info("stderr line: %s", line)
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return (cmd_handle.returncode, cmd_stdout)
+
+
+def filter_managed_files(files):
+    """Reduce a list of files to those handled by the rcs-keywords filter
+    using a single git check-attr call.
+
+    Arguments:
+        files -- list of working tree paths
+
+    Returns:
+        The files whose filter attribute is rcs-keywords, in their
+        original order
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('files: %s', files)
+
+    if not files:
+        return files
+
+    cmd = ['git', 'check-attr', '--stdin', '-z', 'filter']
+    (returncode, cmd_stdout) = run_cmd(
+        cmd=cmd,
+        cmd_input=b'\0'.join(encode_path(f) for f in files) + b'\0')
+    if returncode != 0:
+        end_time = get_clock()
+        logging.error('git check-attr failed - keeping all files')
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return files
+
+    # The output is a sequence of path, attribute and value fields
+    fields = decode_path(cmd_stdout).split('\0')
+    managed = set(fields[position]
+                  for position in range(0, len(fields) - 2, 3)
+                  if fields[position + 2] == 'rcs-keywords')
+    managed_files = [f for f in files if f in managed]
+
+    end_time = get_clock()
+    logging.info('Filter managed files: %d of %d',
+                 len(managed_files),
+                 len(files))
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return managed_files
+
+
+def git_log_attributes(git_field_log, file_name, git_field_name, cwd=None,
+                       git_dir=None):
+    """Function to dump the git log associated with the provided
+    file name.
+
+    Arguments:
+        git_field_log -- a list of git log fields to capture
+        file_name -- The full file name to be examined
+        git_field_name -- Name of the attributes fields for the dictionary
+        cwd -- The working tree top level, default of None uses the
+               current directory
+        git_dir -- The git directory, default of None lets git find it
+
+    Returns:
+        git_log -- List of defined attribute dictionaries
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('git_field_log %s', git_field_log)
+    logging.debug('file_name: %s', file_name)
+    logging.debug('git_field_name: %s', git_field_name)
+
+    # Read the commit from the object database without starting git log
+    # when the repository format allows it
+    git_log = object_git_log(git_field_log=git_field_log,
+                             file_name=file_name,
+                             git_field_name=git_field_name,
+                             cwd=cwd,
+                             git_dir=git_dir)
+    if git_log is not None:
+        end_time = get_clock()
+        logging.debug('git_log: %s', git_log)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return git_log
+
+    # Format the git log command
+    git_field_format = '%x1f'.join(git_field_log) + '%x1e'
+    cmd = ['git',
+           'log',
+           '--date=iso8601',
+           '--max-count=1',
+           '--format=%s' % git_field_format,
+           '--',
+           str(file_name)]
+    if git_dir is not None:
+        cmd.insert(1, '--git-dir=%s' % git_dir)
+    logging.debug('cmd: %s', cmd)
+
+    # Process the git log command
+    try:
+        cmd_handle = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd
+        )
+        (cmd_stdout, cmd_stderr) = cmd_handle.communicate()
+        if cmd_stderr:
+            for line in cmd_stderr.strip().decode("utf-8").splitlines():
+                logging.info("stderr.line: %s", line)
+    # If the command fails, notify the user and exit immediately
+    except subprocess.CalledProcessError as err:
+        end_time = get_clock()
+        logging.info("Program %s call failed! -- Exiting.",
+                     cmd,
+                     exc_info=True)
+        logging.error(
+            "Program %s call failed! -- Exiting.", cmd
+        )
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        exit(err.returncode)
+    except OSError as err:
+        end_time = get_clock()
+        logging.info(
+            "Program %s caused on OS error! -- Exiting.",
+            cmd,
+            exc_info=True
+        )
+        logging.error(
+            "Program %s caused OS error %s! -- Exiting.",
+            cmd,
+            err.errno
+        )
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        exit(err.errno)
+
+    # If an error occurred, display the command output and exit
+    # with the returned exit code
+    if cmd_handle.returncode != 0:
+        end_time = get_clock()
+        logging.info(
+            "Exiting -- git log return error code: %d", cmd_handle.returncode,
+            exc_info=True
+        )
+        logging.error(
+            "Exiting -- git log return error code: %d", cmd_handle.returncode
+        )
+        logging.info("Output text: %s", cmd_stdout.strip().decode("utf-8"))
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        exit(cmd_handle.returncode)
+
+    # Calculate replacement strings based on the git log results
+    if cmd_stdout:
+        # Convert returned values to a list of dictionaries
+        git_output = cmd_stdout.strip().decode("utf-8")
+        git_log = git_output.strip().split("\x1e")
+        git_log = [row.strip().split("\x1f") for row in git_log]
+        git_log = [dict(zip(git_field_name, row)) for row in git_log]
+    else:
+        git_log = []
+
+    if not git_log:
+        logging.info('No git attributes returned for file %s', file_name)
+
+    if len(git_log) > 1:
+        logging.error(
+            'More than one row of git attributes returned for file %s',
+            file_name
+        )
+
+    # Log the results of the git log operation
+    end_time = get_clock()
+    logging.debug('git_log: %s', git_log)
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+    # Return from the function
+    return git_log
+
+
+class FieldReader(object):
+    """Read the NUL terminated fields written by a program one by one"""
+
+    def __init__(self, stream):
+        """Prepare the reader
+
+        Arguments:
+            stream -- The binary stream of the program output
+
+        Returns:
+            Nothing
+        """
+        self.descriptor = stream.fileno()
+        self.buffer = b''
+        self.position = 0
+
+    def next_field(self):
+        """Read the next field
+
+        Arguments:
+            None
+
+        Returns:
+            The field without the NUL, or None at the end of the output
+        """
+        while True:
+            end = self.buffer.find(b'\0', self.position)
+            if end >= 0:
+                field = self.buffer[self.position:end]
+                self.position = end + 1
+                return field
+            chunk = os.read(self.descriptor, 65536)
+            if not chunk:
+                field = self.buffer[self.position:] or None
+                self.buffer = b''
+                self.position = 0
+                return field
+            self.buffer = self.buffer[self.position:] + chunk
+            self.position = 0
+
+
+class ParentDiff(object):
+    """List the files in which a commit differs from one of its parents
+    with a persistent git diff-tree process"""
+
+    def __init__(self):
+        """Start git diff-tree
+
+        Arguments:
+            None
+
+        Returns:
+            Nothing
+        """
+        with open(os.devnull, 'wb') as devnull:
+            self.process = subprocess.Popen(['git',
+                                             'diff-tree',
+                                             '--stdin',
+                                             '--always',
+                                             '--no-renames',
+                                             '-r',
+                                             '--name-only',
+                                             '-z'],
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            stderr=devnull)
+        self.reader = FieldReader(stream=self.process.stdout)
+
+    def changed_files(self, commit, parent):
+        """List the files in which a commit differs from a parent
+
+        Arguments:
+            commit -- The commit id as bytes
+            parent -- The parent commit id as bytes
+
+        Returns:
+            A set of the file names as bytes
+        """
+
+        # Comparing the commit with itself only writes the commit id,
+        # which marks the end of the file list
+        self.process.stdin.write(commit + b' ' + parent + b'\n' +
+                                 commit + b' ' + commit + b'\n')
+        self.process.stdin.flush()
+        if self.reader.next_field() != commit:
+            raise IOError('Unexpected git diff-tree output')
+        changed = set()
+        while True:
+            field = self.reader.next_field()
+            if field is None:
+                raise IOError('Unexpected end of git diff-tree output')
+            if field == commit:
+                return changed
+            changed.add(field)
+
+    def close(self):
+        """Stop git diff-tree
+
+        Arguments:
+            None
+
+        Returns:
+            Nothing
+        """
+        self.process.stdin.close()
+        self.process.wait()
+
+
+class ChunkedLog(object):
+    """Read the output git log gives for a list of commits, produced by
+    git diff-tree processes running in parallel on consecutive ranges of
+    the commits.  Each process writes to a temporary file which is read
+    once the process ends, so the ranges are read in order while the later
+    ones are still being listed."""
+
+    def __init__(self, commits, format_option, workers, chunk_size):
+        """Start the first git diff-tree processes
+
+        Arguments:
+            commits -- The commit ids as bytes in the order of git log
+            format_option -- The --format option of git log
+            workers -- Number of processes running at the same time
+            chunk_size -- Number of commits listed by each process
+
+        Returns:
+            Nothing
+        """
+        self.cmd = ['git',
+                    'diff-tree',
+                    '--stdin',
+                    '--always',
+                    '--abbrev',
+                    '--no-renames',
+                    '--no-show-signature',
+                    '--root',
+                    '-r',
+                    '--name-only',
+                    '-z',
+                    format_option]
+        self.commits = commits
+        self.chunk_size = chunk_size
+        self.next_chunk = 0
+        self.running = collections.deque()
+        self.output = None
+        self.reader = None
+        for _ in range(workers):
+            self.start_chunk()
+
+    def start_chunk(self):
+        """Start the git diff-tree process of the next range of commits
+
+        Arguments:
+            None
+
+        Returns:
+            Nothing
+        """
+        start = self.next_chunk * self.chunk_size
+        if start >= len(self.commits):
+            return
+        self.next_chunk += 1
+        output = tempfile.TemporaryFile(prefix='history-')
+        try:
+            with tempfile.TemporaryFile(prefix='history-') as commit_file:
+                commit_file.write(b'\n'.join(
+                    self.commits[start:start + self.chunk_size]) + b'\n')
+                commit_file.seek(0)
+                with open(os.devnull, 'wb') as devnull:
+                    process = subprocess.Popen(self.cmd,
+                                               stdin=commit_file,
+                                               stdout=output,
+                                               stderr=devnull)
+        except Exception:
+            output.close()
+            raise
+        self.running.append((process, output))
+
+    def next_field(self):
+        """Read the next field
+
+        Arguments:
+            None
+
+        Returns:
+            The field without the NUL, or None at the end of the output
+        """
+        while True:
+            if self.reader is not None:
+                field = self.reader.next_field()
+                if field is not None:
+                    return field
+                self.output.close()
+                self.reader = None
+            if not self.running:
+                return None
+            (process, self.output) = self.running.popleft()
+            if process.wait() != 0:
+                raise IOError('git diff-tree failed')
+            self.start_chunk()
+            self.output.seek(0)
+            self.reader = FieldReader(stream=self.output)
+
+    def close(self):
+        """Stop the git diff-tree processes still running
+
+        Arguments:
+            None
+
+        Returns:
+            Nothing
+        """
+        if self.output is not None:
+            self.output.close()
+        for (process, output) in self.running:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            output.close()
+        self.running.clear()
+
+
+class CommitRecord(object):
+    """The commit information of one commit, shared by all the files it
+    last changed"""
+
+    __slots__ = tuple(GIT_FIELD_NAME)
+
+    def __init__(self, values):
+        """Store the commit fields
+
+        Arguments:
+            values -- The values of the GIT_FIELD_NAME fields
+
+        Returns:
+            Nothing
+        """
+        for (field_name, value) in zip(GIT_FIELD_NAME, values):
+            setattr(self, field_name, value)
+
+    def row(self):
+        """Build the git_log_attributes row of the commit
+
+        Arguments:
+            None
+
+        Returns:
+            A dictionary of the commit fields
+        """
+        return dict((field_name, getattr(self, field_name))
+                    for field_name in GIT_FIELD_NAME)
+
+
+class CommitTable(object):
+    """The commit information of many files.  Each commit is stored once
+    and the files refer to it by its position in the table, kept in an
+    array in the order of the sorted file names.  It is read like a
+    dictionary of the git_log_attributes result of each file."""
+
+    def __init__(self, file_names):
+        """Prepare a table without any commit
+
+        Arguments:
+            file_names -- The paths of the files
+
+        Returns:
+            Nothing
+        """
+        self.file_names = sorted(file_names)
+        self.commit_ids = array.array('l', [-1]) * len(self.file_names)
+        self.records = []
+        self.record_ids = {}
+
+    def position(self, file_name):
+        """Find the position of a file
+
+        Arguments:
+            file_name -- The path of the file
+
+        Returns:
+            The position in the sorted file names, or None if the table does
+            not hold the file
+        """
+        position = bisect.bisect_left(self.file_names, file_name)
+        if position < len(self.file_names) and \
+                self.file_names[position] == file_name:
+            return position
+        return None
+
+    def set_commit(self, position, values):
+        """Record the commit which last changed a file
+
+        Arguments:
+            position -- The position of the file
+            values -- The values of the GIT_FIELD_NAME fields of the commit
+
+        Returns:
+            Nothing
+        """
+        record_id = self.record_ids.get(values[0])
+        if record_id is None:
+            record_id = len(self.records)
+            self.records.append(CommitRecord(values=values))
+            self.record_ids[values[0]] = record_id
+        self.commit_ids[position] = record_id
+
+    def get(self, file_name, default=None):
+        """Look up the commit information of a file
+
+        Arguments:
+            file_name -- The path of the file
+            default -- The result for a file the table does not hold
+
+        Returns:
+            A list holding the row of the commit, empty when no commit was
+            found for the file
+        """
+        position = self.position(file_name=file_name)
+        if position is None:
+            return default
+        record_id = self.commit_ids[position]
+        return [] if record_id < 0 else [self.records[record_id].row()]
+
+    def __getitem__(self, file_name):
+        rows = self.get(file_name=file_name)
+        if rows is None:
+            raise KeyError(file_name)
+        return rows
+
+    def __contains__(self, file_name):
+        return self.position(file_name=file_name) is not None
+
+    def __len__(self):
+        return len(self.file_names)
+
+    def __iter__(self):
+        return iter(self.file_names)
+
+    def items(self):
+        """List the commit information of every file
+
+        Arguments:
+            None
+
+        Returns:
+            A generator of (file name, git_log_attributes result) tuples
+        """
+        for (file_name, record_id) in zip(self.file_names, self.commit_ids):
+            yield (file_name, [] if record_id < 0
+                   else [self.records[record_id].row()])
+
+    def __eq__(self, other):
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        return not self == other
+
+
+def list_commits():
+    """List the commits reachable from HEAD in the order git log
+    --date-order gives them
+
+    Arguments:
+        None
+
+    Returns:
+        A list of the commit ids as bytes, or None if git rev-list failed
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+
+    (returncode, cmd_stdout) = run_cmd(cmd=['git',
+                                            'rev-list',
+                                            '--date-order',
+                                            'HEAD'])
+    commits = cmd_stdout.split() if returncode == 0 else None
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return commits
+
+
+def batch_git_log(file_names, workers=None):
+    """Look up the commit information of many files with a single walk of
+    the history instead of a git log call per file.
+
+    Each file follows the history the way git log -- <file> simplifies it:
+    a commit is found when it changed the file, a merge when the file
+    differs from every parent, and otherwise the file is followed into the
+    first parent it is the same in.  The walk ends as soon as every file
+    is found.  For many files the changed files of the commits are listed
+    by several git processes at the same time, each for a range of the
+    commits, while the ranges are read in order.
+
+    Arguments:
+        file_names -- The working tree paths relative to the top level
+        workers -- Number of git processes listing the changed files, None
+                   for HISTORY_WALK_WORKERS
+
+    Returns:
+        A CommitTable read as a dictionary of the git_log_attributes result
+        of each file, or None if the history could not be walked
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file count: %d', len(file_names))
+
+    git_log = CommitTable(file_names=file_names)
+    if not file_names:
+        return git_log
+
+    # Every commit is written as an empty field followed by the commit
+    # fields and then its changed files.  Merges list no files.
+    format_option = '--format=%x00' + '%x1f'.join(GIT_FIELD_LOG + ['%P'])
+    workers = workers or HISTORY_WALK_WORKERS or multiprocessing.cpu_count()
+    commits = None
+    if workers > 1 and len(file_names) >= HISTORY_WALK_MIN_FILES:
+        commits = list_commits()
+        if commits is None:
+            return None
+        if len(commits) <= HISTORY_WALK_CHUNK:
+            commits = None
+    cmd = ['git',
+           'log',
+           '--date-order',
+           '--no-renames',
+           '--no-show-signature',
+           '--root',
+           '--name-only',
+           '-z',
+           format_option,
+           'HEAD',
+           '--']
+    cmd_handle = None
+    try:
+        if commits is None:
+            logging.debug('cmd: %s', cmd)
+            with open(os.devnull, 'wb') as devnull:
+                cmd_handle = subprocess.Popen(cmd,
+                                              stdout=subprocess.PIPE,
+                                              stderr=devnull)
+            reader = FieldReader(stream=cmd_handle.stdout)
+        else:
+            reader = ChunkedLog(commits=commits,
+                                format_option=format_option,
+                                workers=workers,
+                                chunk_size=HISTORY_WALK_CHUNK)
+        parent_diff = None
+    except (IOError, OSError):
+        logging.info('Unable to execute git log', exc_info=True)
+        return None
+
+    # The files waiting to be found in each commit.  The date order lists
+    # a commit after all of its children so no file arrives at a commit
+    # that has already been read.
+    waiting = {}
+    names = dict((encode_path(file_name), position)
+                 for (position, file_name) in enumerate(git_log.file_names))
+    commit = None
+    group = None
+    commit_count = 0
+    try:
+        first = True
+        while True:
+            field = reader.next_field()
+            if field is not None and field and group is not None:
+                # A file changed by the commit
+                if first:
+                    field = field[1:] if field[:1] == b'\n' else field
+                    first = False
+                if field in group:
+                    group.discard(field)
+                    git_log.set_commit(position=names[field], values=values)
+                continue
+            if field is not None and field:
+                continue
+
+            # The previous commit is complete, the remaining files move on
+            # to its parent
+            if group:
+                if parents:
+                    waiting.setdefault(parents[0], set()).update(group)
+                group = None
+            if commit is not None and not waiting:
+                break
+            if field is None:
+                break
+
+            header = reader.next_field()
+            if header is None:
+                break
+            commit_count += 1
+            values = header.decode('utf-8').split('\x1f')
+            commit = values[0].encode('ascii')
+            parents = [parent.encode('ascii')
+                       for parent in values[-1].split()]
+            if commit_count == 1:
+                waiting[commit] = set(names)
+            group = waiting.pop(commit, None)
+            first = True
+            if group is None:
+                continue
+            values = values[:-1]
+
+            if len(parents) > 1:
+                # Follow each file into the first parent it is the same
+                # in, the merge is found for the files in none of them
+                if parent_diff is None:
+                    parent_diff = ParentDiff()
+                for parent in parents:
+                    if not group:
+                        break
+                    changed = parent_diff.changed_files(commit=commit,
+                                                        parent=parent)
+                    same = group.difference(changed)
+                    if same:
+                        waiting.setdefault(parent, set()).update(same)
+                        group.intersection_update(changed)
+                for field in group:
+                    git_log.set_commit(position=names[field], values=values)
+                group = None
+    except (IOError, OSError, ValueError):
+        logging.info('Unable to walk the history', exc_info=True)
+        git_log = None
+    finally:
+        if parent_diff is not None:
+            parent_diff.close()
+        if cmd_handle is None:
+            reader.close()
+        else:
+            if cmd_handle.poll() is None:
+                cmd_handle.kill()
+            cmd_handle.stdout.close()
+            cmd_handle.wait()
+    if cmd_handle is not None and commit_count == 0 and \
+            cmd_handle.returncode != 0:
+        logging.info('git log failed with return code %d',
+                     cmd_handle.returncode)
+        git_log = None
+
+    end_time = get_clock()
+    logging.info('Walked %d commits', commit_count)
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return git_log
+
+
+def read_varint(data, position):
+    """Decode a size stored 7 bits per byte, least significant first, as
+    in the pack object headers and deltas
+
+    Arguments:
+        data -- The bytes, a bytearray
+        position -- The position of the first byte
+
+    Returns:
+        A (value, position after the value) tuple
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return (value, position)
+
+
+def apply_delta(base, delta):
+    """Rebuild an object from its delta base and a pack delta
+
+    Arguments:
+        base -- The contents of the base object
+        delta -- The delta instructions
+
+    Returns:
+        The contents of the object
+    """
+    delta = bytearray(delta)
+    (base_size, position) = read_varint(delta, 0)
+    (size, position) = read_varint(delta, position)
+    if base_size != len(base):
+        raise ValueError('Delta base size mismatch')
+
+    # Each instruction either copies a range of the base, whose offset and
+    # size bytes are present as flagged, or inserts the bytes following it
+    output = bytearray()
+    while position < len(delta):
+        opcode = delta[position]
+        position += 1
+        if opcode & 0x80:
+            offset = 0
+            length = 0
+            for shift in range(4):
+                if opcode & (1 << shift):
+                    offset |= delta[position] << (8 * shift)
+                    position += 1
+            for shift in range(3):
+                if opcode & (0x10 << shift):
+                    length |= delta[position] << (8 * shift)
+                    position += 1
+            output += base[offset:offset + (length or 0x10000)]
+        elif opcode:
+            output += delta[position:position + opcode]
+            position += opcode
+        else:
+            raise ValueError('Invalid delta opcode')
+    if len(output) != size:
+        raise ValueError('Delta result size mismatch')
+    return bytes(output)
+
+
+class PackFile(object):
+    """A git pack and its version 2 index, both memory-mapped.  Objects
+    are found with a binary search of the sorted ids of the index."""
+
+    def __init__(self, index_name):
+        """Map the index and the pack
+
+        Arguments:
+            index_name -- The path of the .idx file
+
+        Returns:
+            Nothing
+
+        Raises:
+            ValueError -- The index is not a version 2 index
+        """
+        self.index_name = index_name
+        with open(index_name, 'rb') as index_file:
+            self.index = mmap.mmap(index_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        if self.index[:8] != b'\xfftOc\x00\x00\x00\x02':
+            self.index.close()
+            raise ValueError('Unsupported pack index %s' % index_name)
+        self.fanout = struct.unpack_from('>256I', self.index, 8)
+        self.count = self.fanout[255]
+        self.ids_offset = 8 + 256 * 4
+        self.offsets_offset = self.ids_offset + self.count * 24
+        self.large_offset = self.offsets_offset + self.count * 4
+        with open(index_name[:-4] + '.pack', 'rb') as pack_file:
+            self.pack = mmap.mmap(pack_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+    def close(self):
+        """Release the memory maps"""
+        self.index.close()
+        self.pack.close()
+
+    def object_id(self, position):
+        """Return the binary id of the object at a position of the index"""
+        offset = self.ids_offset + position * 20
+        return self.index[offset:offset + 20]
+
+    def find(self, object_id):
+        """Search the index for an object id
+
+        Arguments:
+            object_id -- The binary object id
+
+        Returns:
+            A (found, position) tuple, the position being where the id is or
+            would be inserted
+        """
+        first = bytearray(object_id[:1])[0]
+        low = self.fanout[first - 1] if first else 0
+        high = self.fanout[first]
+        while low < high:
+            middle = (low + high) // 2
+            if self.object_id(middle) < object_id:
+                low = middle + 1
+            else:
+                high = middle
+        return (low < self.count and self.object_id(low) == object_id, low)
+
+    def offset(self, position):
+        """Return the pack offset of the object at a position of the index"""
+        offset = struct.unpack_from('>I', self.index,
+                                    self.offsets_offset + position * 4)[0]
+        if offset & 0x80000000:
+            offset = struct.unpack_from(
+                '>Q', self.index,
+                self.large_offset + (offset & 0x7fffffff) * 8)[0]
+        return offset
+
+    def inflate(self, position, size):
+        """Inflate the zlib stream of an object
+
+        Arguments:
+            position -- The offset of the stream in the pack
+            size -- The size of the inflated data
+
+        Returns:
+            The inflated data
+        """
+        decompressor = zlib.decompressobj()
+        output = []
+        length = 0
+        chunk = max(size, 4096)
+        while length < size and position < len(self.pack):
+            data = decompressor.decompress(self.pack[position:position +
+                                                     chunk])
+            output.append(data)
+            length += len(data)
+            position += chunk
+        output.append(decompressor.flush())
+        data = b''.join(output)
+        if len(data) != size:
+            raise ValueError('Truncated pack object')
+        return data
+
+    def read_header(self, offset):
+        """Decode the header of the object at a pack offset
+
+        Arguments:
+            offset -- The offset of the object
+
+        Returns:
+            A (type, size, delta base, data offset) tuple.  The delta base
+            is the pack offset of the base of an offset delta, the binary
+            id of the base of a reference delta, and otherwise None.
+        """
+        header = bytearray(self.pack[offset:offset + 32])
+        byte = header[0]
+        object_type = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        position = 1
+        while byte & 0x80:
+            byte = header[position]
+            position += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+        base = None
+        if object_type == 6:
+            byte = header[position]
+            position += 1
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte = header[position]
+                position += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+            base = offset - distance
+        elif object_type == 7:
+            base = self.pack[offset + position:offset + position + 20]
+            position += 20
+        return (object_type, size, base, offset + position)
+
+
+class ObjectStore(object):
+    """Read commits and trees from the loose objects and packs of a
+    repository without starting git.  Formats the reader does not know,
+    such as SHA-256 repositories, replace refs, grafts or settings which
+    change the output of git log, raise ValueError when the store is
+    opened, so that the caller runs git instead."""
+
+    # Names of the object types of the pack headers
+    TYPE_NAMES = {1: b'commit', 2: b'tree', 3: b'blob', 4: b'tag'}
+
+    def __init__(self, git_dir):
+        """Locate the object directories and map the packs
+
+        Arguments:
+            git_dir -- The git directory of the repository
+
+        Returns:
+            Nothing
+
+        Raises:
+            ValueError -- The repository uses an unsupported format
+        """
+        self.git_dir = git_dir
+        self.common_dir = os.environ.get('GIT_COMMON_DIR')
+        if not self.common_dir:
+            self.common_dir = git_dir
+            try:
+                with open(os.path.join(git_dir, 'commondir'), 'r') as common:
+                    self.common_dir = os.path.join(git_dir,
+                                                   common.read().strip())
+            except (IOError, OSError):
+                pass
+        self.check_format()
+
+        # The objects of the alternates are read after the own objects
+        self.object_dirs = [os.path.join(self.common_dir, 'objects')]
+        for object_dir in self.object_dirs:
+            try:
+                with open(os.path.join(object_dir, 'info', 'alternates'),
+                          'r') as alternates:
+                    for line in alternates:
+                        line = line.strip()
+                        if line and not line.startswith('#'):
+                            self.object_dirs.append(
+                                os.path.join(object_dir, line))
+            except (IOError, OSError):
+                pass
+
+        # Shallow clones cut the history at the listed commits
+        self.shallow = set()
+        try:
+            with open(os.path.join(self.common_dir, 'shallow'),
+                      'rb') as shallow:
+                self.shallow = set(binascii.unhexlify(line.strip())
+                                   for line in shallow if line.strip())
+        except (IOError, OSError):
+            pass
+
+        self.packs = []
+        self.pack_names = set()
+        self.load_packs()
+        self.loose_names = {}
+        self.objects = collections.OrderedDict()
+        self.commits = collections.OrderedDict()
+        self.trees = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def check_format(self):
+        """Refuse the repositories whose objects or history git would read
+        differently from this class
+
+        Arguments:
+            None
+
+        Returns:
+            Nothing
+
+        Raises:
+            ValueError -- The repository uses an unsupported format
+        """
+        if os.environ.get('GIT_OBJECT_DIRECTORY') or \
+                os.environ.get('GIT_ALTERNATE_OBJECT_DIRECTORIES') or \
+                os.environ.get('GIT_REPLACE_REF_BASE'):
+            raise ValueError('Object directories set in the environment')
+        if os.path.exists(os.path.join(self.common_dir, 'info', 'grafts')):
+            raise ValueError('Grafts')
+        try:
+            if os.listdir(os.path.join(self.common_dir, 'refs', 'replace')):
+                raise ValueError('Replace refs')
+        except OSError:
+            pass
+        try:
+            with open(os.path.join(self.common_dir, 'packed-refs'),
+                      'rb') as packed:
+                if b' refs/replace/' in packed.read():
+                    raise ValueError('Replace refs')
+        except (IOError, OSError):
+            pass
+
+        # The hash function, the abbreviation of the ids and the following
+        # of renames may be set in any of the configuration files or on the
+        # git command line the hook was started from
+        home = os.path.expanduser('~')
+        config_names = [
+            os.path.join(self.common_dir, 'config'),
+            os.path.join(self.git_dir, 'config.worktree'),
+            os.environ.get('GIT_CONFIG_GLOBAL') or
+            os.path.join(home, '.gitconfig'),
+            os.path.join(os.environ.get('XDG_CONFIG_HOME') or
+                         os.path.join(home, '.config'), 'git', 'config'),
+            os.environ.get('GIT_CONFIG_SYSTEM') or '/etc/gitconfig']
+        settings = [os.environ.get('GIT_CONFIG_PARAMETERS', '')]
+        config_count = int(os.environ.get('GIT_CONFIG_COUNT') or 0)
+        settings += [os.environ.get('GIT_CONFIG_KEY_%d' % number, '')
+                     for number in range(config_count)]
+        for config_name in config_names:
+            try:
+                with open(config_name, 'rb') as config_file:
+                    settings.append(config_file.read().decode('utf-8',
+                                                              'replace'))
+            except (IOError, OSError):
+                pass
+        if re.search(r'(?im)(^|[.\s\'])(abbrev|follow|objectformat|'
+                     r'logoutputencoding)\s*(=|$|\')', '\n'.join(settings)):
+            raise ValueError('Unsupported configuration')
+
+    def load_packs(self):
+        """Map the packs which are not mapped yet
+
+        Arguments:
+            None
+
+        Returns:
+            True if a new pack was found
+        """
+        found = False
+        for object_dir in self.object_dirs:
+            pack_dir = os.path.join(object_dir, 'pack')
+            try:
+                names = sorted(os.listdir(pack_dir))
+            except OSError:
+                continue
+            for name in names:
+                index_name = os.path.join(pack_dir, name)
+                if not name.endswith('.idx') or \
+                        index_name in self.pack_names:
+                    continue
+                try:
+                    self.packs.append(PackFile(index_name=index_name))
+                except (IOError, OSError):
+                    continue
+                self.pack_names.add(index_name)
+                found = True
+        return found
+
+    def close(self):
+        """Release the memory maps of the packs"""
+        for pack in self.packs:
+            pack.close()
+        self.packs = []
+        self.pack_names = set()
+
+    def cache(self, store, key, value):
+        """Keep a value in one of the bounded caches
+
+        Arguments:
+            store -- The cache, an OrderedDict
+            key -- The key of the value
+            value -- The value
+
+        Returns:
+            The value
+        """
+        with self.lock:
+            store[key] = value
+            while len(store) > OBJECT_CACHE_ENTRIES:
+                store.popitem(last=False)
+        return value
+
+    def read_packed(self, pack, offset):
+        """Read an object of a pack, resolving its chain of deltas
+
+        Arguments:
+            pack -- The PackFile holding the object
+            offset -- The offset of the object in the pack
+
+        Returns:
+            A (type, data) tuple
+        """
+        deltas = []
+        while True:
+            key = (pack.index_name, offset)
+            cached = self.objects.get(key)
+            if cached is not None:
+                (object_type, data) = cached
+                break
+            (object_type, size, base, position) = pack.read_header(offset)
+            if object_type in self.TYPE_NAMES:
+                data = pack.inflate(position, size)
+                break
+            if object_type == 6:
+                deltas.append((key, pack.inflate(position, size)))
+                offset = base
+            elif object_type == 7:
+                deltas.append((key, pack.inflate(position, size)))
+                location = self.locate(object_id=base)
+                if location is None:
+                    raise KeyError(binascii.hexlify(base))
+                if location[0] is None:
+                    (object_type, data) = self.read_loose(location[1])
+                    break
+                (pack, offset) = location
+            else:
+                raise ValueError('Unsupported pack object type %d'
+                                 % object_type)
+
+        # The objects of the chain are kept, as the trees and commits of a
+        # history are often deltas of the same bases
+        while deltas:
+            (key, delta) = deltas.pop()
+            data = apply_delta(base=data, delta=delta)
+            if deltas and len(data) <= 1024 * 1024:
+                self.cache(self.objects, key, (object_type, data))
+        return (object_type, data)
+
+    def read_loose(self, file_name):
+        """Read a loose object
+
+        Arguments:
+            file_name -- The path of the object file
+
+        Returns:
+            A (type, data) tuple
+        """
+        with open(file_name, 'rb') as object_file:
+            data = zlib.decompress(object_file.read())
+        (header, data) = data.split(b'\0', 1)
+        (type_name, size) = header.split(b' ')
+        if int(size) != len(data):
+            raise ValueError('Corrupt loose object %s' % file_name)
+        for (object_type, name) in self.TYPE_NAMES.items():
+            if name == type_name:
+                return (object_type, data)
+        raise ValueError('Unsupported loose object type %s' % type_name)
+
+    def loose_path(self, object_dir, object_id):
+        """Build the path of a loose object"""
+        hex_id = binascii.hexlify(object_id).decode('ascii')
+        return os.path.join(object_dir, hex_id[:2], hex_id[2:])
+
+    def locate(self, object_id):
+        """Find where an object is stored
+
+        Arguments:
+            object_id -- The binary object id
+
+        Returns:
+            A (pack, offset) tuple for a packed object, a (None, path)
+            tuple for a loose object or None if the object was not found
+        """
+        for attempt in range(2):
+            for pack in self.packs:
+                (found, position) = pack.find(object_id=object_id)
+                if found:
+                    return (pack, pack.offset(position))
+            for object_dir in self.object_dirs:
+                loose_name = self.loose_path(object_dir, object_id)
+                if os.path.isfile(loose_name):
+                    return (None, loose_name)
+            # A repack may have moved the object to a new pack
+            if attempt or not self.load_packs():
+                return None
+        return None
+
+    def read(self, object_id, expected_type):
+        """Read an object
+
+        Arguments:
+            object_id -- The binary object id
+            expected_type -- The type the object must have, 1 for a commit
+                             and 2 for a tree
+
+        Returns:
+            The contents of the object
+
+        Raises:
+            KeyError -- The object was not found
+            ValueError -- The object can not be read or has another type
+        """
+        location = self.locate(object_id=object_id)
+        if location is None:
+            raise KeyError(binascii.hexlify(object_id))
+        if location[0] is None:
+            (object_type, data) = self.read_loose(location[1])
+        else:
+            (object_type, data) = self.read_packed(*location)
+        if object_type != expected_type:
+            raise ValueError('Object %s is not a %s'
+                             % (binascii.hexlify(object_id),
+                                self.TYPE_NAMES[expected_type]))
+        return data
+
+    def read_commit(self, object_id):
+        """Read the headers of a commit used by git log
+
+        Arguments:
+            object_id -- The binary commit id
+
+        Returns:
+            A dictionary of the tree and parent ids, the author and
+            committer lines and the commit time
+        """
+        commit = self.commits.get(object_id)
+        if commit is not None:
+            return commit
+        data = self.read(object_id=object_id, expected_type=1)
+        commit = {'parents': []}
+        for line in data.split(b'\n\n', 1)[0].split(b'\n'):
+            (name, _, value) = line.partition(b' ')
+            if name == b'tree':
+                commit['tree'] = binascii.unhexlify(value)
+            elif name == b'parent':
+                commit['parents'].append(binascii.unhexlify(value))
+            elif name in (b'author', b'committer', b'encoding'):
+                commit[name.decode('ascii')] = value
+        if commit.get('encoding', b'utf-8').lower() not in (b'utf-8',
+                                                            b'utf8'):
+            raise ValueError('Unsupported commit encoding')
+        if object_id in self.shallow:
+            commit['parents'] = []
+        commit['time'] = int(commit['committer'].rsplit(b' ', 2)[1])
+        return self.cache(self.commits, object_id, commit)
+
+    def read_tree(self, object_id):
+        """Read the entries of a tree
+
+        Arguments:
+            object_id -- The binary tree id
+
+        Returns:
+            A dictionary of the (mode, id) tuple of each entry name
+        """
+        entries = self.trees.get(object_id)
+        if entries is not None:
+            return entries
+        data = self.read(object_id=object_id, expected_type=2)
+        entries = dict((name, (mode, entry_id)) for (mode, name, entry_id)
+                       in TREE_ENTRY_REGEX.findall(data))
+        return self.cache(self.trees, object_id, entries)
+
+    def path_entry(self, chain, path_names, depth):
+        """Look up the entry of a path component in the tree of a commit
+
+        Arguments:
+            chain -- The (mode, id) tuples of the components looked up so
+                     far, starting with the root tree, None for a missing
+                     component.  It is extended as needed.
+            path_names -- The components of the path as bytes
+            depth -- The number of components to look up
+
+        Returns:
+            The (mode, id) tuple of the component, or None if the tree does
+            not hold it
+        """
+        while len(chain) <= depth:
+            entry = chain[-1]
+            if entry is not None and entry[0] == b'40000':
+                entry = self.read_tree(object_id=entry[1]).get(
+                    path_names[len(chain) - 1])
+            else:
+                entry = None
+            chain.append(entry)
+        return chain[depth]
+
+    def last_commit(self, head, file_name):
+        """Find the commit git log -1 -- <file> would show, walking the
+        history in commit date order and following, at a merge, the first
+        parent holding the same version of the file.
+
+        Arguments:
+            head -- The hexadecimal id of the commit to start from
+            file_name -- The path of the file relative to the top level
+
+        Returns:
+            A (commit id, commit) tuple, (None, None) if no commit changed
+            the file
+
+        Raises:
+            ValueError -- The walk visited OBJECT_WALK_LIMIT commits or read
+                          too many commits not in memory
+        """
+        path_names = encode_path(file_name).split(b'/')
+        depth = len(path_names)
+
+        # The path is looked up in each tree only as deep as needed: a
+        # commit holds the same version of the file as its parent as soon
+        # as both hold the same directory along the path
+        chains = {}
+
+        def same_file(commit_id, commit, parent_id, parent):
+            for level in range(depth + 1):
+                entry = self.path_entry(
+                    chain=chains.setdefault(commit_id,
+                                            [(b'40000', commit['tree'])]),
+                    path_names=path_names,
+                    depth=level)
+                parent_entry = self.path_entry(
+                    chain=chains.setdefault(parent_id,
+                                            [(b'40000', parent['tree'])]),
+                    path_names=path_names,
+                    depth=level)
+                if entry == parent_entry:
+                    return True
+                if entry is None or parent_entry is None:
+                    return False
+            return False
+
+        head = binascii.unhexlify(head)
+        commit = self.read_commit(object_id=head)
+        queue = [(-commit['time'], 0, head, commit)]
+        seen = set([head])
+        sequence = 1
+        reads = 0
+        read_limit = max(OBJECT_WALK_READS, len(self.commits))
+        while queue:
+            if sequence > OBJECT_WALK_LIMIT or reads > read_limit:
+                raise ValueError('History walk limit reached')
+            (_, _, commit_id, commit) = heapq.heappop(queue)
+            if not commit['parents']:
+                entry = self.path_entry(
+                    chain=chains.setdefault(commit_id,
+                                            [(b'40000', commit['tree'])]),
+                    path_names=path_names,
+                    depth=depth)
+                if entry is not None:
+                    return (commit_id, commit)
+                continue
+            parents = []
+            for parent_id in commit['parents']:
+                if parent_id not in self.commits:
+                    reads += 1
+                parent = self.read_commit(object_id=parent_id)
+                if same_file(commit_id, commit, parent_id, parent):
+                    parents = [(parent_id, parent)]
+                    break
+                parents.append((parent_id, parent))
+            else:
+                return (commit_id, commit)
+            chains.pop(commit_id, None)
+            for (parent_id, parent) in parents:
+                if parent_id not in seen:
+                    seen.add(parent_id)
+                    heapq.heappush(queue, (-parent['time'], sequence,
+                                           parent_id, parent))
+                    sequence += 1
+        return (None, None)
+
+    def abbreviate(self, object_id):
+        """Abbreviate an object id the way git does by default: at least
+        7 digits, more for large repositories, and as many as needed to
+        tell it apart from every other object
+
+        Arguments:
+            object_id -- The binary object id
+
+        Returns:
+            The abbreviated hexadecimal id
+        """
+        count = sum(pack.count for pack in self.packs)
+        length = max(7, (count.bit_length() + 1) // 2)
+        hex_id = binascii.hexlify(object_id).decode('ascii')
+        neighbours = []
+        for pack in self.packs:
+            (found, position) = pack.find(object_id=object_id)
+            if position > 0:
+                neighbours.append(pack.object_id(position - 1))
+            if position + found < pack.count:
+                neighbours.append(pack.object_id(position + found))
+        for object_dir in self.object_dirs:
+            loose_dir = os.path.join(object_dir, hex_id[:2])
+            names = self.loose_names.get(loose_dir)
+            if names is None:
+                try:
+                    names = os.listdir(loose_dir)
+                except OSError:
+                    names = []
+                self.loose_names[loose_dir] = names
+            neighbours += [binascii.unhexlify(hex_id[:2] + name)
+                           for name in names if len(name) == 38]
+        for neighbour in neighbours:
+            if neighbour == object_id:
+                continue
+            common = 0
+            other = binascii.hexlify(neighbour).decode('ascii')
+            while hex_id[common] == other[common]:
+                common += 1
+            length = max(length, common + 1)
+        return hex_id[:length]
+
+
+def format_commit_date(ident):
+    """Format the time of an author or committer line like git log %ci
+
+    Arguments:
+        ident -- The value of the line, name <email> time zone
+
+    Returns:
+        The date, time and zone of the line
+    """
+    (_, timestamp, zone) = ident.rsplit(b' ', 2)
+    zone = int(zone)
+    minutes = (abs(zone) // 100) * 60 + abs(zone) % 100
+    moment = datetime.datetime(1970, 1, 1) + datetime.timedelta(
+        seconds=int(timestamp) + (minutes if zone >= 0 else -minutes) * 60)
+    return '%s %+05d' % (moment.strftime('%Y-%m-%d %H:%M:%S'), zone)
+
+
+def open_object_store(git_dir):
+    """Open the object store of a repository once per process
+
+    Arguments:
+        git_dir -- The git directory of the repository
+
+    Returns:
+        The ObjectStore, or None if the repository uses a format the store
+        does not read
+    """
+    key = os.path.abspath(git_dir)
+    with OBJECT_STORES_LOCK:
+        if key not in OBJECT_STORES:
+            try:
+                OBJECT_STORES[key] = ObjectStore(git_dir=git_dir)
+            except (IOError, OSError, ValueError) as err:
+                logging.info('Object store not readable: %s', err)
+                OBJECT_STORES[key] = None
+        return OBJECT_STORES[key]
+
+
+# Object stores opened by this process, see open_object_store
+OBJECT_STORES = {}
+OBJECT_STORES_LOCK = threading.Lock()
+
+
+def object_git_log(git_field_log, file_name, git_field_name, cwd=None,
+                   git_dir=None):
+    """Look up the git_log_attributes result of a file by reading the
+    object database in process.
+
+    Arguments:
+        git_field_log -- a list of git log fields to capture
+        file_name -- The full file name to be examined
+        git_field_name -- Name of the attributes fields for the dictionary
+        cwd -- The working tree top level, default of None uses the
+               current directory
+        git_dir -- The git directory, default of None locates it
+
+    Returns:
+        git_log -- List of defined attribute dictionaries, or None if git
+                   log has to be run
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_name: %s', file_name)
+
+    # Path names holding pathspec magic are matched by git
+    git_log = None
+    file_name = str(file_name)
+    if not OBJECT_READER or \
+            set(git_field_log) - set(GIT_FIELD_LOG) or \
+            re.search(r'[*?[\\]|^:|^/|/$', file_name) or \
+            set(file_name.split('/')) & set(['', '.', '..']):
+        end_time = get_clock()
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return None
+    if git_dir is None and cwd is None:
+        git_dir = find_git_dir()
+    elif git_dir is not None and cwd is not None:
+        git_dir = os.path.join(cwd, git_dir)
+    store = None
+    head = None
+    if git_dir is not None:
+        store = open_object_store(git_dir=git_dir)
+        head = read_head_commit(git_dir=git_dir)
+    if store is not None and head is not None:
+        try:
+            (commit_id, commit) = store.last_commit(head=head,
+                                                    file_name=file_name)
+            git_log = []
+            if commit_id is not None:
+                author = commit['author'].decode('utf-8').rsplit(' ', 2)[0]
+                (author_name, _, author_email) = author.partition('<')
+                values = {
+                    '%H': binascii.hexlify(commit_id).decode('ascii'),
+                    '%an': author_name.strip(),
+                    '%ae': author_email.rstrip().rstrip('>'),
+                    '%ci': format_commit_date(commit['committer']),
+                    '%h': store.abbreviate(object_id=commit_id)}
+                row = '\x1f'.join(values[field_log]
+                                  for field_log in git_field_log)
+                git_log = [dict(zip(git_field_name,
+                                    row.strip().split('\x1f')))]
+        except (KeyError, ValueError, IndexError, IOError, OSError,
+                zlib.error, struct.error) as err:
+            logging.info('Falling back to git log for %s: %r',
+                         file_name,
+                         err)
+            git_log = None
+
+    end_time = get_clock()
+    logging.debug('git_log: %s', git_log)
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return git_log
+
+
+def share_history_walk(git_dir, head):
+    """Build the path index of a commit which has none with one walk of
+    the history shared by every filter process that needs it.
+
+    Git starts a filter process for each file it checks out, each for
+    another file, so caching each file on its own shares nothing between
+    them.  The first process creates a lock file, looks up every keyword
+    file of HEAD with batch_git_log and writes the path index, which the
+    later processes read.  The processes of git commands run meanwhile
+    wait for the lock file to go.  An index is written even when the walk
+    fails so that the walk is not repeated for the same commit.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        head -- The commit HEAD points at
+
+    Returns:
+        True if the path index of the commit was built meanwhile, False if
+        it already existed or could not be built
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('head: %s', head)
+
+    if resolve_path_index(git_dir=git_dir,
+                          commit=head,
+                          blocks=read_path_journal(git_dir=git_dir)):
+        return False
+
+    lock_name = keyword_path(git_dir, 'path-index', 'walk.lock')
+    lock_fd = None
+    for _ in range(2):
+        try:
+            lock_fd = os.open(lock_name,
+                              os.O_CREAT | os.O_EXCL | os.O_WRONLY,
+                              0o644)
+            break
+        except OSError as err:
+            if err.errno == errno.ENOENT:
+                try:
+                    os.makedirs(os.path.dirname(lock_name))
+                except OSError:
+                    pass
+                continue
+            if err.errno != errno.EEXIST:
+                logging.info('Unable to lock the history walk',
+                             exc_info=True)
+                return False
+
+        # Wait for the process walking the history
+        while True:
+            try:
+                lock_age = time.time() - os.stat(lock_name).st_mtime
+            except OSError:
+                end_time = get_clock()
+                logging.info('Shared the history walk of %s', head)
+                logging.info('Elapsed time: %f', (end_time - start_time))
+                return True
+            if lock_age > SHARED_WALK_TIMEOUT:
+                break
+            time.sleep(SHARED_WALK_POLL)
+
+        # The walking process is gone, take its lock over
+        logging.info('Removing the stale history walk lock')
+        remove_file(lock_name)
+    if lock_fd is None:
+        return False
+
+    try:
+        os.write(lock_fd, ('%s %d\n' % (head, os.getpid())).encode('ascii'))
+        os.close(lock_fd)
+        git_log = None
+        keyword_files = bootstrap_keyword_presence(git_dir=git_dir)
+        if keyword_files is not None:
+            git_log = batch_git_log(file_names=sorted(keyword_files))
+        write_path_index(git_dir=git_dir, head=head, git_log=git_log or {})
+    except (IOError, OSError):
+        logging.info('Unable to build the path index', exc_info=True)
+    finally:
+        remove_file(lock_name)
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return True
+
+
+def encode_index_entry(file_name, row):
+    """Build the path index line of a file
+
+    Arguments:
+        file_name -- The path relative to the top level
+        row -- The git_log_attributes row of the file, or None when the
+               commit information of the file is unknown
+
+    Returns:
+        The line as bytes
+    """
+    record = b''
+    if row is not None:
+        record = '\x1f'.join(row.get(field_name, '')
+                             for field_name in GIT_FIELD_NAME).encode('utf-8')
+    return escape_index_field(encode_path(file_name)) + b'\t' + \
+        escape_index_field(record) + b'\n'
+
+
+def write_index_node(git_dir, entries):
+    """Store a path index node under the hash of its contents, so that the
+    directories which are the same at several commits share their node
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        entries -- A dictionary of the value of each escaped name
+
+    Returns:
+        The hex SHA-1 of the node contents, None for an empty directory
+    """
+    if not entries:
+        return None
+    records = []
+    record_ids = {}
+    lines = []
+    for name in sorted(entries):
+        value = entries[name]
+        if value[:1] == b'F':
+            record_id = record_ids.get(value)
+            if record_id is None:
+                record_id = record_ids[value] = len(records)
+                records.append(b'\t' + value[1:] + b'\n')
+            value = ('F%d' % record_id).encode('ascii')
+        lines.append(name + b'\t' + value + b'\n')
+    data = b''.join(records + lines)
+    node_hash = hashlib.sha1(data).hexdigest()
+    node_name = index_node_path(git_dir, node_hash)
+    if not os.path.exists(node_name):
+        write_atomic(node_name, data)
+    return node_hash
+
+
+def update_index_node(git_dir, node_hash, changes):
+    """Copy a path index node with changed records.  Only the nodes of the
+    directories holding changed files are written again, the others are
+    shared with the original.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        node_hash -- The node to start from, None for an empty directory
+        changes -- A dictionary of the escaped record of each escaped path
+                   relative to the directory, empty when it is unknown
+
+    Returns:
+        The hex SHA-1 of the new node, None for an empty directory
+    """
+    entries = read_index_node(git_dir=git_dir, node_hash=node_hash)
+    subdirectories = {}
+    for (path, record) in changes.items():
+        (name, separator, rest) = path.partition(b'/')
+        if separator:
+            subdirectories.setdefault(name, {})[rest] = record
+        elif record:
+            entries[name] = b'F' + record
+        else:
+            entries.pop(name, None)
+    for (name, subdirectory_changes) in subdirectories.items():
+        value = entries.pop(name, b'')
+        child_hash = update_index_node(
+            git_dir=git_dir,
+            node_hash=value[1:].decode('ascii') if value[:1] == b'D'
+            else None,
+            changes=subdirectory_changes)
+        if child_hash:
+            entries[name] = b'D' + child_hash.encode('ascii')
+    return write_index_node(git_dir=git_dir, entries=entries)
+
+
+def write_index_root(git_dir, commit, node_hash):
+    """Record the path index node of the top level directory at a commit
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        commit -- The commit id
+        node_hash -- The hex SHA-1 of the node, None for an empty index
+
+    Returns:
+        Nothing
+    """
+    write_atomic(keyword_path(git_dir, 'path-index', 'roots', commit),
+                 (node_hash or '').encode('ascii'))
+
+
+def write_path_index(git_dir, head, git_log):
+    """Add the commit information of files to the path index of a commit
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        head -- The commit HEAD points at
+        git_log -- Dictionary of the git_log_attributes result of each file
+
+    Returns:
+        Nothing
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file count: %d', len(git_log))
+
+    # The files last changed by the same commit share its encoded record
+    changes = {}
+    records = {}
+    for (file_name, rows) in git_log.items():
+        if rows:
+            record = records.get(rows[0]['hash'])
+            if record is None:
+                line = encode_index_entry(file_name='', row=rows[0])
+                record = records[rows[0]['hash']] = line[1:-1]
+            changes[escape_index_field(encode_path(file_name))] = record
+    node_hash = update_index_node(
+        git_dir=git_dir,
+        node_hash=read_index_root(git_dir=git_dir, commit=head),
+        changes=changes)
+    write_index_root(git_dir=git_dir, commit=head, node_hash=node_hash)
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+def compact_path_index(git_dir):
+    """Fold the journal of the path index into index nodes for the commits
+    of its blocks.  The journal is moved aside first so that hooks running
+    meanwhile start a new one.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+
+    Returns:
+        Nothing
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+
+    journal_name = keyword_path(git_dir, 'path-index', 'journal')
+    compact_name = '%s.%d.compact' % (journal_name, os.getpid())
+    try:
+        os.rename(journal_name, compact_name)
+    except OSError:
+        logging.info('The journal is already being compacted')
+        return
+
+    # A block can only be folded once the commit it starts from has a node
+    commit_count = 0
+    try:
+        pending = read_path_journal(git_dir=git_dir,
+                                    journal_name=compact_name)
+        while pending:
+            remaining = []
+            for (before, after, changes) in pending:
+                node_hash = read_index_root(git_dir=git_dir, commit=before)
+                if node_hash is None:
+                    remaining.append((before, after, changes))
+                    continue
+                write_index_root(git_dir=git_dir,
+                                 commit=after,
+                                 node_hash=update_index_node(
+                                     git_dir=git_dir,
+                                     node_hash=node_hash,
+                                     changes=changes))
+                commit_count += 1
+            if len(remaining) == len(pending):
+                break
+            pending = remaining
+    except (IOError, OSError):
+        logging.info('Unable to compact the path index', exc_info=True)
+    finally:
+        remove_file(compact_name)
+
+    end_time = get_clock()
+    logging.info('Compacted %d commits', commit_count)
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+def update_path_index(git_dir):
+    """Extend the path index to the commit HEAD points at by appending the
+    files changed since the nearest indexed commit to its journal.  That
+    commit is searched on the first parent chain of HEAD: the files changed
+    by a commit get its commit information, while the files a merge changed
+    are looked up with a walk of the history.  The other files keep theirs,
+    as git log -- <file> follows the first parent when it is the same in
+    it.  Switching back to
+    a commit which has an index costs nothing.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+
+    Returns:
+        Nothing
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+
+    if git_dir is None:
+        return
+    head = read_head_commit(git_dir=git_dir)
+    try:
+        roots = set(os.listdir(keyword_path(git_dir, 'path-index', 'roots')))
+    except OSError:
+        return
+    blocks = read_path_journal(git_dir=git_dir)
+    indexed = roots.union(block[1] for block in blocks)
+    if head is None or head in indexed:
+        return
+
+    (returncode, cmd_stdout) = run_cmd(
+        cmd=['git',
+             'rev-list',
+             '--first-parent',
+             '--max-count=%d' % PATH_INDEX_SEARCH_DEPTH,
+             head])
+    base = None
+    for commit in cmd_stdout.decode('ascii').split():
+        if commit in indexed:
+            base = commit
+            break
+    if returncode != 0 or base is None:
+        logging.info('No indexed commit found below %s', head)
+        return
+
+    cmd = ['git',
+           'log',
+           '--first-parent',
+           '-m',
+           '--reverse',
+           '--no-renames',
+           '--no-show-signature',
+           '--name-only',
+           '-z',
+           '--format=%x00' + '%x1f'.join(GIT_FIELD_LOG + ['%P']),
+           '%s..%s' % (base, head),
+           '--']
+    (returncode, cmd_stdout) = run_cmd(cmd=cmd)
+    if returncode != 0:
+        return
+
+    # Every commit is an empty field, its fields and its changed files
+    commits = []
+    expect_header = False
+    for field in cmd_stdout.split(b'\0'):
+        if expect_header:
+            commits.append((field, []))
+            expect_header = False
+        elif not field:
+            expect_header = True
+        elif commits:
+            commits[-1][1].append(field[1:] if field[:1] == b'\n' else field)
+
+    rows = {}
+    for (header, file_names) in commits:
+        values = header.decode('utf-8').split('\x1f')
+        row = None
+        if len(values[-1].split()) == 1:
+            row = dict(zip(GIT_FIELD_NAME, values[:-1]))
+        for file_name in file_names:
+            rows[decode_path(file_name)] = row
+
+    # The files changed by a merge may come from either side, they are
+    # looked up with a walk of the history which ends once they are found
+    unknown_files = [file_name for (file_name, row) in rows.items()
+                     if row is None and os.path.lexists(file_name)]
+    if unknown_files:
+        git_log = batch_git_log(file_names=unknown_files, workers=1) or {}
+        for file_name in unknown_files:
+            if git_log.get(file_name):
+                rows[file_name] = git_log[file_name][0]
+
+    changes = dict((file_name, encode_index_entry(file_name=file_name,
+                                                  row=row))
+                   for (file_name, row) in rows.items())
+    append_path_journal(git_dir=git_dir,
+                        before=base,
+                        after=head,
+                        lines=[changes[file_name]
+                               for file_name in sorted(changes)])
+
+    # Keep the journal short so that reading it stays cheap
+    if sum(len(block[2]) for block in blocks) + len(changes) > \
+            PATH_INDEX_JOURNAL_LIMIT:
+        compact_path_index(git_dir=git_dir)
+
+    end_time = get_clock()
+    logging.info('Journaled %d files', len(changes))
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+def collect_path_index(git_dir, budget=None):
+    """Remove the path index of the commits no longer reachable from any
+    ref, such as those left behind by a rebase or an amend, and the nodes
+    no longer used by any commit.  The journal is folded first so that only
+    the index roots refer to commits.  Commits older than the oldest
+    indexed commit are not walked, so a reachable commit whose date is
+    wrong may lose its index, which is rebuilt when it is needed again.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        budget -- Seconds the collection may take, None for no limit
+
+    Returns:
+        A (commits removed, nodes removed) tuple, or None if the budget ran
+        out before the collection was complete
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('budget: %s', budget)
+
+    deadline = None if budget is None else start_time + budget
+    compact_path_index(git_dir=git_dir)
+    roots_dir = keyword_path(git_dir, 'path-index', 'roots')
+    try:
+        commits = [commit for commit in os.listdir(roots_dir)
+                   if '.' not in commit]
+    except OSError:
+        return (0, 0)
+
+    # Commits git no longer has are not listed
+    (returncode, cmd_stdout) = run_cmd(
+        cmd=['git',
+             'log',
+             '--no-walk=unsorted',
+             '--ignore-missing',
+             '--stdin',
+             '--format=%H %ct'],
+        cmd_input='\n'.join(commits).encode('ascii'))
+    if returncode != 0:
+        return None
+    dates = dict(line.split() for line in
+                 cmd_stdout.decode('ascii').splitlines() if ' ' in line)
+
+    # Walk the refs back to the oldest indexed commit, with a day to spare
+    # for clock skew
+    reachable = set()
+    if dates:
+        since = min(int(date) for date in dates.values()) - 86400
+        with open(os.devnull, 'wb') as devnull:
+            cmd_handle = subprocess.Popen(['git',
+                                           'rev-list',
+                                           '--all',
+                                           '--since=%d' % since],
+                                          stdout=subprocess.PIPE,
+                                          stderr=devnull)
+        try:
+            for (line_count, line) in enumerate(cmd_handle.stdout):
+                commit = line.strip().decode('ascii')
+                if commit in dates:
+                    reachable.add(commit)
+                if deadline is not None and line_count % 4096 == 0 and \
+                        get_clock() > deadline:
+                    logging.info('No time left to walk the history')
+                    return None
+        finally:
+            if cmd_handle.poll() is None:
+                cmd_handle.kill()
+            cmd_handle.stdout.close()
+            cmd_handle.wait()
+        if cmd_handle.returncode != 0:
+            return None
+
+    commit_count = 0
+    for commit in commits:
+        if commit not in reachable:
+            remove_file(os.path.join(roots_dir, commit))
+            commit_count += 1
+
+    # Mark the nodes of the remaining commits
+    marked = set()
+    pending = [read_index_root(git_dir=git_dir, commit=commit)
+               for commit in reachable]
+    try:
+        while pending:
+            node_hash = pending.pop()
+            if not node_hash or node_hash in marked:
+                continue
+            marked.add(node_hash)
+            pending.extend(value[1:].decode('ascii') for value in
+                           read_index_node(git_dir=git_dir,
+                                           node_hash=node_hash).values()
+                           if value[:1] == b'D')
+            if deadline is not None and get_clock() > deadline:
+                logging.info('No time left to mark the nodes')
+                return None
+    except (IOError, OSError):
+        logging.info('Unable to read the path index', exc_info=True)
+        return None
+
+    # Nodes written moments ago may belong to a commit being indexed
+    node_count = 0
+    oldest = time.time() - PATH_INDEX_GC_GRACE
+    nodes_dir = keyword_path(git_dir, 'path-index', 'nodes')
+    for (dir_name, _, file_names) in os.walk(nodes_dir):
+        prefix = os.path.basename(dir_name)
+        for file_name in file_names:
+            node_name = os.path.join(dir_name, file_name)
+            try:
+                if prefix + file_name in marked or \
+                        os.stat(node_name).st_mtime > oldest:
+                    continue
+                remove_file(node_name)
+            except OSError:
+                continue
+            node_count += 1
+        if deadline is not None and get_clock() > deadline:
+            logging.info('No time left to remove the nodes')
+            return None
+
+    end_time = get_clock()
+    logging.info('Removed %d commits and %d nodes', commit_count, node_count)
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return (commit_count, node_count)
+
+
+def collect_rewritten_commits(git_dir, commits):
+    """Count the indexed commits a rebase or an amend rewrote, and collect
+    the path index garbage once they make up PATH_INDEX_GC_RATIO of the
+    indexed commits.  The collection is limited to PATH_INDEX_GC_BUDGET
+    seconds and is tried again after the next rewrite when it runs out.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        commits -- The commits which were rewritten
+
+    Returns:
+        Nothing
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('commits: %s', commits)
+
+    if git_dir is None:
+        return
+    try:
+        indexed = set(os.listdir(keyword_path(git_dir, 'path-index',
+                                              'roots')))
+    except OSError:
+        return
+    indexed.update(block[1] for block in read_path_journal(git_dir=git_dir))
+
+    # The count of rewritten commits is kept until the next collection
+    count_name = keyword_path(git_dir, 'path-index', 'rewritten')
+    try:
+        with open(count_name, 'rb') as count_file:
+            count = int(count_file.read().decode('ascii') or '0')
+    except (IOError, OSError, ValueError):
+        count = 0
+    count += len(indexed.intersection(commits))
+    if count and count >= PATH_INDEX_GC_RATIO * len(indexed) and \
+            collect_path_index(git_dir=git_dir,
+                               budget=PATH_INDEX_GC_BUDGET) is not None:
+        count = 0
+    write_atomic(count_name, str(count).encode('ascii'))
+
+    end_time = get_clock()
+    logging.info('Rewritten indexed commits: %d', count)
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+def append_path_journal(git_dir, before, after, lines):
+    """Append a block to the path index journal with a single write, so
+    that the hooks only write the files changed by the new commits
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        before -- The commit the index moves from
+        after -- The commit the index moves to
+        lines -- The path index lines of the files changed in between
+
+    Returns:
+        Nothing
+    """
+    block = b''.join([('B %s %s\n' % (before, after)).encode('ascii')] +
+                     lines +
+                     [('E %s\n' % after).encode('ascii')])
+    journal_name = keyword_path(git_dir, 'path-index', 'journal')
+    try:
+        descriptor = os.open(journal_name,
+                             os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            os.write(descriptor, block)
+        finally:
+            os.close(descriptor)
+    except OSError:
+        logging.info('Unable to append to the path index journal',
+                     exc_info=True)
+
+
+def find_keyword_files(tree='HEAD'):
+    """Find every file of a tree which holds a keyword with a single
+    git grep over the object database.
+
+    Arguments:
+        tree -- The tree-ish to search
+
+    Returns:
+        A list of paths, or None if the search failed
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('tree: %s', tree)
+
+    cmd = ['git',
+           'grep',
+           '-l',
+           '-z',
+           '-I',
+           '-i',
+           '-E',
+           KEYWORD_GREP_PATTERN,
+           tree,
+           '--']
+    (returncode, cmd_stdout) = run_cmd(cmd=cmd)
+
+    # git grep returns 1 when nothing matched
+    if returncode not in (0, 1):
+        end_time = get_clock()
+        logging.error('git grep failed with return code %d', returncode)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return None
+
+    prefix = '%s:' % tree
+    keyword_files = [f[len(prefix):] if f.startswith(prefix) else f
+                     for f in decode_path(cmd_stdout).split('\0') if f]
+
+    end_time = get_clock()
+    logging.info('Found %d keyword files in %s', len(keyword_files), tree)
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return keyword_files
+
+
+def apply_presence_records(data, presence):
+    """Apply presence records, each holding b'1' or b'0' followed by the
+    path and a NUL byte, in order.  A record cut short by an interrupted
+    write is ignored.
+
+    Arguments:
+        data -- The records
+        presence -- Dictionary mapping each path as bytes to True or False,
+                    updated in place
+
+    Returns:
+        Nothing
+    """
+    for record in data.split(b'\0')[:-1]:
+        state = record[:1]
+        if state == b'1':
+            presence[record[1:]] = True
+        elif state == b'0':
+            presence[record[1:]] = False
+
+
+def presence_fold_names(git_dir):
+    """List the journals moved aside by a presence fold, oldest first
+
+    Arguments:
+        git_dir -- The git directory of the repository
+
+    Returns:
+        A list of file names
+    """
+    try:
+        names = [keyword_path(git_dir, name)
+                 for name in os.listdir(keyword_path(git_dir))
+                 if name.startswith('presence-journal.') and
+                 name.endswith('.compact')]
+    except OSError:
+        return []
+    fold_names = []
+    for name in names:
+        try:
+            fold_names.append((get_mtime_ns(os.stat(name)), name))
+        except OSError:
+            pass
+    return [name for (_, name) in sorted(fold_names)]
+
+
+def read_presence_file(file_name, magic=b''):
+    """Read a presence set or journal
+
+    Arguments:
+        file_name -- The file to read
+        magic -- The bytes the file must start with
+
+    Returns:
+        The records of the file, empty if it does not exist or does not
+        start with the magic bytes
+    """
+    try:
+        with open(file_name, 'rb') as presence_file:
+            data = presence_file.read()
+    except (IOError, OSError):
+        return b''
+    if not data.startswith(magic):
+        return b''
+    return data[len(magic):]
+
+
+def read_keyword_presence(git_dir):
+    """Read whether each file held keywords when it last passed through
+    the clean or smudge filter.  The journal is folded into the presence
+    set first when it has grown long.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+
+    Returns:
+        A dictionary mapping the paths as bytes to True or False, files
+        without a record are not held
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+
+    journal_name = keyword_path(git_dir, 'presence-journal')
+    try:
+        journal_size = os.path.getsize(journal_name)
+    except OSError:
+        journal_size = 0
+    if journal_size > PRESENCE_JOURNAL_LIMIT:
+        compact_keyword_presence(git_dir=git_dir)
+
+    # A fold removes the journals it moved aside only once the set holding
+    # them is written, so they are read before the set and applied after it
+    folded = [read_presence_file(name)
+              for name in presence_fold_names(git_dir=git_dir)]
+    presence = {}
+    apply_presence_records(
+        data=read_presence_file(keyword_path(git_dir, 'presence-set'),
+                                magic=PRESENCE_MAGIC),
+        presence=presence)
+    for data in folded:
+        apply_presence_records(data=data, presence=presence)
+    apply_presence_records(data=read_presence_file(journal_name),
+                           presence=presence)
+
+    end_time = get_clock()
+    logging.info('Presence records: %d', len(presence))
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return presence
+
+
+def compact_keyword_presence(git_dir):
+    """Fold the presence journal into the presence set, dropping the paths
+    no longer in the index.  The journal is moved aside first so that the
+    filters running meanwhile start a new one, and a lock file keeps a
+    second fold from writing the set at the same time.  The per-path
+    records of earlier versions are removed as well.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+
+    Returns:
+        The number of paths in the set, or None if it was not written
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+
+    lock_name = keyword_path(git_dir, 'presence-set.lock')
+    try:
+        os.close(os.open(lock_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                         0o666))
+    except OSError as err:
+        # The lock of a fold which was interrupted is removed, the next
+        # fold then takes over its journals
+        try:
+            if err.errno == errno.EEXIST and \
+                    time.time() - os.stat(lock_name).st_mtime > \
+                    PRESENCE_LOCK_STALE:
+                remove_file(lock_name)
+        except OSError:
+            pass
+        end_time = get_clock()
+        logging.info('The presence journal is already being folded')
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return None
+
+    journal_name = keyword_path(git_dir, 'presence-journal')
+    presence = None
+    try:
+        try:
+            os.rename(journal_name,
+                      '%s.%d.compact' % (journal_name, os.getpid()))
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        fold_names = presence_fold_names(git_dir=git_dir)
+        presence = {}
+        apply_presence_records(
+            data=read_presence_file(keyword_path(git_dir, 'presence-set'),
+                                    magic=PRESENCE_MAGIC),
+            presence=presence)
+        for name in fold_names:
+            apply_presence_records(data=read_presence_file(name),
+                                   presence=presence)
+
+        # Without a readable index every path is kept
+        index = read_git_index(git_dir=git_dir)
+        if index is not None:
+            try:
+                tracked = set(index.paths)
+            finally:
+                index.close()
+            presence = dict((path, state)
+                            for (path, state) in presence.items()
+                            if path in tracked)
+
+        write_atomic(keyword_path(git_dir, 'presence-set'),
+                     PRESENCE_MAGIC +
+                     b''.join((b'1' if presence[path] else b'0') +
+                              path + b'\0'
+                              for path in sorted(presence)))
+        for name in fold_names:
+            remove_file(name)
+        shutil.rmtree(keyword_path(git_dir, 'presence'), ignore_errors=True)
+    except (IOError, OSError):
+        logging.info('Unable to fold the presence journal', exc_info=True)
+        presence = None
+    finally:
+        remove_file(lock_name)
+
+    end_time = get_clock()
+    if presence is not None:
+        logging.info('Presence set paths: %d', len(presence))
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return None if presence is None else len(presence)
+
+
+def read_bootstrap_presence(git_dir):
+    """Read the result of the tree wide keyword search
+
+    Arguments:
+        git_dir -- The git directory of the repository
+
+    Returns:
+        A set of the paths holding keywords, or None if no search result
+        has been saved
+    """
+    try:
+        with open(keyword_path(git_dir, 'presence-bootstrap'), 'rb') as data:
+            paths = decode_path(data.read()).split('\0')
+    except (IOError, OSError):
+        return None
+    return set(paths[1:])
+
+
+def bootstrap_keyword_presence(git_dir, tree='HEAD'):
+    """Search a tree for keyword files and save the result for the files
+    that have not yet been through the filters.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        tree -- The tree-ish to search
+
+    Returns:
+        A set of the paths holding keywords, or None if the search failed
+    """
+    keyword_files = find_keyword_files(tree=tree)
+    if keyword_files is None:
+        return None
+
+    # The first field names the searched tree for reference
+    try:
+        write_atomic(keyword_path(git_dir, 'presence-bootstrap'),
+                     encode_path('\0'.join([tree] + keyword_files)))
+    except (IOError, OSError):
+        logging.info('Unable to save the keyword search result',
+                     exc_info=True)
+    return set(keyword_files)
+
+
+def filter_keyword_files(files, git_dir=None):
+    """Drop the files which are known not to hold any keyword.  Files
+    without a presence record are checked against the tree wide keyword
+    search and kept if that is not available either.
+
+    Arguments:
+        files -- list of working tree paths
+        git_dir -- The git directory of the repository
+
+    Returns:
+        The files which hold or may hold keywords, in their original order
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('files: %s', files)
+
+    if git_dir is None:
+        git_dir = find_git_dir()
+    if git_dir is None or not files:
+        return files
+
+    # Files never seen by the filters fall back to the tree wide search
+    # which is run once when no search result exists yet
+    bootstrap = read_bootstrap_presence(git_dir=git_dir)
+    if bootstrap is None:
+        bootstrap = bootstrap_keyword_presence(git_dir=git_dir)
+
+    presence = read_keyword_presence(git_dir=git_dir)
+    keyword_files = []
+    for file_name in files:
+        present = presence.get(encode_path(file_name))
+        if present is None and bootstrap is not None:
+            present = file_name in bootstrap
+        if present is not False:
+            keyword_files.append(file_name)
+
+    end_time = get_clock()
+    logging.info('Keyword files: %d of %d', len(keyword_files), len(files))
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return keyword_files
+
+
+def load_keyword_spans(git_dir, file_name, object_id):
+    """Fetch the recorded keyword spans and the contents of a file if the
+    spans still describe the file in the working tree.
+
+    The record is trusted when it was made for the blob now in the index
+    and the file size and modification time match the values recorded
+    with the spans.  The smudge filter runs before git writes the file, so
+    until the file is first re-expanded its modification time is unknown
+    and the digest of the contents is compared instead.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        file_name -- The working tree path relative to the top level
+        object_id -- The hexadecimal blob id of the file in the index
+
+    Returns:
+        A (contents, spans) tuple holding the bytes of the file and a list
+        of (byte offset, byte length, keyword id) tuples, or None
+    """
+    record = read_offset_index(git_dir, file_name)
+    if record is None:
+        return None
+    (size, mtime_ns, digest, record_id, spans) = record
+
+    # Spans recorded for another blob may cover text the clean filter no
+    # longer takes as a keyword
+    if record_id != object_id:
+        logging.debug('Offset index blob mismatch for %s', file_name)
+        return None
+
+    try:
+        file_stat = os.stat(file_name)
+        if file_stat.st_size != size:
+            logging.debug('Offset index size mismatch for %s', file_name)
+            return None
+        if mtime_ns >= 0 and get_mtime_ns(file_stat) != mtime_ns:
+            logging.debug('Offset index mtime mismatch for %s', file_name)
+            return None
+        with open(file_name, 'rb') as source:
+            data = source.read()
+    except (IOError, OSError):
+        return None
+    if mtime_ns < 0 and hashlib.sha1(data).digest() != digest:
+        logging.debug('Offset index digest mismatch for %s', file_name)
+        return None
+    return (data, spans)
+
+
+def splice_keywords(data, spans, regex_dict, encoding):
+    """Replace the recorded keyword spans of a file with new expansions
+
+    Arguments:
+        data -- The current contents of the file
+        spans -- List of (byte offset, byte length, keyword id) tuples
+        regex_dict -- The substitution values to write
+        encoding -- Text encoding of the file
+
+    Returns:
+        A (new contents, new spans) tuple or None if a span does not
+        hold a keyword
+    """
+    pieces = []
+    new_spans = []
+    position = 0
+    new_position = 0
+    for (offset, length, keyword_id) in spans:
+        if offset < position or keyword_id >= len(KEYWORD_KEYS):
+            return None
+        keyword = data[offset:offset + length]
+        if not keyword.startswith(b'$') or not keyword.endswith(b'$') or \
+                length < 2:
+            return None
+        value = regex_dict[KEYWORD_KEYS[keyword_id]].encode(encoding)
+        pieces.append(data[position:offset])
+        new_position += offset - position
+        pieces.append(value)
+        new_spans.append((new_position, len(value), keyword_id))
+        new_position += len(value)
+        position = offset + length
+    pieces.append(data[position:])
+    return (b''.join(pieces), new_spans)
+
+
+def refresh_file_keywords(file_name, git_dir=None, object_id=None):
+    """Re-expand the keywords of a working tree file in place using the
+    recorded keyword spans rather than scanning the file.
+
+    Arguments:
+        file_name -- The working tree path relative to the top level
+        git_dir -- The git directory of the repository
+        object_id -- The hexadecimal blob id of the file in the index,
+                     None if the file is not in the index
+
+    Returns:
+        True if the file was refreshed, False if the caller must fall back
+        to checking the file out again
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_name: %s', file_name)
+
+    if git_dir is None:
+        git_dir = find_git_dir()
+    if git_dir is None:
+        return False
+
+    loaded = None
+    if object_id is not None:
+        loaded = load_keyword_spans(git_dir=git_dir,
+                                    file_name=file_name,
+                                    object_id=object_id)
+    if not loaded or not loaded[1]:
+        end_time = get_clock()
+        logging.info('No usable offset index for file %s', file_name)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return False
+    (data, spans) = loaded
+
+    # Ask the keyword service first as it keeps the commit information of
+    # recently expanded files
+    regex_dict = daemon_keyword_values(file_name=file_name, git_dir=git_dir)
+    if regex_dict is None:
+        regex_dict = build_regex_dict(git_field_log=GIT_FIELD_LOG,
+                                      file_name=file_name,
+                                      git_field_name=GIT_FIELD_NAME)
+
+    spliced = splice_keywords(data=data,
+                              spans=spans,
+                              regex_dict=regex_dict,
+                              encoding=get_encoding())
+    if spliced is None:
+        end_time = get_clock()
+        logging.info('Offset index does not match file %s', file_name)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        remove_offset_index(git_dir=git_dir, file_name=file_name)
+        return False
+    (new_data, new_spans) = spliced
+
+    # Git keeps the size of the file in the index and takes a file of
+    # another size as modified without running the clean filter, so only
+    # expansions of the same length are rewritten in place.  The others are
+    # checked out again, which also updates the index.
+    if len(new_data) != len(data):
+        end_time = get_clock()
+        logging.info('Expansion length changed for file %s', file_name)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return False
+
+    if new_data != data:
+        replace_file(file_name=file_name, data=new_data)
+    file_stat = os.stat(file_name)
+    write_offset_index(git_dir=git_dir,
+                       file_name=file_name,
+                       spans=new_spans,
+                       size=file_stat.st_size,
+                       digest=hashlib.sha1(new_data).digest(),
+                       object_id=object_id,
+                       mtime_ns=get_mtime_ns(file_stat))
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return True
+
+
+def thread_map(function, tasks, workers=None):
+    """Apply a function to each task on a pool of threads, keeping at most
+    twice as many tasks as threads in progress.
+
+    Arguments:
+        function -- The function called with the arguments of a task
+        tasks -- Sequence of argument tuples
+        workers -- Number of threads, default of None uses one per
+                   processor core
+
+    Returns:
+        A generator of (task, result) tuples in the order of the tasks
+    """
+    pool = None
+    workers = workers or multiprocessing.cpu_count()
+    if len(tasks) > 1 and workers > 1:
+        pool = multiprocessing.pool.ThreadPool(processes=workers)
+
+    pending = collections.deque()
+    window = 2 * workers
+    try:
+        for (position, task) in enumerate(tasks):
+            if pool is None:
+                result = function(*task)
+            else:
+                result = pool.apply_async(function, task)
+            pending.append((task, result))
+            last = position == len(tasks) - 1
+            while pending and (len(pending) >= window or last):
+                (done_task, result) = pending.popleft()
+                if pool is not None:
+                    result = result.get()
+                yield (done_task, result)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def refresh_keywords_parallel(file_names, git_dir=None, workers=None):
+    """Re-expand the keywords of several working tree files in place on a
+    pool of threads, see refresh_file_keywords.
+
+    Arguments:
+        file_names -- The working tree paths relative to the top level
+        git_dir -- The git directory of the repository
+        workers -- Number of threads, default of None uses one per
+                   processor core
+
+    Returns:
+        A generator of (file name, refreshed) tuples in the order of the
+        file names, refreshed is False if the caller must fall back to
+        checking the file out again
+    """
+    if git_dir is None:
+        git_dir = find_git_dir()
+
+    # The spans are only used for the blob the index holds for the file
+    object_ids = {}
+    index = read_git_index(git_dir=git_dir)
+    if index is not None:
+        try:
+            for file_name in file_names:
+                object_ids[file_name] = index.object_id(file_name=file_name)
+        finally:
+            index.close()
+    tasks = [(file_name, git_dir, object_ids.get(file_name))
+             for file_name in file_names]
+    for ((file_name, _, _), refreshed) in thread_map(
+            function=refresh_file_keywords,
+            tasks=tasks,
+            workers=workers):
+        yield (file_name, refreshed)
+
+
+def spool_stream(prefix, stream, min_size, directory=None):
+    """Copy a stream to a temporary file when it is at least min_size bytes
+
+    Arguments:
+        prefix -- Bytes already read from the stream
+        stream -- The binary stream to read the remainder from
+        min_size -- Smallest stream size to spool
+        directory -- Folder to create the file in, default of None uses
+                     the system temporary folder
+
+    Returns:
+        A (data, spool_name) tuple.  The data holds the whole stream and
+        the spool_name is None if the stream is smaller than min_size,
+        otherwise the data is None and the stream was copied to the file
+        spool_name.
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('min_size: %d', min_size)
+
+    chunks = [prefix]
+    size = len(prefix)
+    while size < min_size:
+        chunk = stream.read(min(io.DEFAULT_BUFFER_SIZE * 64, min_size - size))
+        if not chunk:
+            end_time = get_clock()
+            logging.info('Elapsed time: %f', (end_time - start_time))
+            return (b''.join(chunks), None)
+        chunks.append(chunk)
+        size += len(chunk)
+
+    (handle, spool_name) = tempfile.mkstemp(prefix='smudge-',
+                                            dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as spool:
+            for chunk in chunks:
+                spool.write(chunk)
+            chunks = None
+            shutil.copyfileobj(stream, spool, io.DEFAULT_BUFFER_SIZE * 64)
+    except Exception:
+        remove_file(spool_name)
+        raise
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return (None, spool_name)
+
+
+def file_blob_id(file_name):
+    """Calculate the git object id of a blob held in a file without
+    reading the file whole
+
+    Arguments:
+        file_name -- The file holding the contents of the blob
+
+    Returns:
+        The hexadecimal object id
+    """
+    digest = hashlib.sha1(('blob %d' % os.path.getsize(file_name))
+                          .encode('ascii') + b'\0')
+    with open(file_name, 'rb') as source:
+        chunk = source.read(io.DEFAULT_BUFFER_SIZE * 64)
+        while chunk:
+            digest.update(chunk)
+            chunk = source.read(io.DEFAULT_BUFFER_SIZE * 64)
+    return digest.hexdigest()
+
+
+def split_segments(spool_name, segment_size):
+    """Split a file into segments ending at a line boundary
+
+    Arguments:
+        spool_name -- The file to split
+        segment_size -- The approximate size of a segment
+
+    Returns:
+        A list of (start, end) byte offsets
+    """
+    segments = []
+    with open(spool_name, 'rb') as spool:
+        size = os.fstat(spool.fileno()).st_size
+        if size == 0:
+            return segments
+        view = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < size:
+                end = view.find(b'\n', min(start + segment_size, size) - 1)
+                end = size if end < 0 else end + 1
+                segments.append((start, end))
+                start = end
+        finally:
+            view.close()
+    return segments
+
+
+def smudge_data(data, regex_dict, matchers, file_name, input_codec,
+                output_codec):
+    """Expand the keywords of contents held in memory the same way as the
+    smudge filter.
+
+    Arguments:
+        data -- The contents to smudge
+        regex_dict -- The substitution values resolved so far
+        matchers -- The keyword matchers built by smudge_matchers
+        file_name -- The full file name being smudged
+        input_codec -- The (encoding, errors) used to decode the input
+        output_codec -- The (encoding, errors) used to encode the output
+
+    Returns:
+        A (output, regex_dict, spans, line_count) tuple holding the encoded
+        output, the substitution values, the (byte offset, byte length,
+        keyword id) spans and the number of lines
+    """
+    if vector_scan_usable(input_codec=input_codec,
+                          output_codec=output_codec,
+                          size=len(data)):
+        return smudge_buffer(data=data,
+                             regex_dict=regex_dict,
+                             matchers=matchers,
+                             file_name=file_name,
+                             codec=output_codec)
+
+    source = text_stream(io.BytesIO(data),
+                         encoding=input_codec[0],
+                         errors=input_codec[1])
+    output = []
+    spans = []
+    byte_count = 0
+    line_count = 0
+    for line in source:
+        line_count += 1
+        (line, regex_dict, line_spans) = smudge_line(line=line,
+                                                     regex_dict=regex_dict,
+                                                     matchers=matchers,
+                                                     file_name=file_name)
+        encoded = line.encode(output_codec[0], output_codec[1])
+        if line_spans:
+            spans.extend(keyword_byte_spans(line=line,
+                                            encoded=encoded,
+                                            spans=line_spans,
+                                            byte_count=byte_count,
+                                            encoding=output_codec[0],
+                                            errors=output_codec[1]))
+        output.append(encoded)
+        byte_count += len(encoded)
+    output = b''.join(output)
+    return (output, regex_dict, spans, line_count)
+
+
+def smudge_segment(task):
+    """Expand the keywords of a segment of a spooled file.  This is run in
+    the worker processes of smudge_parallel.
+
+    Arguments:
+        task -- A (spool_name, start, end, regex_dict, file_name,
+                input_codec, output_codec) tuple where the codecs are
+                (encoding, errors) tuples
+
+    Returns:
+        A (output, spans, line_count) tuple holding the encoded output, the
+        (byte offset, byte length, keyword id) spans relative to the start
+        of the output and the number of lines of the segment
+    """
+    (spool_name, start, end, regex_dict, file_name,
+     input_codec, output_codec) = task
+    matchers = smudge_matchers()
+
+    with open(spool_name, 'rb') as spool:
+        view = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            data = view[start:end]
+        finally:
+            view.close()
+    (output, _, spans, line_count) = smudge_data(
+        data=data,
+        regex_dict=regex_dict,
+        matchers=matchers,
+        file_name=file_name,
+        input_codec=input_codec,
+        output_codec=output_codec)
+    return (output, spans, line_count)
+
+
+def smudge_parallel(spool_name, regex_dict, file_name, output,
+                    input_codec, output_codec, workers=None):
+    """Expand the keywords of a spooled file on all processor cores.
+
+    The file is split at line boundaries into segments which are expanded
+    by a process pool.  The results are written to the output in file
+    order, with at most two segments per worker in flight.  The segments
+    are expanded in this process if no pool can be started.
+
+    Arguments:
+        spool_name -- The file holding the contents to smudge
+        regex_dict -- The substitution values of every keyword
+        file_name -- The full file name being smudged
+        output -- The binary stream to write the result to
+        input_codec -- The (encoding, errors) used to decode the input
+        output_codec -- The (encoding, errors) used to encode the output
+        workers -- Number of worker processes, default of None uses one
+                   per processor core
+
+    Returns:
+        A (spans, byte_count, line_count, digest) tuple holding the keyword
+        (byte offset, byte length, keyword id) spans, the output size, the
+        number of lines and the SHA-1 digest of the output
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('spool_name: %s', spool_name)
+    logging.debug('file_name: %s', file_name)
+
+    tasks = [(spool_name, start, end, regex_dict, file_name,
+              input_codec, output_codec)
+             for (start, end) in split_segments(
+                 spool_name=spool_name,
+                 segment_size=PARALLEL_SMUDGE_SEGMENT)]
+    logging.debug('Segment count: %d', len(tasks))
+
+    pool = None
+    workers = workers or multiprocessing.cpu_count()
+    if len(tasks) > 1 and workers > 1:
+        try:
+            pool = multiprocessing.Pool(processes=workers)
+        except (ImportError, OSError, NotImplementedError):
+            logging.info('Unable to start a process pool', exc_info=True)
+
+    spans = []
+    byte_count = 0
+    line_count = 0
+    digest = hashlib.sha1()
+    pending = collections.deque()
+    window = 2 * workers
+    try:
+        for task in tasks:
+            if pool is None:
+                pending.append(smudge_segment(task))
+            else:
+                pending.append(pool.apply_async(smudge_segment, (task,)))
+            while pending and (len(pending) >= window or task is tasks[-1]):
+                result = pending.popleft()
+                if pool is not None:
+                    result = result.get()
+                (segment_output, segment_spans, segment_lines) = result
+                output.write(segment_output)
+                digest.update(segment_output)
+                spans.extend((offset + byte_count, length, keyword_id)
+                             for (offset, length, keyword_id)
+                             in segment_spans)
+                byte_count += len(segment_output)
+                line_count += segment_lines
+        if pool is not None:
+            pool.close()
+            pool.join()
+            pool = None
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return (spans, byte_count, line_count, digest.digest())
+
+
+class IndexEntry(object):
+    """The stat data and object id git recorded for a file in the index"""
+
+    __slots__ = ('ctime_ns', 'mtime_ns', 'dev', 'ino', 'mode', 'uid',
+                 'gid', 'size', 'object_id', 'flags')
+
+    def __init__(self, fields):
+        """Store the fields of an index entry
+
+        Arguments:
+            fields -- The values unpacked with GIT_INDEX_ENTRY
+
+        Returns:
+            Nothing
+        """
+        (ctime, ctime_ns, mtime, mtime_ns, self.dev, self.ino, self.mode,
+         self.uid, self.gid, self.size, object_id, self.flags) = fields
+        self.ctime_ns = ctime * 1000000000 + ctime_ns
+        self.mtime_ns = mtime * 1000000000 + mtime_ns
+        self.object_id = binascii.hexlify(object_id).decode('ascii')
+
+    def stage(self):
+        """Return the merge stage of the entry, 0 unless in conflict"""
+        return (self.flags >> 12) & 3
+
+    def matches_stat(self, file_stat):
+        """Check whether the file still has the stat data git recorded.
+        Like git, only the low 32 bits of the inode and size are compared.
+
+        Arguments:
+            file_stat -- The lstat result of the working tree file
+
+        Returns:
+            True if the stat data match
+        """
+        ctime_ns = getattr(file_stat, 'st_ctime_ns', None)
+        if ctime_ns is None:
+            ctime_ns = int(file_stat.st_ctime * 1000000000)
+        return self.mtime_ns == get_mtime_ns(file_stat) and \
+            self.ctime_ns == ctime_ns and \
+            self.size == file_stat.st_size & 0xffffffff and \
+            self.ino == file_stat.st_ino & 0xffffffff and \
+            self.uid == file_stat.st_uid and \
+            self.gid == file_stat.st_gid
+
+
+class GitIndex(object):
+    """The entries of a git index file, read from a memory map without
+    starting git.  Index versions 2 to 4 are supported and the extensions
+    are skipped.  Only the paths are read up front; the fields of an entry
+    are unpacked when it is looked up."""
+
+    def __init__(self, index_file):
+        """Map and scan an index file
+
+        Arguments:
+            index_file -- The index file opened for reading
+
+        Returns:
+            Nothing
+
+        Raises:
+            ValueError -- The file is not an index this class can read,
+                          such as a split index or a SHA-256 repository
+        """
+        index_stat = os.fstat(index_file.fileno())
+        if index_stat.st_size < GIT_INDEX_HEADER.size + 20:
+            raise ValueError('Index file too short')
+        self.mtime_ns = get_mtime_ns(index_stat)
+        self.data = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.matchers = None
+        try:
+            self.scan()
+        except (ValueError, struct.error):
+            self.close()
+            raise
+
+    def scan(self):
+        """Read the path of every entry and check the layout of the file
+
+        Arguments:
+            None
+
+        Returns:
+            Nothing
+        """
+        data = self.data
+        (signature, self.version, count) = \
+            GIT_INDEX_HEADER.unpack_from(data, 0)
+        if signature != b'DIRC' or self.version not in (2, 3, 4):
+            raise ValueError('Unsupported index version')
+
+        # Version 4 stores each path as the number of bytes to drop from the
+        # end of the previous path followed by the bytes to append, while
+        # the earlier versions pad each entry to a multiple of 8 bytes
+        self.offsets = {}
+        self.paths = []
+        offset = GIT_INDEX_HEADER.size
+        path = b''
+        for _ in range(count):
+            flags = struct.unpack_from('>H', data,
+                                       offset + GIT_INDEX_ENTRY.size - 2)[0]
+            position = offset + GIT_INDEX_ENTRY.size
+            if flags & 0x4000:
+                if self.version < 3:
+                    raise ValueError('Extended flags in a version 2 index')
+                position += 2
+            if self.version == 4:
+                byte = ord(data[position:position + 1])
+                position += 1
+                strip = byte & 0x7f
+                while byte & 0x80:
+                    byte = ord(data[position:position + 1])
+                    position += 1
+                    strip = ((strip + 1) << 7) + (byte & 0x7f)
+                name_end = data.find(b'\0', position)
+                if strip > len(path) or name_end < 0:
+                    raise ValueError('Corrupt index path')
+                path = path[:len(path) - strip] + data[position:name_end]
+                next_offset = name_end + 1
+            else:
+                name_end = position + (flags & 0xfff)
+                if flags & 0xfff == 0xfff:
+                    name_end = data.find(b'\0', name_end)
+                    if name_end < 0:
+                        raise ValueError('Corrupt index path')
+                path = data[position:name_end]
+                next_offset = offset + ((name_end - offset + 8) & ~7)
+            # The first of the entries of a conflict is kept, its stage
+            # tells that the file is in conflict
+            if path not in self.offsets:
+                self.offsets[path] = offset
+                self.paths.append(path)
+            offset = next_offset
+
+        # The extensions end at the checksum of the file.  A split index
+        # keeps most of its entries in another file.
+        end = len(data) - 20
+        while offset + GIT_INDEX_EXTENSION.size <= end:
+            (signature, size) = GIT_INDEX_EXTENSION.unpack_from(data, offset)
+            if signature == b'link':
+                raise ValueError('Split index')
+            offset += GIT_INDEX_EXTENSION.size + size
+        if offset != end:
+            raise ValueError('Unexpected index layout')
+
+    def close(self):
+        """Release the memory map of the index file"""
+        self.data.close()
+
+    def entry(self, file_name):
+        """Look up the index entry of a file
+
+        Arguments:
+            file_name -- The path of the file relative to the top level
+
+        Returns:
+            The IndexEntry, or None if the index does not hold the file
+        """
+        offset = self.offsets.get(encode_path(file_name))
+        if offset is None:
+            return None
+        return IndexEntry(fields=GIT_INDEX_ENTRY.unpack_from(self.data,
+                                                             offset))
+
+    def object_id(self, file_name):
+        """Look up the blob id the index holds for a file
+
+        Arguments:
+            file_name -- The path of the file relative to the top level
+
+        Returns:
+            The hexadecimal object id, or None if the index does not hold
+            the file or it is in conflict
+        """
+        entry = self.entry(file_name=file_name)
+        if entry is None or entry.stage() != 0:
+            return None
+        return entry.object_id
+
+    def file_names(self):
+        """List the tracked files in the order of the index
+
+        Arguments:
+            None
+
+        Returns:
+            A list of path names relative to the top level
+        """
+        return [decode_path(path) for path in self.paths]
+
+    def is_unmodified(self, file_name):
+        """Decide whether a file handled by the rcs-keywords filter holds
+        what the index holds for it.
+
+        The stat data settle it when they match and were recorded before
+        the second in which the index was written, or when the size
+        differs.  Otherwise the file is cleaned and its object id compared
+        with the index, as git status would.
+
+        Arguments:
+            file_name -- The path of the file relative to the top level
+
+        Returns:
+            True if the file is unmodified, False if it is modified and
+            None if git has to decide
+        """
+        entry = self.entry(file_name=file_name)
+        if entry is None or entry.stage() != 0:
+            return False
+        try:
+            file_stat = os.lstat(file_name)
+        except OSError:
+            return False
+        if not stat.S_ISREG(file_stat.st_mode) or \
+                not stat.S_ISREG(entry.mode):
+            return None
+
+        # Git reports a file of another size or executable bit as modified
+        # without comparing the contents, unless the size was never recorded
+        if (entry.mode ^ file_stat.st_mode) & stat.S_IXUSR or \
+                (entry.size and
+                 entry.size != file_stat.st_size & 0xffffffff):
+            return False
+        if entry.matches_stat(file_stat=file_stat) and \
+                entry.mtime_ns // 1000000000 < self.mtime_ns // 1000000000:
+            return True
+        if file_stat.st_size > GIT_INDEX_CONTENT_MAX_FILE:
+            return None
+        try:
+            with open(file_name, 'rb') as input_file:
+                data = input_file.read()
+        except (IOError, OSError):
+            return None
+        if blob_id(data) == entry.object_id:
+            return True
+        if self.matchers is None:
+            self.matchers = clean_matchers()
+        codec = (get_encoding(), 'strict')
+        try:
+            (cleaned, _) = clean_data(data=data,
+                                      matchers=self.matchers,
+                                      input_codec=codec,
+                                      output_codec=codec)
+        except UnicodeError:
+            return None
+        if blob_id(cleaned) == entry.object_id:
+            return True
+        return None
+
+    def is_staged(self, file_name, head_tree):
+        """Decide whether a file holds a change added to the index but not
+        committed, which git status reports like a modified file.
+
+        Arguments:
+            file_name -- The path of the file relative to the top level
+            head_tree -- The (store, tree id) tuple of read_head_tree
+
+        Returns:
+            True if the index differs from the tree, False if it matches
+            and None if the tree could not be read
+        """
+        if head_tree is None:
+            return None
+        (store, tree) = head_tree
+        entry = self.entry(file_name=file_name)
+        path_names = encode_path(file_name).split(b'/')
+        try:
+            tree_entry = store.path_entry(chain=[(b'40000', tree)],
+                                          path_names=path_names,
+                                          depth=len(path_names))
+        except (KeyError, ValueError, IndexError, IOError, OSError,
+                zlib.error, struct.error) as err:
+            logging.info('Unable to read the tree of %s: %r', file_name, err)
+            return None
+        if entry is None or tree_entry is None:
+            return True
+        return binascii.hexlify(tree_entry[1]).decode('ascii') != \
+            entry.object_id or int(tree_entry[0], 8) != entry.mode
+
+
+def read_git_index(git_dir=None):
+    """Read the index of the repository, or the one git named in
+    GIT_INDEX_FILE while running a hook.
+
+    Arguments:
+        git_dir -- The git directory, None to locate it
+
+    Returns:
+        The GitIndex, or None if the index could not be read
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+
+    if git_dir is None:
+        git_dir = find_git_dir()
+    index_name = os.environ.get('GIT_INDEX_FILE')
+    if not index_name and git_dir is not None:
+        index_name = os.path.join(git_dir, 'index')
+    index = None
+    if index_name:
+        try:
+            with open(index_name, 'rb') as index_file:
+                index = GitIndex(index_file=index_file)
+        except (IOError, OSError, ValueError) as err:
+            logging.info('Unable to read the index %s: %s', index_name, err)
+
+    end_time = get_clock()
+    if index is not None:
+        logging.info('Index entries: %d', len(index.paths))
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return index
+
+
+def read_head_tree(git_dir):
+    """Locate the tree of the commit HEAD points at, which GitIndex
+    compares the index with.
+
+    Arguments:
+        git_dir -- The git directory of the repository
+
+    Returns:
+        A (store, tree id) tuple of the ObjectStore and the binary tree
+        id, or None if the tree could not be read
+    """
+    store = open_object_store(git_dir=git_dir)
+    head = read_head_commit(git_dir=git_dir)
+    if store is None or head is None:
+        return None
+    try:
+        commit = store.read_commit(object_id=binascii.unhexlify(head))
+    except (KeyError, ValueError, IndexError, TypeError, IOError, OSError,
+            zlib.error, struct.error) as err:
+        logging.info('Unable to read the commit HEAD points at: %r', err)
+        return None
+    return (store, commit['tree'])
+
+
+def list_index_files(git_dir=None):
+    """List the tracked files the way git ls-files does, reading the index
+    without starting git.
+
+    Arguments:
+        git_dir -- The git directory, None to locate it
+
+    Returns:
+        The newline terminated path names as bytes, or None if the index
+        could not be read or git would quote one of the names
+    """
+    index = read_git_index(git_dir=git_dir)
+    if index is None:
+        return None
+    try:
+        if any(re.search(b'[\\x00-\\x1f"\\\\\\x7f-\\xff]', path)
+               for path in index.paths):
+            return None
+        return b''.join(path + b'\n' for path in index.paths)
+    finally:
+        index.close()
+
+
+def parse_status_files(cmd_stdout):
+    """List the files named by git status --porcelain -z
+
+    Arguments:
+        cmd_stdout -- The output of git status
+
+    Returns:
+        A set of file names as bytes
+    """
+
+    # Each entry holds the two status letters, a space and the file name.
+    # Renamed and copied files are followed by their original name.
+    modified_files = set()
+    fields = iter(cmd_stdout.split(b'\0'))
+    for entry in fields:
+        if len(entry) < 4:
+            continue
+        modified_files.add(entry[3:])
+        if b'R' in entry[:2] or b'C' in entry[:2]:
+            modified_files.add(next(fields, b''))
+    return modified_files
+
+
+def find_modified_files(file_names, git_dir=None):
+    """Find which of the files handled by the rcs-keywords filter were
+    modified since they were added to the index, or hold changes added to
+    the index but not committed, as git status reports them.  The index
+    and the tree of HEAD are read in process and git status only runs for
+    the files they leave undecided.
+
+    Arguments:
+        file_names -- The paths of the files relative to the top level
+        git_dir -- The git directory, None to locate it
+
+    Returns:
+        A set of the modified file names, or None if the index could not
+        be read
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_names: %s', file_names)
+
+    index = read_git_index(git_dir=git_dir)
+    if index is None:
+        end_time = get_clock()
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return None
+    if git_dir is None:
+        git_dir = find_git_dir()
+    head_tree = None
+    if git_dir is not None:
+        head_tree = read_head_tree(git_dir=git_dir)
+    modified_files = set()
+    undecided = []
+    try:
+        for file_name in file_names:
+            unmodified = index.is_unmodified(file_name=file_name)
+
+            # A file matching the index is still reported by git status
+            # when its change was added to the index but not committed
+            if unmodified:
+                staged = index.is_staged(file_name=file_name,
+                                         head_tree=head_tree)
+                unmodified = None if staged is None else not staged
+            if unmodified is None:
+                undecided.append(file_name)
+            elif not unmodified:
+                modified_files.add(file_name)
+    finally:
+        index.close()
+
+    if undecided:
+        logging.info('Files left to git status: %d', len(undecided))
+        cmd = ['git',
+               '--literal-pathspecs',
+               'status',
+               '--porcelain',
+               '-z',
+               '--untracked-files=no']
+        if len(undecided) <= GIT_INDEX_STATUS_PATHS:
+            cmd += ['--'] + undecided
+        (returncode, cmd_stdout) = run_cmd(cmd=cmd)
+        if returncode != 0:
+            logging.error('git status failed - keeping the files unchanged')
+            modified_files.update(undecided)
+        else:
+            status_files = parse_status_files(cmd_stdout=cmd_stdout)
+            modified_files.update(
+                file_name for file_name in undecided
+                if encode_path(file_name) in status_files)
+
+    end_time = get_clock()
+    logging.info('Modified files: %d of %d',
+                 len(modified_files),
+                 len(file_names))
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return modified_files
+
+
+def refresh_index_stat(file_names):
+    """Refresh the index stat data of the supplied files with a single
+    git command.
+
+    Arguments:
+        file_names -- The files rewritten by the caller
+
+    Returns:
+        Nothing
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_names: %s', file_names)
+
+    if not REFRESH_INDEX or not file_names:
+        end_time = get_clock()
+        logging.info('No index refresh required')
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return
+
+    # The files kept their size, so git compares their cleaned contents
+    # with the index.  An entry written in the same second as the index is
+    # racily clean and git checks its contents again later on by itself,
+    # so there is no need to wait for the clock.  Only the rewritten paths
+    # are refreshed.  Git releases before 2.25 do not support reading the
+    # pathspec from stdin so the whole index is refreshed instead, which
+    # only rehashes entries with stale stat data.
+    cmd = ['git',
+           '--literal-pathspecs',
+           'add',
+           '--refresh',
+           '--pathspec-from-file=-',
+           '--pathspec-file-nul']
+    pathspec = b'\0'.join(encode_path(file_name)
+                          for file_name in file_names)
+    (returncode, _) = run_cmd(cmd=cmd, cmd_input=pathspec)
+    if returncode == 129:
+        logging.info('Falling back to a full index refresh')
+        run_cmd(cmd=['git', 'update-index', '-q', '--refresh'])
+
+    end_time = get_clock()
+    logging.info('Refreshed index stat data for %d files', len(file_names))
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+def daemon_keyword_values(file_name, git_dir):
+    """Fetch the substitution values of every keyword of a file from the
+    keyword service.
+
+    Arguments:
+        file_name -- The working tree path relative to the top level
+        git_dir -- The git directory of the repository
+
+    Returns:
+        The substitution values or None if the service did not supply them
+    """
+    reply = daemon_request(command='values',
+                           header={'file_name': file_name,
+                                   'git_dir': os.path.abspath(git_dir)})
+    if reply is None:
+        return None
+    return reply[0]['values']
@@ -0,0 +1,502 @@
+#! /usr/bin/env python
+# # -*- coding: utf-8 -*
+
+"""
+rcs-keywords-refresh
+
+This module re-expands the keywords of the files of the working tree,
+for example after the filters have been installed into an existing clone
+whose files were checked out without them.  The commit information of
+all files is looked up with a single walk of the history and the files
+are re-expanded on a pool of threads.  Files which are modified, hold no
+keyword or are already up to date are left alone.  Progress is saved
+below .git/rcs-keywords so that an interrupted run resumes where it
+stopped.
+
+With --gc it only removes the path index of the commits no longer
+reachable from any ref and the keyword presence of the files no longer
+tracked.
+
+Usage: rcs-keywords-refresh.py [--gc | pathspec...]
+"""
+
+import sys
+import os
+import json
+import hashlib
+import logging
+
+import rcs_keywords
+
+__author__ = "David Rotthoff"
+__email__ = "drotthoff@gmail.com"
+__project__ = "git-rcs-keywords"
+__version__ = "1.1.1-19"
+__date__ = "2021-02-07 10:51:24"
+__credits__ = []
+__status__ = "Production"
+
+# LOGGING_CONSOLE_LEVEL = None
+# LOGGING_CONSOLE_LEVEL = logging.DEBUG
+# LOGGING_CONSOLE_LEVEL = logging.INFO
+# LOGGING_CONSOLE_LEVEL = logging.WARNING
+LOGGING_CONSOLE_LEVEL = logging.ERROR
+# LOGGING_CONSOLE_LEVEL = logging.CRITICAL
+# The process id tells apart the records of filters run at the same time
+LOGGING_CONSOLE_MSG_FORMAT = \
+    '%(asctime)s:%(levelname)s:%(process)d:%(module)s:%(funcName)s:' \
+    '%(lineno)s: %(message)s'
+LOGGING_CONSOLE_DATE_FORMAT = '%Y-%m-%d %H.%M.%S'
+
+LOGGING_FILE_LEVEL = None
+# LOGGING_FILE_LEVEL = logging.DEBUG
+# LOGGING_FILE_LEVEL = logging.INFO
+# LOGGING_FILE_LEVEL = logging.WARNING
+# LOGGING_FILE_LEVEL = logging.ERROR
+# LOGGING_FILE_LEVEL = logging.CRITICAL
+LOGGING_FILE_MSG_FORMAT = LOGGING_CONSOLE_MSG_FORMAT
+LOGGING_FILE_DATE_FORMAT = LOGGING_CONSOLE_DATE_FORMAT
+# LOGGING_FILE_NAME = '.git-hook.refresh.log'
+LOGGING_FILE_NAME = '.git-hook.log'
+
+# Conditionally map a time function for performance measurement
+# depending on the version of Python used
+if sys.version_info.major >= 3 and sys.version_info.minor >= 3:
+    from time import perf_counter as get_clock
+else:
+    from time import clock as get_clock
+
+# Number of files re-expanded between two saves of the progress
+CHECKPOINT_FILES = 1000
+
+
+def configure_logging():
+    """Configure the logging service"""
+    # Configure the console logger
+    if LOGGING_CONSOLE_LEVEL:
+        console = logging.StreamHandler()
+        console.setLevel(LOGGING_CONSOLE_LEVEL)
+        console_formatter = logging.Formatter(
+            fmt=LOGGING_CONSOLE_MSG_FORMAT,
+            datefmt=LOGGING_CONSOLE_DATE_FORMAT,
+        )
+        console.setFormatter(console_formatter)
+
+    # Create an file based logger if a LOGGING_FILE_LEVEL is defined.  The
+    # log is shared with the other filters and hooks, so each record is
+    # appended with a single write.
+    if LOGGING_FILE_LEVEL:
+        logging.basicConfig(
+            level=LOGGING_FILE_LEVEL,
+            format=LOGGING_FILE_MSG_FORMAT,
+            datefmt=LOGGING_FILE_DATE_FORMAT,
+            stream=rcs_keywords.AppendLog(LOGGING_FILE_NAME),
+        )
+
+    # Basic logger configuration
+    if LOGGING_CONSOLE_LEVEL or LOGGING_FILE_LEVEL:
+        logger = logging.getLogger('')
+        if LOGGING_CONSOLE_LEVEL:
+            # Add the console logger to default logger
+            logger.addHandler(console)
+
+
+def list_files(pathspec):
+    """Find the tracked files matching the pathspec which may need their
+    keywords expanded.
+
+    Arguments:
+        pathspec -- List of pathspecs, an empty list selects every file
+
+    Returns:
+        A sorted list of paths relative to the top level
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('pathspec: %s', pathspec)
+
+    (returncode, cmd_stdout) = rcs_keywords.run_cmd(
+        cmd=['git', 'ls-files', '-z', '--full-name', '--'] + pathspec)
+    if returncode != 0:
+        logging.error('git ls-files failed -- Exiting.')
+        exit(returncode)
+    files = [rcs_keywords.decode_path(file_name)
+             for file_name in cmd_stdout.split(b'\0') if file_name]
+
+    # The remaining commands work on paths relative to the top level
+    (_, cmd_stdout) = rcs_keywords.run_cmd(
+        cmd=['git', 'rev-parse', '--show-toplevel'])
+    os.chdir(rcs_keywords.decode_path(cmd_stdout.strip()))
+
+    # Only files handled by the rcs-keywords filter which hold keywords in
+    # the commit HEAD points at need to be expanded
+    files = rcs_keywords.filter_managed_files(files=files)
+    keyword_files = rcs_keywords.find_keyword_files(tree='HEAD')
+    if keyword_files is not None:
+        keyword_files = set(keyword_files)
+        files = [f for f in files if f in keyword_files]
+
+    # Files modified by the user are left alone like the hooks do.  They
+    # are compared with the index in process where it can be read.
+    modified_files = rcs_keywords.find_modified_files(file_names=files)
+    if modified_files is None:
+        (_, cmd_stdout) = rcs_keywords.run_cmd(
+            cmd=['git', 'status', '--porcelain', '-z',
+                 '--untracked-files=no'])
+        modified_files = set(
+            rcs_keywords.decode_path(file_name) for file_name in
+            rcs_keywords.parse_status_files(cmd_stdout=cmd_stdout))
+    files = sorted(f for f in files if f not in modified_files)
+
+    end_time = get_clock()
+    logging.info('Files to refresh: %d', len(files))
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return files
+
+
+def read_checkpoint(git_dir, head, pathspec):
+    """Find where an interrupted refresh of the same files stopped
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        head -- The commit HEAD points at
+        pathspec -- List of pathspecs of the refresh
+
+    Returns:
+        The last file refreshed, or None to start from the first file
+    """
+    try:
+        with open(rcs_keywords.keyword_path(git_dir, 'refresh-checkpoint'),
+                  'rb') as checkpoint_file:
+            checkpoint = json.loads(checkpoint_file.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        return None
+    if checkpoint.get('head') != head or \
+            checkpoint.get('pathspec') != pathspec:
+        logging.info('Ignoring the checkpoint of another refresh')
+        return None
+    return checkpoint.get('done')
+
+
+def write_checkpoint(git_dir, head, pathspec, done):
+    """Save the progress of the refresh
+
+    Arguments:
+        git_dir -- The git directory of the repository
+        head -- The commit HEAD points at
+        pathspec -- List of pathspecs of the refresh
+        done -- The last file refreshed, None once the refresh is complete
+
+    Returns:
+        Nothing
+    """
+    checkpoint_name = rcs_keywords.keyword_path(git_dir, 'refresh-checkpoint')
+    if done is None:
+        rcs_keywords.remove_file(checkpoint_name)
+        return
+    rcs_keywords.write_atomic(checkpoint_name,
+                              json.dumps({'head': head,
+                                          'pathspec': pathspec,
+                                          'done': done}).encode('utf-8'))
+
+
+def refresh_file(file_name, git_dir, git_log, matchers):
+    """Expand the keywords of a working tree file with the values of the
+    commit HEAD points at.  The file is only written when they differ.
+
+    Arguments:
+        file_name -- The working tree path relative to the top level
+        git_dir -- The git directory of the repository
+        git_log -- The commit information of the files by file name, the
+                   files it does not hold are looked up on their own
+        matchers -- The (clean, smudge) keyword matchers
+
+    Returns:
+        A (written, written_stat) tuple.  Written is True if the file was
+        written, False if it was up to date or changed while it was
+        expanded and None if it could not be expanded.  Written_stat is
+        the (size, mtime) of the file once written when
+        the clean filter turns it back into the blob in the index, so
+        that adding it only updates the stat data, and None otherwise.
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('file_name: %s', file_name)
+
+    codec = (rcs_keywords.get_encoding(), 'strict')
+    try:
+        with open(file_name, 'rb') as source:
+            source_stat = os.fstat(source.fileno())
+            data = source.read()
+
+        # The cleaned contents are those of the blob in the index, so the
+        # expansion is what a new checkout would write
+        (cleaned, keywords_found) = rcs_keywords.clean_data(
+            data=data,
+            matchers=matchers[0],
+            input_codec=codec,
+            output_codec=codec)
+        if not keywords_found:
+            rcs_keywords.write_keyword_presence(git_dir=git_dir,
+                                                file_name=file_name,
+                                                present=False)
+            return (False, None)
+        regex_dict = rcs_keywords.build_regex_dict(
+            git_field_log=rcs_keywords.GIT_FIELD_LOG,
+            file_name=file_name,
+            git_field_name=rcs_keywords.GIT_FIELD_NAME,
+            git_log=git_log.get(file_name))
+        (output, _, spans, _) = rcs_keywords.smudge_data(
+            data=cleaned,
+            regex_dict=regex_dict,
+            matchers=matchers[1],
+            file_name=file_name,
+            input_codec=codec,
+            output_codec=codec)
+        (restored, _) = rcs_keywords.clean_data(
+            data=output,
+            matchers=matchers[0],
+            input_codec=codec,
+            output_codec=codec)
+
+        # The file is replaced as a whole, unless the user saved it since
+        # it was read
+        if output != data and \
+                not rcs_keywords.replace_file(file_name=file_name,
+                                              data=output,
+                                              source_stat=source_stat):
+            end_time = get_clock()
+            logging.info('File %s changed during the refresh', file_name)
+            logging.info('Elapsed time: %f', (end_time - start_time))
+            return (False, None)
+        file_stat = os.stat(file_name)
+        rcs_keywords.write_offset_index(
+            git_dir=git_dir,
+            file_name=file_name,
+            spans=spans,
+            size=file_stat.st_size,
+            digest=hashlib.sha1(output).digest(),
+            object_id=rcs_keywords.blob_id(cleaned),
+            mtime_ns=rcs_keywords.get_mtime_ns(file_stat))
+        rcs_keywords.write_keyword_presence(git_dir=git_dir,
+                                            file_name=file_name,
+                                            present=bool(spans))
+    except (IOError, OSError, UnicodeError):
+        end_time = get_clock()
+        logging.info('Unable to refresh file %s', file_name, exc_info=True)
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return (None, None)
+
+    written_stat = None
+    if restored == cleaned:
+        written_stat = (file_stat.st_size,
+                        rcs_keywords.get_mtime_ns(file_stat))
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    return (output != data, written_stat)
+
+
+def update_index(files_written):
+    """Record the stat data of the rewritten files in the index.  Their
+    size has changed, which git add --refresh does not accept, so they are
+    added again.  The clean filter turns them back into the same blobs.
+
+    A file saved by the user since the refresh wrote it is left alone, and
+    one saved while git add runs has its index entry put back, so that the
+    edit shows as a change rather than being staged.
+
+    Arguments:
+        files_written -- List of (file name, written_stat) tuples of the
+                         files rewritten by the refresh, see refresh_file
+
+    Returns:
+        Nothing
+    """
+
+    # Display input parameters
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('files_written: %s', files_written)
+
+    file_names = []
+    for (file_name, (size, mtime_ns)) in files_written:
+        try:
+            file_stat = os.lstat(file_name)
+        except OSError:
+            continue
+        if file_stat.st_size == size and \
+                rcs_keywords.get_mtime_ns(file_stat) == mtime_ns:
+            file_names.append(file_name)
+        else:
+            logging.info('File %s changed after the refresh', file_name)
+    if not file_names:
+        end_time = get_clock()
+        logging.info('Elapsed time: %f', (end_time - start_time))
+        return
+
+    # The blobs the files are expected to clean back into
+    index_entries = {}
+    index = rcs_keywords.read_git_index()
+    if index is not None:
+        try:
+            for file_name in file_names:
+                index_entries[file_name] = index.entry(file_name=file_name)
+        finally:
+            index.close()
+
+    # Git releases before 2.25 do not support reading the pathspec from
+    # stdin so the files are passed on the command line instead
+    cmd = ['git',
+           '--literal-pathspecs',
+           'add',
+           '--pathspec-from-file=-',
+           '--pathspec-file-nul']
+    (returncode, _) = rcs_keywords.run_cmd(
+        cmd=cmd,
+        cmd_input=b'\0'.join(rcs_keywords.encode_path(file_name)
+                             for file_name in file_names))
+    if returncode == 129:
+        for position in range(0, len(file_names), 100):
+            rcs_keywords.run_cmd(cmd=['git', '--literal-pathspecs', 'add',
+                                      '--'] +
+                                 file_names[position:position + 100])
+
+    # Put back the index entry of the files added with other contents
+    index = rcs_keywords.read_git_index()
+    if index is not None:
+        index_info = []
+        try:
+            for file_name in file_names:
+                old_entry = index_entries.get(file_name)
+                entry = index.entry(file_name=file_name)
+                if old_entry is not None and entry is not None and \
+                        entry.object_id != old_entry.object_id:
+                    logging.info('Restoring the index entry of %s',
+                                 file_name)
+                    index_info.append(
+                        ('%o %s\t' % (old_entry.mode,
+                                      old_entry.object_id)).encode('ascii') +
+                        rcs_keywords.encode_path(file_name))
+        finally:
+            index.close()
+        if index_info:
+            rcs_keywords.run_cmd(cmd=['git', 'update-index', '-z',
+                                      '--index-info'],
+                                 cmd_input=b'\0'.join(index_info) + b'\0')
+
+    end_time = get_clock()
+    logging.info('Updated the index of %d files', len(file_names))
+    logging.info('Elapsed time: %f', (end_time - start_time))
+
+
+def refresh():
+    """Main program.
+
+    Arguments:
+        argv: command line arguments
+
+    Returns:
+        Nothing
+    """
+
+    # Display the parameters passed on the command line
+    start_time = get_clock()
+    logging.info('Entered function')
+    logging.debug('sys.argv parameters %s', sys.argv)
+
+    # Collect the path index and keyword presence garbage on demand,
+    # without a time limit
+    if sys.argv[1:] == ['--gc']:
+        git_dir = rcs_keywords.find_git_dir()
+        if git_dir is None:
+            logging.error('No git directory found -- Exiting.')
+            exit(1)
+        (commit_count, node_count) = rcs_keywords.collect_path_index(
+            git_dir=git_dir) or (0, 0)
+        sys.stderr.write('Removed the path index of %d commits, %d nodes\n'
+                         % (commit_count, node_count))
+        path_count = rcs_keywords.compact_keyword_presence(git_dir=git_dir)
+        if path_count is not None:
+            sys.stderr.write('Kept the keyword presence of %d files\n'
+                             % path_count)
+        return
+
+    pathspec = sys.argv[1:]
+    files = list_files(pathspec=pathspec)
+    git_dir = rcs_keywords.find_git_dir()
+    if git_dir is None:
+        logging.error('No git directory found -- Exiting.')
+        exit(1)
+    head = rcs_keywords.read_head_commit(git_dir=git_dir)
+
+    # Skip the files refreshed by an interrupted run
+    done = read_checkpoint(git_dir=git_dir, head=head, pathspec=pathspec)
+    if done is not None:
+        files = [f for f in files if f > done]
+        sys.stderr.write('Resuming after %s\n' % done)
+
+    # Without a history walk each file is looked up on its own
+    git_log = rcs_keywords.batch_git_log(file_names=files) or {}
+
+    # Keep the commit information as the path index, which the hooks bring
+    # up to date with each new commit
+    if git_log and head is not None:
+        rcs_keywords.write_path_index(git_dir=git_dir,
+                                      head=head,
+                                      git_log=git_log)
+
+    matchers = (rcs_keywords.clean_matchers(),
+                rcs_keywords.smudge_matchers())
+    tasks = [(file_name, git_dir, git_log, matchers)
+             for file_name in files]
+    counts = {True: 0, False: 0, None: 0}
+    files_written = []
+    for ((file_name, _, _, _), (written, written_stat)) in \
+            rcs_keywords.thread_map(function=refresh_file,
+                                    tasks=tasks,
+                                    workers=rcs_keywords.HOOK_WORKERS):
+        counts[written] += 1
+        if written:
+            if written_stat is not None:
+                files_written.append((file_name, written_stat))
+            sys.stderr.write('Smudged file %s\n' % file_name)
+        elif written is None:
+            sys.stderr.write('Unable to refresh file %s\n' % file_name)
+
+        # Bring the index stat data of the rewritten files up to date
+        # before saving the progress
+        if sum(counts.values()) % CHECKPOINT_FILES == 0:
+            update_index(files_written=files_written)
+            files_written = []
+            write_checkpoint(git_dir=git_dir,
+                             head=head,
+                             pathspec=pathspec,
+                             done=file_name)
+
+    update_index(files_written=files_written)
+    write_checkpoint(git_dir=git_dir, head=head, pathspec=pathspec, done=None)
+    sys.stderr.write('Refreshed %d files, %d up to date, %d failed\n'
+                     % (counts[True], counts[False], counts[None]))
+
+    end_time = get_clock()
+    logging.info('Elapsed time: %f', (end_time - start_time))
+    if counts[None]:
+        exit(1)
+
+
+# Execute the main function
+if __name__ == '__main__':
+    configure_logging()
+
+    START_TIME = get_clock()
+    logging.debug('Entered module')
+
+    refresh()
+
+    END_TIME = get_clock()
+    logging.info('Elapsed time: %f', (END_TIME - START_TIME))